@@ -0,0 +1,203 @@
+# nblm_auto/align.py
+"""
+Notta SRT の時刻を Whisper の時刻に合わせ直す（Notta の時刻ずれがそのまま口パクのずれになるため）。
+- 両方の本文を正規化（NFKC・空白と記号を除去）して文字列にし、Whisper 側は各文字に時刻を割り振る
+  （segments[].words があれば単語の区間、無ければセグメントの区間を文字数で等分）
+- 文字列どうしを帯付き DTW で対応づける: 長さ比で引いた対角線の ±band 文字だけを計算するので O(n·band)。
+  1行ぶんの漸化式は累積和と minimum.accumulate でまとめて解き、Python のループは行数だけ
+- 各キューの先頭・末尾の文字が対応した Whisper 文字の時刻を新しい開始・終了にする。
+  一致率の低いキュー（言い直しや聞き取り違い）は元の時刻のまま
+出力は「話者 N」付きの Notta SRT なので、字幕（normalize_notta_srt）・話者区間・口パクの入力にそのまま使える。
+
+  python -m nblm_auto.align --notta "ep(notta).srt" --whisper data/transcripts/ep.json --out "ep(notta)_aligned.srt"
+"""
+from __future__ import annotations
+import argparse
+import json
+import re
+import time
+import unicodedata
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .speaker_segments import parse_notta_srt
+
+# 正規化で落とす文字（空白・句読点・括弧・記号）
+DROP_RE = re.compile(r"[\s、。，．,.!?！？「」『』（）()\[\]【】・…ー〜~\-—:：;；\"'“”‘’]+")
+BAND = 200
+MIN_MATCH = 0.5
+
+
+def normalize(text: str) -> str:
+    return DROP_RE.sub("", unicodedata.normalize("NFKC", text)).lower()
+
+
+def _codes(s: str) -> np.ndarray:
+    return np.frombuffer(s.encode("utf-32-le"), dtype=np.uint32)
+
+
+def whisper_chars(data: dict) -> Tuple[str, np.ndarray, np.ndarray]:
+    """Whisper JSON → (正規化済み文字列, 各文字の開始秒, 終了秒)"""
+    chars: List[str] = []
+    starts: List[np.ndarray] = []
+    ends: List[np.ndarray] = []
+    for seg in data.get("segments", []):
+        pieces = [(w.get("word", ""), w["start"], w["end"]) for w in seg.get("words") or []
+                  if "start" in w and "end" in w] or [(seg.get("text", ""), seg["start"], seg["end"])]
+        for text, t0, t1 in pieces:
+            s = normalize(text)
+            if not s:
+                continue
+            edges = np.linspace(float(t0), float(t1), len(s) + 1)
+            chars.append(s)
+            starts.append(edges[:-1])
+            ends.append(edges[1:])
+    if not chars:
+        return "", np.zeros(0), np.zeros(0)
+    return "".join(chars), np.concatenate(starts), np.concatenate(ends)
+
+
+def banded_dtw(a: np.ndarray, b: np.ndarray, band: int = BAND) -> np.ndarray:
+    """
+    文字コード列 a（長さ n）と b（長さ m）の DTW パスを shape (k, 2) の (i, j) で返す。
+    コストは不一致なら 1。計算するのは対角線 j ≈ i·(m-1)/(n-1) の ±band だけ。
+    """
+    n, m = len(a), len(b)
+    if n == 0 or m == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+    band = max(band, int(np.ceil(m / n)) + 1)   # 隣の行の窓と必ず重なる幅
+    center = np.arange(n) * ((m - 1) / max(1, n - 1))
+    lo = np.clip(np.floor(center).astype(np.int64) - band, 0, m - 1)
+    hi = np.clip(np.ceil(center).astype(np.int64) + band + 1, 1, m)
+    lo[0], hi[-1] = 0, m
+    D = np.full((n, int((hi - lo).max())), np.inf, dtype=np.float32)
+
+    for i in range(n):
+        l, h = int(lo[i]), int(hi[i])
+        c = (b[l:h] != a[i]).astype(np.float32)
+        if i == 0:
+            E = np.full(h - l, np.inf, dtype=np.float32)
+            E[0] = c[0]
+        else:
+            pl, ph = int(lo[i - 1]), int(hi[i - 1])
+            up = np.full(h - l, np.inf, dtype=np.float32)     # D[i-1, j]
+            diag = np.full(h - l, np.inf, dtype=np.float32)   # D[i-1, j-1]
+            a0, a1 = max(l, pl), min(h, ph)
+            if a1 > a0:
+                up[a0 - l:a1 - l] = D[i - 1, a0 - pl:a1 - pl]
+            d0, d1 = max(l, pl + 1), min(h, ph + 1)
+            if d1 > d0:
+                diag[d0 - l:d1 - l] = D[i - 1, d0 - 1 - pl:d1 - 1 - pl]
+            E = np.minimum(up, diag) + c
+        # 横移動 D[j] = min(E[j], D[j-1] + c[j]) は、累積和 C を使うと C[j] + min_{k<=j}(E[k] - C[k])
+        C = np.cumsum(c)
+        D[i, :h - l] = C + np.minimum.accumulate(E - C)
+
+    def cost(i, j):
+        return D[i, j - lo[i]] if 0 <= i and lo[i] <= j < hi[i] else np.inf
+
+    path = [(n - 1, m - 1)]
+    i, j = n - 1, m - 1
+    while i > 0 or j > 0:
+        # 同点なら斜めを優先
+        i, j = min(((i - 1, j - 1), (i - 1, j), (i, j - 1)), key=lambda p: cost(*p) if p[1] >= 0 else np.inf)
+        path.append((i, j))
+    return np.array(path[::-1], dtype=np.int64)
+
+
+def align_cues(cues: Sequence[dict], data: dict, band: int = BAND,
+               min_match: float = MIN_MATCH) -> Tuple[List[dict], dict]:
+    """
+    parse_notta_srt のキュー（start_ms / end_ms / text / speaker）の時刻を Whisper に合わせた新しいリストと統計を返す。
+    """
+    texts = [normalize(c["text"]) for c in cues]
+    bounds = np.cumsum([0] + [len(t) for t in texts])
+    a = _codes("".join(texts))
+    w_text, w_start, w_end = whisper_chars(data)
+    b = _codes(w_text)
+    path = banded_dtw(a, b, band)
+
+    out: List[dict] = []
+    shifts: List[float] = []
+    kept = 0
+    if len(path):
+        i_idx, j_idx = path[:, 0], path[:, 1]
+        hit = a[i_idx] == b[j_idx]
+        # 文字 i ごとの最初・最後の対応先と、一致した対応があるか
+        first_j = np.full(len(a), -1, dtype=np.int64)
+        first_j[i_idx[::-1]] = j_idx[::-1]
+        last_j = np.full(len(a), -1, dtype=np.int64)
+        last_j[i_idx] = j_idx
+        matched = np.zeros(len(a), dtype=bool)
+        matched[i_idx[hit]] = True
+    for k, cue in enumerate(cues):
+        s, e = int(bounds[k]), int(bounds[k + 1])
+        new = dict(cue)
+        if e > s and len(path) and matched[s:e].mean() >= min_match:
+            t0 = float(w_start[first_j[s]])
+            t1 = float(w_end[last_j[e - 1]])
+            if t1 > t0:
+                new["start_ms"], new["end_ms"] = int(round(t0 * 1000)), int(round(t1 * 1000))
+                shifts.append(t0 - cue["start_ms"] / 1000.0)
+            else:
+                kept += 1
+        else:
+            kept += 1
+        out.append(new)
+    sh = np.abs(np.array(shifts)) if shifts else np.zeros(1)
+    stats = {"cues": len(cues), "aligned": len(shifts), "kept": kept, "notta_chars": len(a),
+             "whisper_chars": len(b), "band": band,
+             "median_shift_sec": round(float(np.median(sh)), 3),
+             "p95_shift_sec": round(float(np.percentile(sh, 95)), 3),
+             "char_match": round(float(matched.mean()), 3) if len(path) and len(a) else 0.0}
+    return out, stats
+
+
+def _srt_time(ms: int) -> str:
+    h, ms = divmod(max(0, int(ms)), 3600000)
+    m, ms = divmod(ms, 60000)
+    s, ms = divmod(ms, 1000)
+    return f"{h:02d}:{m:02d}:{s:02d},{ms:03d}"
+
+
+def write_notta_srt(cues: Sequence[dict], out_path: Path) -> Path:
+    """parse_notta_srt で読み戻せる「話者 N」形式で書く"""
+    blocks = [f"{i}\n話者 {c['speaker']} {_srt_time(c['start_ms'])} --> {_srt_time(c['end_ms'])}\n{c['text']}\n"
+              for i, c in enumerate(cues, 1)]
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out_path.with_name(out_path.name + ".tmp")
+    tmp.write_text("\n".join(blocks), encoding="utf-8")
+    tmp.replace(out_path)
+    return out_path
+
+
+def align_notta(notta_srt: Path, whisper_json: Path, out_path: Path, band: int = BAND,
+                min_match: float = MIN_MATCH) -> Path:
+    t0 = time.perf_counter()
+    cues = parse_notta_srt(notta_srt)
+    data = json.loads(Path(whisper_json).read_text(encoding="utf-8"))
+    aligned, stats = align_cues(cues, data, band, min_match)
+    write_notta_srt(aligned, out_path)
+    print(f"[ALIGN] {out_path}: {stats['aligned']}/{stats['cues']} cues retimed "
+          f"(median shift {stats['median_shift_sec']}s, p95 {stats['p95_shift_sec']}s, "
+          f"char match {stats['char_match']:.0%}, {stats['notta_chars']}x{stats['whisper_chars']} chars, "
+          f"band {stats['band']}) in {time.perf_counter() - t0:.2f}s")
+    return out_path
+
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Retime Notta SRT cues to Whisper timings with banded DTW over characters")
+    ap.add_argument("--notta", required=True, help="「話者 N」付き Notta SRT")
+    ap.add_argument("--whisper", required=True, help="transcription.py が書く Whisper JSON")
+    ap.add_argument("--out", required=True)
+    ap.add_argument("--band", type=int, default=BAND, help="対角線から何文字まで探すか")
+    ap.add_argument("--min-match", type=float, default=MIN_MATCH, help="これ未満の一致率のキューは元の時刻のまま")
+    args = ap.parse_args(argv)
+    align_notta(Path(args.notta), Path(args.whisper), Path(args.out), args.band, args.min_match)
+
+
+if __name__ == "__main__":
+    main()
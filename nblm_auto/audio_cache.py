@@ -0,0 +1,131 @@
+# nblm_auto/audio_cache.py
+"""
+デコード済み音声の共有キャッシュ。
+同じ m4a を Whisper・区間ごとの ffmpeg 切り出し・AudioFileClip・解析ステップがそれぞれデコードしていたので、
+ソース音声ごと・形式ごとに1回だけ int16 PCM にして <cache_dir>/<sha256>-<形式>.npy に置く。
+読むときは np.load(mmap_mode="r") なので、区間の切り出しは配列のビュー（コピーもサブプロセスも無し）。
+  16 kHz モノラル … VAD / RMS 口パク / Rhubarb に渡す区間 WAV / Whisper
+  元のレート・チャンネル数 … render の音声クリップ（mux 用）
+キーは内容の sha256 なので、同じ名前で差し替えた音声に古い PCM が使われることはない。
+置き場所は NBLM_AUDIO_CACHE で変えられる（外部ツールや常駐ワーカーのサブプロセスも同じ場所を見る）。
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import wave
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from .utils import run
+
+CACHE_DIR = Path("data/cache/audio")
+CHUNK_FRAMES = 1 << 20
+
+
+@dataclass
+class DecodedAudio:
+    pcm: np.ndarray   # int16。モノラルは (n,)、それ以外は (n, channels)。読み取り専用の memmap
+    sr: int
+    path: Path        # キャッシュの .npy
+
+    @property
+    def channels(self) -> int:
+        return 1 if self.pcm.ndim == 1 else self.pcm.shape[1]
+
+    @property
+    def duration(self) -> float:
+        return len(self.pcm) / self.sr
+
+    def slice(self, t0: float, t1: float) -> np.ndarray:
+        """[t0, t1) 秒のビュー（コピーしない）"""
+        a = min(len(self.pcm), max(0, int(round(t0 * self.sr))))
+        b = min(len(self.pcm), max(a, int(round(t1 * self.sr))))
+        return self.pcm[a:b]
+
+
+def cache_dir(override: Optional[Path] = None) -> Path:
+    return Path(override or os.environ.get("NBLM_AUDIO_CACHE") or CACHE_DIR)
+
+
+@lru_cache(maxsize=256)
+def _digest(path: str, size: int, mtime_ns: int) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for buf in iter(lambda: f.read(1 << 20), b""):
+            h.update(buf)
+    return h.hexdigest()
+
+
+def source_digest(path: Path) -> str:
+    """内容の sha256（同じプロセス内では (size, mtime) が変わらない限り読み直さない）"""
+    st = Path(path).stat()
+    return _digest(str(Path(path).resolve()), st.st_size, st.st_mtime_ns)
+
+
+def write_wav(dst: Path, pcm: np.ndarray, sr: int) -> Path:
+    """int16 PCM（ビューでも可）をそのまま WAV に書く"""
+    with wave.open(str(dst), "wb") as wf:
+        wf.setnchannels(1 if pcm.ndim == 1 else pcm.shape[1])
+        wf.setsampwidth(2)
+        wf.setframerate(sr)
+        wf.writeframes(np.ascontiguousarray(pcm, dtype=np.int16).tobytes())
+    return Path(dst)
+
+
+def _decode_to_npy(src: Path, npy: Path, sr: Optional[int], mono: bool) -> int:
+    """ffmpeg で一時 WAV に1回だけデコードし、チャンクずつ .npy に写す。実際のサンプルレートを返す"""
+    tmp_wav = npy.with_name(f".{npy.stem}.{os.getpid()}.wav")
+    tmp_npy = npy.with_name(f".{npy.stem}.{os.getpid()}.npy")
+    cmd = ["ffmpeg", "-v", "error", "-y", "-i", str(src), "-vn", "-acodec", "pcm_s16le"]
+    if mono:
+        cmd += ["-ac", "1"]
+    if sr:
+        cmd += ["-ar", str(sr)]
+    try:
+        run(cmd + ["-f", "wav", str(tmp_wav)], label="ffmpeg-decode", echo=False)
+        with wave.open(str(tmp_wav), "rb") as wf:
+            ch, rate, n = wf.getnchannels(), wf.getframerate(), wf.getnframes()
+            shape = (n,) if ch == 1 else (n, ch)
+            out = np.lib.format.open_memmap(tmp_npy, mode="w+", dtype=np.int16, shape=shape)
+            flat = out.reshape(-1)
+            pos = 0
+            while True:
+                buf = np.frombuffer(wf.readframes(CHUNK_FRAMES), dtype=np.int16)
+                if not len(buf):
+                    break
+                flat[pos:pos + len(buf)] = buf
+                pos += len(buf)
+            out.flush()
+            del out, flat
+        # メタデータ → 本体の順に置く（.npy があれば完成している）
+        npy.with_suffix(".json").write_text(
+            json.dumps({"sr": rate, "channels": ch, "frames": n, "source": str(src)}, ensure_ascii=False),
+            encoding="utf-8")
+        os.replace(tmp_npy, npy)
+        return rate
+    finally:
+        tmp_wav.unlink(missing_ok=True)
+        tmp_npy.unlink(missing_ok=True)
+
+
+def decoded(src: Path, sr: Optional[int] = 16000, mono: bool = True,
+            cache: Optional[Path] = None) -> DecodedAudio:
+    """
+    src をデコードした PCM を memmap で返す（初回だけ ffmpeg を1回起動する）。
+    sr=None は元のサンプルレート、mono=False は元のチャンネル数のまま。
+    """
+    src = Path(src)
+    d = cache_dir(cache)
+    d.mkdir(parents=True, exist_ok=True)
+    npy = d / f"{source_digest(src)}-{sr or 'native'}-{'mono' if mono else 'orig'}.npy"
+    meta = npy.with_suffix(".json")
+    if npy.exists() and meta.exists():
+        rate = int(json.loads(meta.read_text(encoding="utf-8"))["sr"])
+    else:
+        rate = _decode_to_npy(src, npy, sr, mono)
+    return DecodedAudio(np.load(npy, mmap_mode="r"), rate, npy)
@@ -0,0 +1,141 @@
+# nblm_auto/batch.py
+"""
+マニフェスト（YAML / JSON）に並べた複数エピソードをワーカープールで一括レンダリングする。
+各ワーカーは起動時に1回だけ MoviePy を読み込み、キャラ画像をデコードしてキャッシュしておく。
+
+マニフェスト例（episodes のみのリストでも可）:
+  defaults:
+    charA: assets/characters/charA
+    charB: assets/characters/charB
+  episodes:
+    - audio: data/ep01/mix.wav
+      srt: data/ep01/final_std.srt
+      lipsyncA: data/ep01/charA.json
+      lipsyncB: data/ep01/charB.json
+      out: out/ep01.mp4
+
+  python -m nblm_auto.batch manifest.yml --workers 2
+"""
+from __future__ import annotations
+import argparse
+import json
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List
+
+import yaml
+
+REQUIRED_KEYS = ("audio", "lipsyncA", "lipsyncB", "out", "charA", "charB")
+
+
+def load_manifest(path: Path) -> List[Dict]:
+    raw = Path(path).read_text(encoding="utf-8")
+    data = json.loads(raw) if Path(path).suffix.lower() == ".json" else yaml.safe_load(raw)
+    defaults: Dict = {}
+    if isinstance(data, dict):
+        defaults = data.get("defaults", {}) or {}
+        data = data.get("episodes", [])
+    episodes = []
+    for i, ep in enumerate(data or [], 1):
+        merged = {**defaults, **ep}
+        missing = [k for k in REQUIRED_KEYS if not merged.get(k)]
+        if missing:
+            raise ValueError(f"episode #{i}: missing keys: {', '.join(missing)}")
+        merged.setdefault("name", Path(merged["out"]).stem)
+        episodes.append(merged)
+    return episodes
+
+
+def _init_worker(char_dirs: List[str]) -> None:
+    # ワーカーごとに1回だけ: MoviePy の import とキャラ画像のデコード
+    from .render import warm_assets
+    warm_assets(Path(d) for d in char_dirs)
+
+
+def render_episode(ep: Dict) -> Dict:
+    """1エピソードを合成して {name, ok, seconds, error} を返す（例外はワーカー内で握る）"""
+    from .lipsync_rhubarb import visemes_to_openclose
+    from .render import render_two_chars_dual
+    t0 = time.perf_counter()
+    try:
+        render_two_chars_dual(
+            audio_path=Path(ep["audio"]),
+            charA_dir=Path(ep["charA"]),
+            charB_dir=Path(ep["charB"]),
+            viseme_timeline_A=visemes_to_openclose(Path(ep["lipsyncA"]), min_dur=0.05),
+            viseme_timeline_B=visemes_to_openclose(Path(ep["lipsyncB"]), min_dur=0.05),
+            out_path=Path(ep["out"]),
+            srt_path=Path(ep["srt"]) if ep.get("srt") else None,
+        )
+        return {"name": ep["name"], "out": ep["out"], "ok": True,
+                "seconds": round(time.perf_counter() - t0, 2), "error": None}
+    except Exception as e:  # noqa: BLE001 - 1本の失敗でバッチ全体を止めない
+        return {"name": ep["name"], "out": ep["out"], "ok": False,
+                "seconds": round(time.perf_counter() - t0, 2),
+                "error": f"{type(e).__name__}: {e}", "traceback": traceback.format_exc()}
+
+
+def run_batch(episodes: List[Dict], workers: int = 2) -> List[Dict]:
+    char_dirs = sorted({ep["charA"] for ep in episodes} | {ep["charB"] for ep in episodes})
+    results: List[Dict] = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(char_dirs,)) as pool:
+        futures = {pool.submit(render_episode, ep): ep for ep in episodes}
+        for fut in as_completed(futures):
+            res = fut.result()
+            status = "OK " if res["ok"] else "NG "
+            print(f"[BATCH] {status} {res['name']}  {res['seconds']:.1f}s" + ("" if res["ok"] else f"  {res['error']}"))
+            results.append(res)
+    order = {ep["name"]: i for i, ep in enumerate(episodes)}
+    results.sort(key=lambda r: order.get(r["name"], 0))
+    return results
+
+
+def print_summary(results: List[Dict], wall: float) -> None:
+    ok = sum(1 for r in results if r["ok"])
+    print("\n=== batch summary ===")
+    for r in results:
+        mark = "OK" if r["ok"] else "NG"
+        print(f"  [{mark}] {r['name']:<24} {r['seconds']:>8.1f}s  {r['out']}" + ("" if r["ok"] else f"\n        {r['error']}"))
+    print(f"  {ok}/{len(results)} succeeded, wall {wall:.1f}s, render total {sum(r['seconds'] for r in results):.1f}s")
+
+
+def dry_run(episodes: List[Dict]) -> bool:
+    """全エピソードの入力を検証する（ワーカーも MoviePy も起動しない）"""
+    from .validate import ValidationReport, check_audio, check_char_dir, check_lipsync, check_srt
+    rep = ValidationReport()
+    for d in sorted({ep["charA"] for ep in episodes} | {ep["charB"] for ep in episodes}):
+        check_char_dir(rep, Path(d))
+    for ep in episodes:
+        dur = check_audio(rep, Path(ep["audio"]))
+        check_lipsync(rep, Path(ep["lipsyncA"]), dur)
+        check_lipsync(rep, Path(ep["lipsyncB"]), dur)
+        if ep.get("srt"):
+            check_srt(rep, Path(ep["srt"]), dur)
+    rep.print()
+    return rep.ok
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Render many episodes from a manifest with warm per-worker assets")
+    ap.add_argument("manifest", help="YAML/JSON マニフェスト")
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--summary", help="結果を JSON で保存するパス")
+    ap.add_argument("--dry-run", action="store_true", help="マニフェストの入力を検証するだけで合成しない")
+    args = ap.parse_args()
+
+    episodes = load_manifest(Path(args.manifest))
+    if args.dry_run:
+        raise SystemExit(0 if dry_run(episodes) else 1)
+    t0 = time.perf_counter()
+    results = run_batch(episodes, workers=args.workers)
+    print_summary(results, time.perf_counter() - t0)
+    if args.summary:
+        Path(args.summary).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    if not all(r["ok"] for r in results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
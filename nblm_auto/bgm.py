@@ -0,0 +1,171 @@
+# nblm_auto/bgm.py
+"""
+BGM をナレーションに混ぜた1本の WAV を作る（render は音声を1ストリーム mux するだけで済む）。
+MoviePy の CompositeAudioClip で混ぜると書き出し中にチャンクごとの Python 評価になるので、ここで NumPy で1回だけ混ぜる。
+- BGM は audio_cache でナレーションと同じレート・チャンネル数に1回だけデコードし、回の長さまでループ（長ければ切る）
+- 発話中だけ BGM を duck_db 下げる。発話の判定は話者区間（Notta SRT）か、無ければナレーションの RMS（vad）
+- ゲインは 10ms フレームの折れ線で、発話の attack 秒前から下げ始め（先読み）、発話後 release 秒かけて戻す。
+  「最寄りの発話フレームまでの距離」を maximum.accumulate で前後から求めるだけなので、ループなしで全編を計算できる
+- 末尾は fade_out 秒でフェードアウト。混ぜる・書くのは CHUNK_SEC ずつ（1時間の回でもメモリは一定）
+
+  python -m nblm_auto.bgm --input data/tts/mix.wav --bgm assets/bgm/loop.mp3 --out data/tts/mix_bgm.wav \\
+      --speakers "ep(notta).srt"
+"""
+from __future__ import annotations
+import argparse
+import os
+import time
+import wave
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from .audio_cache import decoded
+from .vad import FLOOR_DB, frame_energy_db, hysteresis
+
+BGM_DB = -20.0      # BGM の基本レベル
+DUCK_DB = -12.0     # 発話中にさらに下げる量
+ATTACK = 0.15       # 発話の何秒前から下げ始めるか
+RELEASE = 0.6       # 発話後に元へ戻すまでの秒数
+FADE_OUT = 3.0
+HOP_SEC = 0.01
+CHUNK_SEC = 30.0
+
+
+def speech_mask_from_speakers(speakers, n: int, hop_sec: float = HOP_SEC) -> np.ndarray:
+    """話者区間（SpeakerIndex）→ フレームごとの発話中フラグ"""
+    if not n:
+        return np.zeros(0, dtype=bool)
+    return speakers.frame_speakers(1.0 / hop_sec, n) >= 0
+
+
+def speech_mask_from_rms(pcm: np.ndarray, sr: int, n: int, hop_sec: float = HOP_SEC,
+                         on_db: float = -30.0, off_db: float = -40.0) -> np.ndarray:
+    """ナレーションの RMS → 発話中フラグ（しきい値は vad と同じく 95 パーセンタイルからの相対 dB で、FLOOR_DB が下限）"""
+    mono = pcm if pcm.ndim == 1 else pcm[:, 0]
+    energy = frame_energy_db(mono, sr, hop_sec * 1000.0)
+    mask = np.zeros(n, dtype=bool)
+    if energy.size:
+        ref = float(np.percentile(energy, 95))
+        on = hysteresis(energy, max(ref + on_db, FLOOR_DB),
+                        max(ref + off_db, FLOOR_DB + (off_db - on_db)))[:n]
+        mask[:len(on)] = on
+    return mask
+
+
+def _frames_to_speech(mask: np.ndarray, reverse: bool = False) -> np.ndarray:
+    """各フレームから直前（reverse なら直後）の発話フレームまでのフレーム数。発話が無ければ inf"""
+    n = len(mask)
+    m = mask[::-1] if reverse else mask
+    idx = np.where(m, np.arange(n), -1)
+    np.maximum.accumulate(idx, out=idx)
+    dist = np.where(idx >= 0, np.arange(n) - idx, np.inf).astype(np.float64)
+    return dist[::-1] if reverse else dist
+
+
+def duck_envelope(mask: np.ndarray, hop_sec: float = HOP_SEC, duck_db: float = DUCK_DB,
+                  attack: float = ATTACK, release: float = RELEASE) -> np.ndarray:
+    """
+    フレームごとの BGM ゲイン（dB、0 か負）。
+    発話フレームからの距離で決まる三角形（前側 attack 秒・後ろ側 release 秒）の最大値なので、
+    最寄りの発話フレームだけ見れば足りる。
+    """
+    if not len(mask) or not mask.any():
+        return np.zeros(len(mask), dtype=np.float32)
+    before = _frames_to_speech(mask, reverse=True) * hop_sec    # 次の発話まで
+    after = _frames_to_speech(mask) * hop_sec                   # 前の発話から
+    depth = np.maximum(1.0 - before / max(attack, hop_sec), 1.0 - after / max(release, hop_sec))
+    return (duck_db * np.clip(depth, 0.0, 1.0)).astype(np.float32)
+
+
+def _as_channels(x: np.ndarray, ch: int) -> np.ndarray:
+    """(n,) / (n, c) の PCM を (n, ch) にそろえる（モノラルは複製、多い方は平均）"""
+    if x.ndim == 1:
+        x = x[:, None]
+    if x.shape[1] == ch:
+        return x
+    if x.shape[1] == 1:
+        return np.repeat(x, ch, axis=1)
+    return x.mean(axis=1, keepdims=True).repeat(ch, axis=1)
+
+
+def mix_bgm(narration: Path, bgm: Path, out_path: Path, speakers=None,
+            bgm_db: float = BGM_DB, duck_db: float = DUCK_DB, attack: float = ATTACK,
+            release: float = RELEASE, fade_out: float = FADE_OUT) -> Path:
+    """
+    narration に bgm を混ぜた WAV（narration と同じレート・チャンネル数）を out_path に書く。
+    speakers（SpeakerIndex）があれば話者区間で、無ければナレーションの RMS で duck する。
+    """
+    t_start = time.perf_counter()
+    voice = decoded(narration, sr=None, mono=False)
+    sr, n, ch = voice.sr, len(voice.pcm), voice.channels
+    music = decoded(bgm, sr=sr, mono=False)
+    m_len = len(music.pcm)
+    if not m_len:
+        raise ValueError(f"BGM が空です: {bgm}")
+
+    n_hop = int(np.ceil(n / (sr * HOP_SEC)))
+    if speakers is not None and len(speakers):
+        mask, source = speech_mask_from_speakers(speakers, n_hop), "speakers"
+    else:
+        mask, source = speech_mask_from_rms(voice.pcm, sr, n_hop), "rms"
+    env_db = duck_envelope(mask, HOP_SEC, duck_db, attack, release) + np.float32(bgm_db)
+    hop_t = np.arange(n_hop) * HOP_SEC
+
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out_path.with_name(f".{out_path.stem}.{os.getpid()}.wav")
+    step = int(CHUNK_SEC * sr)
+    try:
+        with wave.open(str(tmp), "wb") as wf:
+            wf.setnchannels(ch)
+            wf.setsampwidth(2)
+            wf.setframerate(sr)
+            for a in range(0, n, step):
+                b = min(n, a + step)
+                idx = np.arange(a, b)
+                t = idx / sr
+                gain = 10.0 ** (np.interp(t, hop_t, env_db) / 20.0)
+                if fade_out > 0:
+                    gain *= np.clip((n / sr - t) / fade_out, 0.0, 1.0)
+                # ループは添字の剰余で引く（BGM を回の長さまで複製しない）
+                m = _as_channels(music.pcm[idx % m_len], ch).astype(np.float32)
+                v = _as_channels(voice.pcm[a:b], ch).astype(np.float32)
+                mixed = np.clip(v + m * gain[:, None].astype(np.float32), -32768, 32767).astype(np.int16)
+                wf.writeframes(mixed.tobytes())
+        os.replace(tmp, out_path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    ducked = float(mask.mean()) if len(mask) else 0.0
+    print(f"[BGM] {out_path}: {bgm} x{n / m_len:.1f} loop, {bgm_db:+.0f} dB, duck {duck_db:+.0f} dB "
+          f"by {source} ({ducked:.0%} of {n / sr:.0f}s) in {time.perf_counter() - t_start:.2f}s")
+    return out_path
+
+
+def main(argv: Optional[list] = None):
+    from .speaker_segments import SpeakerIndex
+
+    ap = argparse.ArgumentParser(description="Mix looped BGM under the narration with speech-driven ducking")
+    ap.add_argument("--input", required=True, help="ナレーション音声")
+    ap.add_argument("--bgm", required=True, help="BGM（回の長さまでループ）")
+    ap.add_argument("--out", required=True, help="混ぜた WAV")
+    ap.add_argument("--speakers", help="「話者 N」付き Notta SRT（無ければ RMS で発話を判定）")
+    ap.add_argument("--map", default="1=A,2=B")
+    ap.add_argument("--bgm-db", type=float, default=BGM_DB)
+    ap.add_argument("--duck-db", type=float, default=DUCK_DB)
+    ap.add_argument("--attack", type=float, default=ATTACK)
+    ap.add_argument("--release", type=float, default=RELEASE)
+    ap.add_argument("--fade-out", type=float, default=FADE_OUT)
+    args = ap.parse_args(argv)
+    speakers = None
+    if args.speakers:
+        # 話者の割り当ては問わない（誰かが話していれば duck）
+        labels = sorted({v.split("=")[1].strip().upper() for v in args.map.split(",")})
+        speakers = SpeakerIndex.from_notta(args.speakers, args.map, labels)
+    mix_bgm(Path(args.input), Path(args.bgm), Path(args.out), speakers, args.bgm_db, args.duck_db,
+            args.attack, args.release, args.fade_out)
+
+
+if __name__ == "__main__":
+    main()
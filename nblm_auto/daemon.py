@@ -0,0 +1,397 @@
+# nblm_auto/daemon.py
+"""
+localhost 常駐のレンダリング／リップシンク・デーモン。
+- ワーカープロセスは起動したまま使い回すので、MoviePy の import やキャラ画像のデコードは初回だけ
+- ジョブ状態は <jobs_dir>/<id>.json に原子的に保存。再起動時は queued / running のジョブをキューに戻す
+- 進捗（フレーム数・ETA）はワーカーが <id>.progress.json に書き、キャンセルは <id>.cancel ファイルで伝える
+
+API（JSON）:
+  POST /jobs                {"kind": "render" | "lipsync", "params": {...}}  → {"id": ...}
+  GET  /jobs                ジョブ一覧
+  GET  /jobs/<id>           状態・進捗・最終メトリクス
+  POST /jobs/<id>/cancel    キャンセル（待機中は即時、実行中は次のフレームで中断）
+  GET  /health
+
+  python -m nblm_auto.daemon --port 8765 --workers 2
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .batch import REQUIRED_KEYS
+
+TOOLS_DIR = Path(__file__).resolve().parents[1] / "tools"
+KINDS = ("render", "lipsync")
+ACTIVE = ("queued", "running")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _atomic_write_json(path: Path, data: dict) -> None:
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False, indent=1), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+# ---------------------------------------------------------------------------
+# ワーカープロセス側
+# ---------------------------------------------------------------------------
+
+def _init_worker(char_dirs: tuple = ()) -> None:
+    # 重い import・キャラ画像のデコード・頻出字幕のラスタライズはワーカー起動時に1回だけ。
+    # initializer が例外を出すとプールごと壊れるので、温められなくても警告だけでジョブ側に任せる
+    from .render import WARM_SUBTITLES, warm_assets
+    try:
+        warm_assets([Path(d) for d in char_dirs])
+        warm_assets((), WARM_SUBTITLES)
+    except Exception as e:
+        print(f"[DAEMON] warm-up skipped: {e}", file=sys.stderr)
+
+
+def config_char_dirs(config: Path) -> List[str]:
+    """config.yml の characters.*.dir のうち base.png があるもの（ワーカーの温め用）"""
+    if not config.exists():
+        return []
+    import yaml
+    cfg = yaml.safe_load(config.read_text(encoding="utf-8")) or {}
+    dirs = [c.get("dir") for c in (cfg.get("characters") or {}).values() if isinstance(c, dict)]
+    return [d for d in dirs if d and (Path(d) / "base.png").exists()]
+
+
+class _Progress:
+    """フレーム進捗を一定間隔で progress.json に書き、cancel ファイルがあれば中断する"""
+
+    def __init__(self, jobs_dir: Path, job_id: str, interval: float = 0.5):
+        self.path = jobs_dir / f"{job_id}.progress.json"
+        self.cancel_path = jobs_dir / f"{job_id}.cancel"
+        self.interval = interval
+        self.t0 = time.time()
+        self._last = 0.0
+
+    def __call__(self, done: int, total: int) -> None:
+        now = time.time()
+        if now - self._last < self.interval and done < total:
+            return
+        self._last = now
+        if self.cancel_path.exists():
+            raise JobCancelled("cancelled")
+        elapsed = now - self.t0
+        eta = (elapsed / done * (total - done)) if done and total else None
+        _atomic_write_json(self.path, {
+            "frames_done": done, "frames_total": total,
+            "elapsed_sec": round(elapsed, 2), "eta_sec": round(eta, 1) if eta is not None else None,
+        })
+
+
+def _run_render(params: dict, progress: _Progress) -> dict:
+    from .lipsync_rhubarb import visemes_to_openclose
+    from .render import FPS, render_two_chars_dual
+    frames = {"n": 0}
+
+    def cb(done, total):
+        frames["n"] = done
+        progress(done, total)
+
+    t0 = time.perf_counter()
+    render_two_chars_dual(
+        audio_path=Path(params["audio"]),
+        charA_dir=Path(params["charA"]),
+        charB_dir=Path(params["charB"]),
+        viseme_timeline_A=visemes_to_openclose(Path(params["lipsyncA"]), min_dur=0.05),
+        viseme_timeline_B=visemes_to_openclose(Path(params["lipsyncB"]), min_dur=0.05),
+        out_path=Path(params["out"]),
+        srt_path=Path(params["srt"]) if params.get("srt") else None,
+        progress_cb=cb,
+    )
+    sec = time.perf_counter() - t0
+    return {"seconds": round(sec, 2), "frames": frames["n"], "fps": round(frames["n"] / sec, 2) if sec else None,
+            "video_fps": FPS, "out": params["out"]}
+
+
+def _run_lipsync(params: dict, progress: _Progress) -> dict:
+    # 書き出すキャラ（charX.json の X）。["A", "B", "C"] でも "A,B,C" でもよい
+    labels = params.get("labels") or ["A", "B"]
+    if isinstance(labels, str):
+        labels = labels.split(",")
+    labels = [x.strip().upper() for x in labels if x.strip()]
+    if params.get("engine") == "rms":
+        # 外部バイナリ不要で1秒未満なので、途中では止めずワーカー内で直接実行し、終わった時点でキャンセルを確認する
+        from .lipsync_rms import write_rms_lipsync
+        t0 = time.perf_counter()
+        write_rms_lipsync(Path(params["audio"]), Path(params["srt"]), Path(params.get("outdir", "data/lipsync")),
+                          params.get("map", "1=A,2=B"), speakers=labels)
+        if progress.cancel_path.exists():
+            raise JobCancelled("cancelled")
+        return {"seconds": round(time.perf_counter() - t0, 2), "outdir": params.get("outdir", "data/lipsync"),
+                "engine": "rms"}
+    cmd = [sys.executable, str(TOOLS_DIR / "notta_srt_to_lipsync_with_nhubarb.py"),
+           "--audio", params["audio"], "--srt", params["srt"],
+           "--outdir", params.get("outdir", "data/lipsync"), "--map", params.get("map", "1=A,2=B"),
+           "--labels", ",".join(labels)]
+    if params.get("vad", True):
+        cmd.append("--vad")
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd)
+    while proc.poll() is None:
+        if progress.cancel_path.exists():
+            proc.terminate()
+            proc.wait()
+            raise JobCancelled("cancelled")
+        time.sleep(0.2)
+    if proc.returncode != 0:
+        raise RuntimeError(f"lipsync tool exited with {proc.returncode}")
+    return {"seconds": round(time.perf_counter() - t0, 2), "outdir": params.get("outdir", "data/lipsync")}
+
+
+def run_job(jobs_dir: str, job: dict) -> dict:
+    """ワーカープロセスで1ジョブを実行し、最終メトリクスを返す"""
+    progress = _Progress(Path(jobs_dir), job["id"])
+    if job["kind"] == "render":
+        return _run_render(job["params"], progress)
+    return _run_lipsync(job["params"], progress)
+
+
+# ---------------------------------------------------------------------------
+# デーモン本体
+# ---------------------------------------------------------------------------
+
+class JobManager:
+    def __init__(self, jobs_dir: Path, workers: int = 2, char_dirs: tuple = ()):
+        self.jobs_dir = Path(jobs_dir)
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        self.workers = workers
+        self.char_dirs = tuple(str(d) for d in char_dirs)
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, dict] = {}
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._slots = threading.Semaphore(workers)
+        self._pool = self._new_pool()
+        self._recover()
+        threading.Thread(target=self._dispatch, daemon=True, name="dispatcher").start()
+
+    # ---- 永続化 ----
+    def _path(self, job_id: str) -> Path:
+        return self.jobs_dir / f"{job_id}.json"
+
+    def _save(self, job: dict) -> None:
+        _atomic_write_json(self._path(job["id"]), job)
+
+    def _recover(self) -> None:
+        """前回の状態を読み戻し、未完了ジョブを作成順にキューへ戻す"""
+        jobs = []
+        for p in self.jobs_dir.glob("*.json"):
+            if p.name.endswith(".progress.json"):
+                continue
+            try:
+                jobs.append(json.loads(p.read_text(encoding="utf-8")))
+            except json.JSONDecodeError:
+                continue
+        for job in sorted(jobs, key=lambda j: j.get("created", 0)):
+            self._jobs[job["id"]] = job
+            if job["state"] in ACTIVE:
+                if job["state"] == "running":
+                    job["restarts"] = job.get("restarts", 0) + 1
+                job["state"] = "queued"
+                self._save(job)
+                self._queue.put(job["id"])
+
+    # ---- 操作 ----
+    def submit(self, kind: str, params: dict) -> dict:
+        if kind not in KINDS:
+            raise ValueError(f"unknown kind: {kind} (choices: {', '.join(KINDS)})")
+        required = REQUIRED_KEYS if kind == "render" else ("audio", "srt")
+        missing = [k for k in required if not params.get(k)]
+        if missing:
+            raise ValueError(f"missing params: {', '.join(missing)}")
+        job = {"id": uuid.uuid4().hex[:12], "kind": kind, "params": params, "state": "queued",
+               "created": time.time(), "started": None, "finished": None, "metrics": None, "error": None}
+        with self._lock:
+            self._jobs[job["id"]] = job
+            self._save(job)
+        self._queue.put(job["id"])
+        return job
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            job = dict(job) if job else None
+        if job:
+            prog = self.jobs_dir / f"{job_id}.progress.json"
+            try:
+                job["progress"] = json.loads(prog.read_text(encoding="utf-8"))
+            except (FileNotFoundError, json.JSONDecodeError):
+                job["progress"] = None
+        return job
+
+    def list_jobs(self) -> List[dict]:
+        with self._lock:
+            ids = list(self._jobs)
+        return [self.get(i) for i in ids]
+
+    def cancel(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job["state"] == "queued":
+                job["state"] = "cancelled"
+                job["finished"] = time.time()
+                self._save(job)
+            elif job["state"] == "running":
+                (self.jobs_dir / f"{job_id}.cancel").touch()
+        return self.get(job_id)
+
+    # ---- 実行 ----
+    def _new_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                   initargs=(self.char_dirs,))
+
+    def _submit(self, job: dict):
+        """
+        ワーカープールにジョブを投げる。ワーカーが落ちてプールが壊れていたら作り直して1回だけ投げ直す
+        （落ちた時点で実行中だったジョブは _finish で failed になっている）。
+        """
+        try:
+            return self._pool.submit(run_job, str(self.jobs_dir), job)
+        except BrokenProcessPool:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = self._new_pool()
+            print("[DAEMON] worker pool was broken; restarted", file=sys.stderr)
+            return self._pool.submit(run_job, str(self.jobs_dir), job)
+
+    def _dispatch(self) -> None:
+        while True:
+            job_id = self._queue.get()
+            self._slots.acquire()
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None or job["state"] != "queued":
+                    self._slots.release()
+                    continue
+                job["state"] = "running"
+                job["started"] = time.time()
+                self._save(job)
+            # 再起動で再投入されたジョブは前回の進捗を捨てて数え直す
+            (self.jobs_dir / f"{job_id}.progress.json").unlink(missing_ok=True)
+            try:
+                fut = self._submit(job)
+            except Exception as e:  # noqa: BLE001 - 投げられなかったジョブは failed にして次へ
+                with self._lock:
+                    job["state"] = "failed"
+                    job["finished"] = time.time()
+                    job["error"] = f"{type(e).__name__}: {e}"
+                    self._save(job)
+                self._slots.release()
+                continue
+            fut.add_done_callback(lambda f, jid=job_id: self._finish(jid, f))
+
+    def _finish(self, job_id: str, fut) -> None:
+        try:
+            metrics, error = fut.result(), None
+        except JobCancelled:
+            metrics, error = None, "cancelled"
+        except Exception as e:  # noqa: BLE001 - ジョブの失敗はデーモンを落とさない
+            metrics, error = None, f"{type(e).__name__}: {e}"
+        with self._lock:
+            job = self._jobs[job_id]
+            job["finished"] = time.time()
+            job["metrics"] = metrics
+            job["error"] = None if error == "cancelled" else error
+            job["state"] = "done" if error is None else ("cancelled" if error == "cancelled" else "failed")
+            self._save(job)
+        (self.jobs_dir / f"{job_id}.cancel").unlink(missing_ok=True)
+        self._slots.release()
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _make_handler(manager: JobManager):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send(self, obj, status: int = 200):
+            body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _parts(self):
+            return [p for p in self.path.split("?")[0].split("/") if p]
+
+        def do_GET(self):
+            parts = self._parts()
+            if parts == ["health"]:
+                self._send({"ok": True, "workers": manager.workers})
+            elif parts == ["jobs"]:
+                self._send(manager.list_jobs())
+            elif len(parts) == 2 and parts[0] == "jobs":
+                job = manager.get(parts[1])
+                self._send(job if job else {"error": "not found"}, 200 if job else 404)
+            else:
+                self._send({"error": "not found"}, 404)
+
+        def do_POST(self):
+            parts = self._parts()
+            n = int(self.headers.get("Content-Length") or 0)
+            try:
+                body = json.loads(self.rfile.read(n).decode("utf-8")) if n else {}
+            except json.JSONDecodeError:
+                self._send({"error": "invalid json"}, 400)
+                return
+            if parts == ["jobs"]:
+                try:
+                    job = manager.submit(body.get("kind", "render"), body.get("params", {}))
+                except ValueError as e:
+                    self._send({"error": str(e)}, 400)
+                    return
+                self._send(job, 201)
+            elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "cancel":
+                job = manager.cancel(parts[1])
+                self._send(job if job else {"error": "not found"}, 200 if job else 404)
+            else:
+                self._send({"error": "not found"}, 404)
+
+    return Handler
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Local render/lipsync daemon with a persistent job queue")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--workers", type=int, default=2, help="同時実行ジョブ数")
+    ap.add_argument("--jobs-dir", default="data/jobs")
+    ap.add_argument("--config", default="config.yml", help="ワーカー起動時に温めるキャラ素材（characters.*.dir）")
+    args = ap.parse_args()
+
+    manager = JobManager(Path(args.jobs_dir), workers=args.workers, char_dirs=config_char_dirs(Path(args.config)))
+    httpd = ThreadingHTTPServer((args.host, args.port), _make_handler(manager))
+    print(f"[DAEMON] http://{args.host}:{args.port}  workers={args.workers}  jobs={args.jobs_dir}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        manager.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+# nblm_auto/encode.py
+"""
+合成（MoviePy の get_frame）と ffmpeg へのパイプ書き込みを別スレッドで回す書き出し。
+write_videofile は「1フレーム合成 → パイプに書く（ffmpeg が読むまで待つ）」を1本のスレッドで交互に行うので、
+合成時間とエンコード待ちが足し算になる。ここでは
+  合成スレッド（呼び出し元）… 空きバッファを取り、フレームをコピーして filled キューへ
+  書き込みスレッド          … filled から取り出して ffmpeg の stdin へ書き、バッファを空きに戻す
+とし、両者は事前確保した queue_size 枚のフレームバッファだけを行き来させる（メモリは W*H*3*queue_size で頭打ち）。
+ffmpeg の引数は MoviePy の FFMPEG_VideoWriter に合わせてあり、絵は render_check で一致を確認できる。
+
+progressive（hls / fmp4）を指定すると、出来たところから見られる形で書く:
+  hls  … <out>_hls/index.m3u8 と SEGMENT_SEC 秒ごとの fMP4 セグメント。セグメントが閉じるたびに
+         プレイリストが（一時ファイル経由で）更新されるので、合成中から再生でき、落ちても書けた分は残る。
+         書き終えたら再エンコードなしで out_path の MP4 にまとめる
+  fmp4 … out_path をフラグメント MP4 で書く（moov を先頭に置き、キーフレームごとに moof）。途中で切れても先頭から再生できる
+どちらもキーフレームを SEGMENT_SEC 秒ごとに固定する（セグメント長をそろえ、シークできる位置を一定にする）。
+"""
+from __future__ import annotations
+import os
+import queue
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from .utils import run
+
+
+PROGRESSIVE_MODES = ("hls", "fmp4")
+SEGMENT_SEC = 4.0
+
+
+class EncoderError(RuntimeError):
+    pass
+
+
+def hls_playlist_path(out_path: Path) -> Path:
+    out_path = Path(out_path)
+    return out_path.with_name(out_path.stem + "_hls") / "index.m3u8"
+
+
+def progressive_args(mode: str, out_path: Path, fps: float,
+                     segment_sec: float = SEGMENT_SEC) -> Tuple[Path, List[str]]:
+    """progressive 書き出しの (ffmpeg の出力先, 出力オプション)"""
+    gop = max(1, int(round(fps * segment_sec)))
+    keyframes = ["-g", str(gop), "-keyint_min", str(gop), "-sc_threshold", "0"]
+    if mode == "fmp4":
+        return Path(out_path), keyframes + ["-movflags", "+frag_keyframe+empty_moov+default_base_moof",
+                                            "-f", "mp4"]
+    if mode == "hls":
+        playlist = hls_playlist_path(out_path)
+        return playlist, keyframes + [
+            "-f", "hls", "-hls_time", f"{segment_sec:g}", "-hls_list_size", "0",
+            "-hls_playlist_type", "event", "-hls_segment_type", "fmp4",
+            "-hls_flags", "independent_segments+temp_file",
+            "-hls_segment_filename", str(playlist.parent / "seg_%05d.m4s"),
+        ]
+    raise ValueError(f"unknown progressive mode: {mode}")
+
+
+def hls_to_mp4(playlist: Path, out_path: Path) -> Path:
+    """書き終えた HLS を再エンコードなしで1本の MP4 にまとめる"""
+    tmp = Path(out_path).with_name(Path(out_path).stem + ".TEMP_remux" + Path(out_path).suffix)
+    try:
+        run(["ffmpeg", "-v", "error", "-y", "-i", str(playlist), "-c", "copy", "-movflags", "+faststart",
+             str(tmp)], label="ffmpeg-hls-remux", echo=False)
+        os.replace(tmp, out_path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return Path(out_path)
+
+
+class FramePipeWriter:
+    """rgb24 フレームを ffmpeg に流す。バッファは acquire() で借りて submit() で返す"""
+
+    def __init__(self, out_path: Path, size: Tuple[int, int], fps: float, audio_path: Optional[Path] = None,
+                 codec: str = "libx264", preset: str = "faster", threads: Optional[int] = 4,
+                 audio_codec: str = "aac", queue_size: int = 8, extra_args: Optional[List[str]] = None):
+        w, h = size
+        self.out_path = Path(out_path)
+        self.out_path.parent.mkdir(parents=True, exist_ok=True)
+        cmd = ["ffmpeg", "-y", "-loglevel", "error",
+               "-f", "rawvideo", "-vcodec", "rawvideo", "-s", f"{w}x{h}", "-pix_fmt", "rgb24",
+               "-r", f"{fps:.02f}", "-an", "-i", "-"]
+        if audio_path is not None:
+            cmd += ["-i", str(audio_path), "-map", "0:v", "-map", "1:a", "-acodec", audio_codec,
+                    "-ar", "44100", "-ac", "2"]
+        cmd += ["-vcodec", codec, "-preset", preset]
+        if threads is not None:
+            cmd += ["-threads", str(threads)]
+        if codec == "libx264" and w % 2 == 0 and h % 2 == 0:
+            cmd += ["-pix_fmt", "yuv420p"]
+        cmd += list(extra_args or []) + [str(self.out_path)]
+
+        log_dir = os.environ.get("NBLM_RUN_LOG_DIR")
+        self._log = (open(Path(log_dir) / f"{os.getpid()}-encode-{self.out_path.stem}.err", "w+b") if log_dir
+                     else tempfile.TemporaryFile())
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=self._log)
+
+        self._free: "queue.Queue[np.ndarray]" = queue.Queue()
+        for _ in range(max(2, queue_size)):
+            self._free.put(np.empty((h, w, 3), dtype=np.uint8))
+        self._filled: "queue.Queue[Optional[np.ndarray]]" = queue.Queue(maxsize=max(2, queue_size))
+        self.error: Optional[BaseException] = None
+        self.frames = 0
+        self.write_sec = 0.0   # 書き込みスレッドがパイプ書き込みに費やした時間
+        self.wait_sec = 0.0    # 合成スレッドが空きバッファ待ちで止まった時間
+        self._thread = threading.Thread(target=self._consume, name="ffmpeg-writer", daemon=True)
+        self._thread.start()
+
+    def _consume(self) -> None:
+        while True:
+            buf = self._filled.get()
+            if buf is None:
+                return
+            if self.error is None:
+                t0 = time.perf_counter()
+                try:
+                    self.proc.stdin.write(memoryview(buf).cast("B"))
+                    self.frames += 1
+                except (BrokenPipeError, OSError) as e:
+                    # 以降は書かずにバッファだけ返し続け、合成側が acquire() で気付く
+                    self.error = e
+                self.write_sec += time.perf_counter() - t0
+            self._free.put(buf)
+
+    def acquire(self) -> np.ndarray:
+        t0 = time.perf_counter()
+        buf = self._free.get()
+        self.wait_sec += time.perf_counter() - t0
+        if self.error is not None:
+            self._free.put(buf)
+            raise EncoderError(f"ffmpeg pipe closed: {self.error}\n{self._stderr_tail()}")
+        return buf
+
+    def submit(self, buf: np.ndarray) -> None:
+        self._filled.put(buf)
+
+    def _stderr_tail(self, n: int = 2000) -> str:
+        self._log.flush()
+        self._log.seek(0)
+        return self._log.read().decode("utf-8", "replace")[-n:]
+
+    def close(self) -> None:
+        """残りを書き切って ffmpeg の終了を待つ"""
+        self._filled.put(None)
+        self._thread.join()
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        rc = self.proc.wait()
+        tail = self._stderr_tail()
+        self._log.close()
+        if self.error is not None or rc != 0:
+            raise EncoderError(f"ffmpeg exited with {rc}: {tail}")
+
+    def abort(self, keep_partial: bool = False) -> None:
+        """
+        合成側の例外（キャンセルなど）で中断する。書きかけの出力は消す。
+        keep_partial（progressive 書き出し）なら、渡したフレームまでを ffmpeg に閉じさせて再生できる形で残す。
+        """
+        if keep_partial:
+            try:
+                self.close()
+            except EncoderError:
+                pass
+            return
+        self.proc.kill()
+        self._filled.put(None)
+        self._thread.join()
+        self.proc.wait()
+        self._log.close()
+        self.out_path.unlink(missing_ok=True)
+
+
+def write_clip_threaded(clip, out_path: Path, fps: float, audio_path: Optional[Path] = None,
+                        progress_cb: Optional[Callable[[int, int], None]] = None, queue_size: int = 8,
+                        progressive: Optional[str] = None, segment_sec: float = SEGMENT_SEC,
+                        **writer_kw) -> dict:
+    """
+    clip を合成スレッド／書き込みスレッドに分けて書き出し、所要時間の内訳を返す。
+    audio_path が無く clip に音声があれば、MoviePy と同じく一時 AAC に書いてから mux する。
+    progressive（hls / fmp4）は書きながら再生できる形で出す（モジュールの説明を参照）。
+    """
+    tmp_audio = None
+    if audio_path is None and clip.audio is not None:
+        tmp_audio = Path(out_path).with_name(Path(out_path).stem + ".TEMP_audio.m4a")
+    # 一時音声は書き出し途中や、この後の準備（HLS の掃除・ffmpeg の起動）で失敗しても必ず消す
+    try:
+        if tmp_audio is not None:
+            clip.audio.write_audiofile(str(tmp_audio), fps=44100, codec="aac", verbose=False, logger=None)
+            audio_path = tmp_audio
+        times = np.arange(0, clip.duration, 1.0 / fps)  # MoviePy の iter_frames と同じフレーム時刻
+        total = len(times)
+        target = Path(out_path)
+        if progressive:
+            target, extra = progressive_args(progressive, out_path, fps, segment_sec)
+            if progressive == "hls":
+                # 前回の残りのセグメントが新しいプレイリストに混ざらないよう消しておく
+                target.parent.mkdir(parents=True, exist_ok=True)
+                for old in target.parent.glob("*.m4s"):
+                    old.unlink()
+            writer_kw["extra_args"] = list(writer_kw.get("extra_args") or []) + extra
+            print(f"[ENCODE] {progressive}: {target}（書きながら再生できます）")
+        writer = FramePipeWriter(target, tuple(clip.size), fps, audio_path=audio_path,
+                                 queue_size=queue_size, **writer_kw)
+        t_start = time.perf_counter()
+        composite_sec = 0.0
+        try:
+            for i, t in enumerate(times):
+                buf = writer.acquire()
+                t0 = time.perf_counter()
+                np.copyto(buf, clip.get_frame(t), casting="unsafe")
+                composite_sec += time.perf_counter() - t0
+                writer.submit(buf)
+                if progress_cb is not None:
+                    progress_cb(i + 1, total)
+        except BaseException:
+            writer.abort(keep_partial=progressive is not None)
+            raise
+        # フレームループの所要時間と、その間のパイプ書き込み時間（重なりはこの区間で測る）
+        loop_sec = time.perf_counter() - t_start
+        loop_write_sec = writer.write_sec
+        t0 = time.perf_counter()
+        writer.close()
+        drain_sec = time.perf_counter() - t0   # キューの残りを書き切り、ffmpeg が終わるまで
+        remux_sec = 0.0
+        if progressive == "hls":
+            t0 = time.perf_counter()
+            hls_to_mp4(target, Path(out_path))
+            remux_sec = time.perf_counter() - t0
+    finally:
+        if tmp_audio is not None:
+            tmp_audio.unlink(missing_ok=True)
+    wall = time.perf_counter() - t_start
+    stats = {"frames": total, "wall_sec": round(wall, 3), "loop_sec": round(loop_sec, 3),
+             "composite_sec": round(composite_sec, 3), "pipe_write_sec": round(writer.write_sec, 3),
+             "buffer_wait_sec": round(writer.wait_sec, 3), "drain_sec": round(drain_sec, 3),
+             "remux_sec": round(remux_sec, 3), "fps": round(total / wall, 2) if wall else None}
+    # 直列ならループは composite + pipe_write かかる。ループ中にどれだけ重なったか
+    serial = composite_sec + loop_write_sec
+    stats["overlap_sec"] = round(max(0.0, serial - loop_sec), 3)
+    print(f"[ENCODE] {total} frames in {wall:.2f}s ({stats['fps']} fps): loop {loop_sec:.2f}s "
+          f"(composite {composite_sec:.2f}s, pipe {loop_write_sec:.2f}s, overlapped {stats['overlap_sec']:.2f}s), "
+          f"drain {drain_sec:.2f}s" + (f", remux {remux_sec:.2f}s" if progressive == "hls" else ""))
+    return stats
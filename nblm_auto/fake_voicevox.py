@@ -0,0 +1,201 @@
+# nblm_auto/fake_voicevox.py
+"""
+オフライン計測・動作確認用の VOICEVOX 互換スタブエンジン。
+/version, /audio_query, /synthesis, /multi_synthesis を本物と同じ形で受け付け、
+かなから推定したモーラ長に従った正弦波 WAV を返す。--latency-ms で1リクエストごとの遅延を模擬できる。
+
+  python -m nblm_auto.fake_voicevox --port 50021 --latency-ms 40
+"""
+from __future__ import annotations
+import argparse
+import io
+import json
+import math
+import threading
+import time
+import wave
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+VERSION = "0.0.0-fake"
+SAMPLE_RATE = 24000
+
+# かな → (子音, 母音)。行ごとに「あいうえお」の段で並べる（空白は欠番）
+_ROWS = {
+    "": "あいうえお", "k": "かきくけこ", "s": "さしすせそ", "t": "たちつてと",
+    "n": "なにぬねの", "h": "はひふへほ", "m": "まみむめも", "y": "や ゆ よ",
+    "r": "らりるれろ", "w": "わ   を", "g": "がぎぐげご", "z": "ざじずぜぞ",
+    "d": "だぢづでど", "b": "ばびぶべぼ", "p": "ぱぴぷぺぽ",
+}
+_KANA: Dict[str, Tuple[Optional[str], str]] = {}
+for _c, _row in _ROWS.items():
+    for _ch, _v in zip(_row, "aiueo"):
+        if _ch != " ":
+            _KANA[_ch] = (_c or None, _v)
+_KANA["ん"] = (None, "N")
+_KANA["っ"] = (None, "cl")
+_PAUSE_CHARS = set("、。，．,.!！?？ 　\n")
+
+
+def _kana_of(ch: str) -> str:
+    # カタカナはひらがなに寄せる
+    if "ァ" <= ch <= "ヶ":
+        return chr(ord(ch) - 0x60)
+    return ch
+
+
+def _mora(ch: str, vowel: str, consonant: Optional[str]) -> dict:
+    return {
+        "text": ch,
+        "consonant": consonant,
+        "consonant_length": 0.05 if consonant else None,
+        "vowel": vowel,
+        "vowel_length": 0.08 if vowel not in ("N", "cl") else 0.06,
+        "pitch": 0.0 if vowel in ("N", "cl") else 5.5,
+    }
+
+
+def make_audio_query(text: str) -> dict:
+    """テキストから AudioQuery 互換の dict を作る（漢字等は「か」相当の1モーラとして扱う）"""
+    phrases: List[dict] = []
+    moras: List[dict] = []
+    last_vowel = "a"
+    for raw in text:
+        if raw in _PAUSE_CHARS:
+            if moras:
+                phrases.append({
+                    "moras": moras, "accent": 1, "is_interrogative": False,
+                    "pause_mora": {"text": "、", "consonant": None, "consonant_length": None,
+                                   "vowel": "pau", "vowel_length": 0.2, "pitch": 0.0},
+                })
+                moras = []
+            continue
+        ch = _kana_of(raw)
+        if ch == "ー":
+            moras.append(_mora(raw, last_vowel, None))
+            continue
+        consonant, vowel = _KANA.get(ch, ("k", "a"))
+        moras.append(_mora(raw, vowel, consonant))
+        if vowel not in ("N", "cl"):
+            last_vowel = vowel
+    if moras:
+        phrases.append({"moras": moras, "accent": 1, "is_interrogative": False, "pause_mora": None})
+    return {
+        "accent_phrases": phrases,
+        "speedScale": 1.0, "pitchScale": 0.0, "intonationScale": 1.0, "volumeScale": 1.0,
+        "prePhonemeLength": 0.1, "postPhonemeLength": 0.1,
+        "outputSamplingRate": SAMPLE_RATE, "outputStereo": False, "kana": text,
+    }
+
+
+def query_duration(query: dict) -> float:
+    """AudioQuery の総再生時間（秒）。speedScale で割る本家と同じ扱い"""
+    total = float(query.get("prePhonemeLength", 0.0)) + float(query.get("postPhonemeLength", 0.0))
+    for ap in query.get("accent_phrases", []):
+        for m in ap.get("moras", []):
+            total += float(m.get("consonant_length") or 0.0) + float(m.get("vowel_length") or 0.0)
+        if ap.get("pause_mora"):
+            total += float(ap["pause_mora"].get("vowel_length") or 0.0)
+    return total / max(float(query.get("speedScale", 1.0)), 1e-3)
+
+
+def synthesize(query: dict, speaker: int) -> bytes:
+    """話者ごとに周波数を変えた正弦波の WAV バイト列を返す"""
+    sr = int(query.get("outputSamplingRate", SAMPLE_RATE))
+    n = int(round(query_duration(query) * sr))
+    freq = 180.0 + 20.0 * (int(speaker) % 10)
+    pcm = (8000 * np.sin(2.0 * math.pi * freq / sr * np.arange(n))).astype("<i2")
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sr)
+        wf.writeframes(pcm.tobytes())
+    return buf.getvalue()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "FakeVoicevox/" + VERSION
+    latency = 0.0
+
+    def log_message(self, fmt, *args):  # 計測時にノイズになるので黙らせる
+        pass
+
+    def _send(self, body: bytes, ctype: str, status: int = 200):
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, obj, status: int = 200):
+        self._send(json.dumps(obj, ensure_ascii=False).encode("utf-8"), "application/json", status)
+
+    def _body_json(self):
+        n = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(n).decode("utf-8")) if n else None
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        if urlparse(self.path).path == "/version":
+            self._send_json(VERSION)
+        else:
+            self._send_json({"detail": "Not Found"}, 404)
+
+    def do_POST(self):
+        time.sleep(self.latency)
+        url = urlparse(self.path)
+        qs = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if "speaker" not in qs:
+            self._send_json({"detail": "speaker is required"}, 422)
+            return
+        speaker = int(qs["speaker"])
+        if url.path == "/audio_query":
+            self._send_json(make_audio_query(qs.get("text", "")))
+        elif url.path == "/synthesis":
+            self._send(synthesize(self._body_json(), speaker), "audio/wav")
+        elif url.path == "/multi_synthesis":
+            buf = io.BytesIO()
+            with zipfile.ZipFile(buf, "w", zipfile.ZIP_STORED) as zf:
+                for i, q in enumerate(self._body_json() or []):
+                    zf.writestr(f"{str(i + 1).zfill(3)}.wav", synthesize(q, speaker))
+            self._send(buf.getvalue(), "application/zip")
+        else:
+            self._send_json({"detail": "Not Found"}, 404)
+
+
+def serve(host: str = "127.0.0.1", port: int = 50021, latency_ms: float = 0.0) -> ThreadingHTTPServer:
+    handler = type("Handler", (_Handler,), {"latency": latency_ms / 1000.0})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def serve_in_thread(port: int = 0, latency_ms: float = 0.0) -> Tuple[ThreadingHTTPServer, str]:
+    """バックグラウンドスレッドで起動して (server, engine_url) を返す。port=0 で空きポート"""
+    httpd = serve(port=port, latency_ms=latency_ms)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    host, real_port = httpd.server_address[:2]
+    return httpd, f"http://{host}:{real_port}"
+
+
+def main():
+    ap = argparse.ArgumentParser(description="VOICEVOX-compatible fake engine for offline tests/benchmarks")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=50021)
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="1リクエストごとの擬似遅延")
+    args = ap.parse_args()
+    httpd = serve(args.host, args.port, args.latency_ms)
+    print(f"[FAKE VOICEVOX] http://{args.host}:{args.port} (latency={args.latency_ms}ms)")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
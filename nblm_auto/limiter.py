@@ -0,0 +1,150 @@
+# nblm_auto/limiter.py
+"""
+TTS ミックス用のブロック単位ルックアヘッド・リミッタ／ラウドネス正規化。
+- 固定長ブロックごとにピークを見て、必要ゲインを「今のブロックと次のブロック」の小さい方に取る
+- ブロック内はゲインを前ブロック終端値から線形に遷移させる（クリックを防ぎつつ、必ず閾値以下に収まる）
+- 1本の大きなトランジェントがあっても、下げるのはその前後のブロックだけ
+メモリ使用量はブロック2個分で一定。配列の in-place 処理と WAV ファイルの2パス処理の両方に使える。
+"""
+from __future__ import annotations
+import math
+import os
+import tempfile
+import wave
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+
+INT16_MAX = 32767.0
+DEFAULT_BLOCK = 4096
+
+
+def dbfs_to_amp(dbfs: float) -> float:
+    return INT16_MAX * (10.0 ** (dbfs / 20.0))
+
+
+def _required_gain(blk: np.ndarray, threshold: float, gain: float) -> float:
+    peak = float(np.max(np.abs(blk))) if blk.size else 0.0
+    if peak <= 0.0:
+        return gain
+    return min(gain, threshold / peak)
+
+
+def _apply_ramp(blk: np.ndarray, g0: float, g1: float) -> None:
+    if g0 == 1.0 and g1 == 1.0:
+        return
+    ramp = np.linspace(g0, g1, len(blk) + 1)[1:]
+    if np.issubdtype(blk.dtype, np.floating):
+        blk *= ramp
+    else:
+        tmp = blk * ramp
+        np.rint(tmp, out=tmp)
+        blk[...] = tmp
+
+
+def limit_blocks(blocks: Iterable[np.ndarray], threshold: float = INT16_MAX,
+                 gain: float = 1.0) -> Iterator[np.ndarray]:
+    """
+    ブロック列にゲイン gain とルックアヘッド・リミッタを掛けて順に返す（各ブロックは in-place で書き換える）。
+    ブロック k のゲインは前ブロック終端値 g[k-1] から g[k] = min(req[k], req[k+1]) へ線形に遷移する。
+    g[k-1], g[k] はどちらも req[k] 以下なので、ブロック内の全サンプルが threshold 以下に収まる。
+    """
+    prev_g: Optional[float] = None
+    cur: Optional[np.ndarray] = None
+    cur_req = gain
+    for nxt in blocks:
+        nxt_req = _required_gain(nxt, threshold, gain)
+        if cur is not None:
+            g = min(cur_req, nxt_req)
+            _apply_ramp(cur, g if prev_g is None else prev_g, g)
+            yield cur
+            prev_g = g
+        cur, cur_req = nxt, nxt_req
+    if cur is not None:
+        _apply_ramp(cur, cur_req if prev_g is None else prev_g, cur_req)
+        yield cur
+
+
+def gated_rms_dbfs(blocks: Iterable[np.ndarray], gate_dbfs: float = -50.0) -> Optional[float]:
+    """
+    gate_dbfs 未満の（ほぼ無音の）ブロックを除いた RMS を dBFS で返す。
+    LUFS の簡易版で、台詞間の無音で平均が引き下げられないようにする。有音ブロックが無ければ None。
+    """
+    gate = dbfs_to_amp(gate_dbfs) ** 2
+    acc = 0.0
+    n = 0
+    for blk in blocks:
+        if not blk.size:
+            continue
+        f = blk.astype(np.float64)
+        ms = float(np.dot(f, f)) / blk.size
+        if ms >= gate:
+            acc += ms * blk.size
+            n += blk.size
+    if n == 0:
+        return None
+    return 10.0 * math.log10(acc / n / (INT16_MAX ** 2))
+
+
+def loudness_gain(rms_dbfs: Optional[float], target_dbfs: Optional[float]) -> float:
+    if target_dbfs is None or rms_dbfs is None:
+        return 1.0
+    return 10.0 ** ((target_dbfs - rms_dbfs) / 20.0)
+
+
+def _array_blocks(x: np.ndarray, block: int) -> Iterator[np.ndarray]:
+    for i in range(0, len(x), block):
+        yield x[i:i + block]
+
+
+def limit_array_inplace(x: np.ndarray, ceiling_dbfs: float = 0.0,
+                        target_dbfs: Optional[float] = None, block: int = DEFAULT_BLOCK) -> None:
+    """
+    int32/float 配列をブロック単位で in-place 処理する（一時領域はブロック分だけ）。
+    target_dbfs を指定すると先にゲート付き RMS を測ってラウドネスを合わせる。
+    """
+    gain = 1.0
+    if target_dbfs is not None:
+        gain = loudness_gain(gated_rms_dbfs(_array_blocks(x, block)), target_dbfs)
+    for _ in limit_blocks(_array_blocks(x, block), dbfs_to_amp(ceiling_dbfs), gain):
+        pass
+
+
+def _wav_blocks(path: Path, block: int) -> Iterator[np.ndarray]:
+    with wave.open(str(path), "rb") as wf:
+        if wf.getsampwidth() != 2 or wf.getnchannels() != 1:
+            raise RuntimeError(f"expected mono int16 wav: {path}")
+        while True:
+            raw = wf.readframes(block)
+            if not raw:
+                break
+            yield np.frombuffer(raw, dtype=np.int16).astype(np.int32)
+
+
+def limit_wav_file(path: Path, ceiling_dbfs: float = 0.0,
+                   target_dbfs: Optional[float] = None, block: int = DEFAULT_BLOCK) -> None:
+    """
+    モノラル int16 WAV をブロック単位の2パス（ラウドネス測定→リミット）で処理し、原子的に置き換える。
+    ファイル全体をメモリに載せないので、ストリーミング出力した長尺ミックスにも使える。
+    """
+    path = Path(path)
+    gain = 1.0
+    if target_dbfs is not None:
+        gain = loudness_gain(gated_rms_dbfs(_wav_blocks(path, block)), target_dbfs)
+    with wave.open(str(path), "rb") as wf:
+        sr = wf.getframerate()
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".wav")
+    os.close(fd)
+    try:
+        with wave.open(tmp, "wb") as out:
+            out.setnchannels(1)
+            out.setsampwidth(2)
+            out.setframerate(sr)
+            for blk in limit_blocks(_wav_blocks(path, block), dbfs_to_amp(ceiling_dbfs), gain):
+                np.clip(blk, -32768, 32767, out=blk)
+                out.writeframesraw(blk.astype(np.int16).tobytes())
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
@@ -0,0 +1,112 @@
+# nblm_auto/lipsync_mora.py
+"""
+VOICEVOX の AudioQuery（accent_phrases のモーラ長）から、Rhubarb 互換の viseme JSON を直接作る。
+TTS で作った音声なら発音タイミングは合成時点で分かっているので、Rhubarb を走らせる必要がない。
+出力は {"mouthCues": [{"start", "end", "value"}, ...]} 形式で、visemes_to_openclose でそのまま読める。
+"""
+from __future__ import annotations
+import json
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# 母音 → Rhubarb の口形（A:閉, B:軽く開, C:開, D:大きく開, E:やや丸め, F:すぼめ, X:休止）
+VOWEL_SHAPES = {"a": "D", "i": "B", "u": "F", "e": "C", "o": "E", "N": "A", "cl": "A", "pau": "X"}
+# 子音区間の口形（両唇音は閉じる。それ以外は軽く開いた形）
+CONSONANT_SHAPES = {"m": "A", "my": "A", "b": "A", "by": "A", "p": "A", "py": "A",
+                    "f": "G", "v": "G", "w": "F", "r": "H", "ry": "H"}
+
+
+def _vowel_shape(vowel: Optional[str]) -> str:
+    if not vowel:
+        return "X"
+    if vowel in VOWEL_SHAPES:
+        return VOWEL_SHAPES[vowel]
+    # 大文字は無声化母音（ほぼ口が動かない）
+    return "B"
+
+
+def query_to_cues(query: dict, offset_sec: float = 0.0) -> Tuple[List[dict], float]:
+    """
+    AudioQuery 1個分を mouthCues に変換し、(cues, チャンク終端の秒) を返す。
+    合成音声と同じく prePhonemeLength → 各モーラ（子音+母音）→ pause_mora → postPhonemeLength の順に並べ、
+    すべての長さを speedScale で割る。
+    """
+    speed = max(float(query.get("speedScale", 1.0)), 1e-3)
+    t = offset_sec
+    cues: List[dict] = []
+
+    def _add(length: Optional[float], value: str):
+        nonlocal t
+        dur = float(length or 0.0) / speed
+        if dur <= 0.0:
+            return
+        cues.append({"start": round(t, 4), "end": round(t + dur, 4), "value": value})
+        t += dur
+
+    _add(query.get("prePhonemeLength"), "X")
+    for ap in query.get("accent_phrases", []):
+        for m in ap.get("moras", []):
+            if m.get("consonant"):
+                _add(m.get("consonant_length"), CONSONANT_SHAPES.get(m["consonant"], "B"))
+            _add(m.get("vowel_length"), _vowel_shape(m.get("vowel")))
+        if ap.get("pause_mora"):
+            _add(ap["pause_mora"].get("vowel_length"), "X")
+    _add(query.get("postPhonemeLength"), "X")
+    return cues, t
+
+
+def _merge_same(cues: List[dict]) -> List[dict]:
+    out: List[dict] = []
+    for c in cues:
+        if out and out[-1]["value"] == c["value"] and abs(out[-1]["end"] - c["start"]) < 1e-3:
+            out[-1]["end"] = c["end"]
+        else:
+            out.append(dict(c))
+    return out
+
+
+def mora_timelines(entries: Iterable[Tuple[str, float, dict]], total_sec: float,
+                   speakers: Iterable[str] = ("A", "B")) -> Dict[str, List[dict]]:
+    """
+    entries: [(who, start_sec, audio_query), ...]（voicevox_tts_segments の組み立て位置）
+    話者ごとに 0〜total_sec を隙間なく埋めた mouthCues を返す。他人の発話中・ポーズ中は X。
+    """
+    per: Dict[str, List[dict]] = {who: [] for who in speakers}
+    for who, start_sec, query in entries:
+        cues, _ = query_to_cues(query, start_sec)
+        per.setdefault(who, []).extend(cues)
+
+    out: Dict[str, List[dict]] = {}
+    for who, cues in per.items():
+        filled: List[dict] = []
+        t = 0.0
+        for c in sorted(cues, key=lambda c: c["start"]):
+            if c["start"] > t + 1e-4:
+                filled.append({"start": round(t, 4), "end": c["start"], "value": "X"})
+            filled.append(c)
+            t = max(t, c["end"])
+        if total_sec > t + 1e-4:
+            filled.append({"start": round(t, 4), "end": round(total_sec, 4), "value": "X"})
+        out[who] = _merge_same(filled)
+    return out
+
+
+def write_mora_lipsync(entries: Iterable[Tuple[str, float, dict]], total_sec: float, out_dir: Path,
+                       speakers: Iterable[str] = ("A", "B"), source_audio: Optional[Path] = None) -> Dict[str, Path]:
+    """話者ごとの viseme JSON を out_dir/char{who}.json に書き出す"""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    paths: Dict[str, Path] = {}
+    for who, cues in mora_timelines(entries, total_sec, speakers).items():
+        payload = {
+            "metadata": {
+                "source_audio": str(Path(source_audio).resolve()) if source_audio else None,
+                "duration": round(total_sec, 4),
+                "generator": "nblm_auto.lipsync_mora",
+            },
+            "mouthCues": cues,
+        }
+        p = out_dir / f"char{who}.json"
+        p.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+        paths[who] = p
+    return paths
@@ -0,0 +1,143 @@
+# nblm_auto/lipsync_rms.py
+"""
+Rhubarb を使わない口パク（開/閉だけ）エンジン。
+レンダラーは value != "X" を「開」とみなすだけなので、音素認識は要らない。
+- 音声は1回だけデコードし、10ms フレームの RMS 包絡（dB）をまとめて計算
+- 話者ごとに Notta の発話区間でゲートし、その区間内の 95 パーセンタイルを基準にヒステリシスで開閉
+- 短すぎる閉（音節間の一瞬の谷）は埋め、短すぎる開は捨ててチラつきを抑える
+出力は Rhubarb 互換の {"metadata", "mouthCues"}（開は "C"、閉は "X"）で、visemes_to_openclose でそのまま読める。
+
+  python -m nblm_auto.lipsync_rms --audio data/input_audio/ep.m4a --srt "ep(notta).srt" --outdir data/lipsync
+"""
+from __future__ import annotations
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .speaker_segments import notta_segments, spans_by_speaker
+from .vad import frame_energy_db, hysteresis, load_pcm, mask_to_intervals, merge_close
+
+SR = 16000
+FRAME_MS = 10.0
+OPEN_VALUE = "C"
+CLOSED_VALUE = "X"
+
+
+def gate_mask(spans: Iterable[Tuple[float, float]], n_frames: int, hop_sec: float) -> np.ndarray:
+    """[(t0, t1)] をフレーム単位のブール配列にする（開始 +1 / 終了 -1 の累積和）"""
+    spans = np.asarray(list(spans), dtype=np.float64).reshape(-1, 2)
+    delta = np.zeros(n_frames + 1, dtype=np.int32)
+    a = np.clip(np.floor(spans[:, 0] / hop_sec).astype(np.int64), 0, n_frames)
+    b = np.clip(np.ceil(spans[:, 1] / hop_sec).astype(np.int64), 0, n_frames)
+    np.add.at(delta, a, 1)
+    np.add.at(delta, b, -1)
+    return np.cumsum(delta[:-1]) > 0
+
+
+def open_intervals(energy_db: np.ndarray, gate: np.ndarray, hop_sec: float,
+                   open_db: float = -14.0, close_db: float = -22.0,
+                   min_open: float = 0.06, min_close: float = 0.05) -> np.ndarray:
+    """
+    ゲート内のフレームだけで基準レベルを決め、開区間を shape (n, 2) の秒配列で返す。
+    open_db / close_db は基準（95 パーセンタイル）からの相対値。
+    """
+    if not gate.any():
+        return np.zeros((0, 2))
+    ref = float(np.percentile(energy_db[gate], 95))
+    mask = hysteresis(energy_db, ref + open_db, ref + close_db) & gate
+    iv = merge_close(mask_to_intervals(mask, hop_sec), min_close)
+    return iv[(iv[:, 1] - iv[:, 0]) >= min_open]
+
+
+def intervals_to_timeline(iv: np.ndarray, total_sec: float) -> List[Tuple[float, float, bool]]:
+    """開区間 → 0..total を隙間なく覆う [(t0, t1, is_open)]"""
+    timeline: List[Tuple[float, float, bool]] = []
+    t = 0.0
+    for t0, t1 in iv.tolist():
+        if t0 > t:
+            timeline.append((t, t0, False))
+        timeline.append((t0, t1, True))
+        t = t1
+    if total_sec > t:
+        timeline.append((t, total_sec, False))
+    return timeline
+
+
+def rms_lipsync(pcm: np.ndarray, sr: int, spans: Dict[str, List[Tuple[float, float]]],
+                **params) -> Dict[str, List[Tuple[float, float, bool]]]:
+    """話者 → 発話区間 から 話者 → 開閉タイムライン。包絡は全話者で共有して1回だけ計算する"""
+    energy = frame_energy_db(pcm, sr, FRAME_MS)
+    hop_sec = max(1, int(sr * FRAME_MS / 1000.0)) / sr
+    total = len(pcm) / sr
+    return {who: intervals_to_timeline(open_intervals(energy, gate_mask(sp, len(energy), hop_sec),
+                                                      hop_sec, **params), total)
+            for who, sp in spans.items()}
+
+
+def timeline_to_cues(timeline: List[Tuple[float, float, bool]]) -> List[dict]:
+    return [{"start": round(t0, 3), "end": round(t1, 3), "value": OPEN_VALUE if st else CLOSED_VALUE}
+            for t0, t1, st in timeline]
+
+
+def write_rms_lipsync(audio: Path, srt: Path, out_dir: Path, speaker_map: str = "1=A,2=B",
+                      speakers: Iterable[str] = ("A", "B"), **params) -> Dict[str, Path]:
+    t0 = time.perf_counter()
+    pcm = load_pcm(audio, SR)
+    t_dec = time.perf_counter() - t0
+    speakers = tuple(speakers)
+    spans = spans_by_speaker(notta_segments(srt, speaker_map, speakers))
+    spans = {who: spans.get(who, []) for who in speakers}
+    t1 = time.perf_counter()
+    timelines = rms_lipsync(pcm, SR, spans, **params)
+    t_sync = time.perf_counter() - t1
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    paths: Dict[str, Path] = {}
+    for who, tl in timelines.items():
+        payload = {
+            "metadata": {
+                "source_audio": str(Path(audio).resolve()),
+                "srt": str(Path(srt).resolve()),
+                "speaker_map": speaker_map,
+                "duration": round(len(pcm) / SR, 4),
+                "generator": "nblm_auto.lipsync_rms",
+                "params": params,
+            },
+            "mouthCues": timeline_to_cues(tl),
+        }
+        p = out_dir / f"char{who}.json"
+        p.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+        paths[who] = p
+        print(f"Wrote {p}  (open: {sum(1 for *_, st in tl if st)})")
+    print(f"[LIPSYNC-RMS] decode {t_dec:.2f}s, envelope+hysteresis {t_sync * 1000:.0f}ms")
+    return paths
+
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Open/close lipsync JSON per speaker from the RMS envelope (no Rhubarb)")
+    ap.add_argument("--audio", required=True)
+    ap.add_argument("--srt", required=True, help="Notta SRT with '話者 1/2' lines")
+    ap.add_argument("--outdir", default="data/lipsync")
+    ap.add_argument("--map", default="1=A,2=B")
+    ap.add_argument("--labels", default="A,B", help="出力するキャラ（charX.json の X）。3人以上なら A,B,C など")
+    ap.add_argument("--open-db", type=float, default=-14.0, help="基準（95pct）から何 dB 以上で開くか")
+    ap.add_argument("--close-db", type=float, default=-22.0, help="基準から何 dB 未満で閉じるか")
+    ap.add_argument("--min-open", type=float, default=0.06)
+    ap.add_argument("--min-close", type=float, default=0.05)
+    args = ap.parse_args(argv)
+    try:
+        write_rms_lipsync(Path(args.audio), Path(args.srt), Path(args.outdir), args.map,
+                          speakers=[x.strip().upper() for x in args.labels.split(",") if x.strip()],
+                          open_db=args.open_db, close_db=args.close_db,
+                          min_open=args.min_open, min_close=args.min_close)
+    except ValueError as e:
+        raise SystemExit(str(e))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,113 @@
 from __future__ import annotations
 import argparse, json, yaml
 from pathlib import Path
-from .transcription import transcribe_with_whisper_cli
-from .tts_voicevox import voicevox_tts
-from .lipsync_rhubarb import rhubarb_visemes, visemes_to_openclose
-from .render import render_two_chars
+from .pipeline import Pipeline, Stage
+from .utils import configure_run, print_run_summary, split_japanese_sentences
 
 def load_config(p: Path) -> dict:
     return yaml.safe_load(Path(p).read_text(encoding="utf-8"))
 
+def build_segments(text: str, cfg: dict) -> list[dict]:
+    """
+    dialogue.enabled なら文ごとに A/B を交互に割り当て、そうでなければ全文を narrator（A）で読む。
+    """
+    sentences = [s for s in split_japanese_sentences(text) if s]
+    dialogue = cfg.get("dialogue", {})
+    if not dialogue.get("enabled", False):
+        spk = int(cfg["voicevox"]["narrator_speaker_id"])
+        return [{"text": s, "who": "A", "speaker_id": spk} for s in sentences]
+    ids = {
+        "A": int(cfg["characters"]["charA"]["speaker_id"]),
+        "B": int(cfg["characters"]["charB"]["speaker_id"]),
+    }
+    turn = dialogue.get("start_with", "A")
+    segs = []
+    for s in sentences:
+        segs.append({"text": s, "who": turn, "speaker_id": ids[turn]})
+        turn = "B" if turn == "A" else "A"
+    return segs
+
+def build_pipeline(args, cfg: dict) -> Pipeline:
+    """
+    transcribe → tts（モーラ長から lipsync も同時に出力）→ render
+    各ステージは入出力のハッシュが変わらなければスキップされる。
+    """
+    audio = Path(args.input)
+    tdir = Path("data/transcripts")
+    tjson = tdir / (audio.stem + ".json")
+    tsrt = tdir / (audio.stem + ".srt")
+    mix_wav = Path("data/tts/narration.wav")
+    A_wav, B_wav = Path("data/tts/charA.wav"), Path("data/tts/charB.wav")
+    lipsync_dir = Path("data/lipsync")
+    jsonA, jsonB = lipsync_dir / "charA.json", lipsync_dir / "charB.json"
+    vv = cfg["voicevox"]
+    pcfg = cfg["pipeline"]
+
+    def transcribe():
+        from .transcription import TranscriptionWorker, make_backend
+        backend = make_backend(pcfg.get("backend", "whisper-cli"), pcfg["model"])
+        with TranscriptionWorker(backend, pcfg["language"], cache_dir=pcfg.get("cache_dir")) as worker:
+            worker.transcribe(audio, tdir)
+
+    def tts():
+        from .tts_voicevox import QUERY_TEXT_BYTES, voicevox_tts_segments
+        data = json.loads(tjson.read_text(encoding="utf-8"))
+        full_text = "".join(seg["text"] for seg in data.get("segments", []))
+        voicevox_tts_segments(
+            build_segments(full_text, cfg),
+            engine_url=vv["engine_url"],
+            speed_scale=float(vv["speed_scale"]),
+            pitch_scale=float(vv["pitch_scale"]),
+            intonation_scale=float(vv["intonation_scale"]),
+            pause_between_sentences_ms=int(pcfg["pause_between_sentences_ms"]),
+            out_mix_wav=mix_wav, out_A_wav=A_wav, out_B_wav=B_wav,
+            cache_dir=Path(vv["cache_dir"]) if vv.get("cache_dir") else None,
+            batch_size=int(vv.get("batch_size", 1)),
+            lipsync_dir=lipsync_dir,
+            max_query_bytes=int(vv.get("max_query_bytes", QUERY_TEXT_BYTES)),
+        )
+
+    def render():
+        from .lipsync_rhubarb import visemes_to_openclose
+        from .render import render_two_chars_dual
+        render_two_chars_dual(
+            audio_path=mix_wav,
+            charA_dir=Path(args.charA),
+            charB_dir=Path(args.charB),
+            viseme_timeline_A=visemes_to_openclose(jsonA),
+            viseme_timeline_B=visemes_to_openclose(jsonB),
+            out_path=Path(args.out),
+        )
+
+    pl = Pipeline()
+    pl.add(Stage("transcribe", transcribe, inputs=[audio], outputs=[tjson, tsrt],
+                 params={k: pcfg.get(k) for k in ("backend", "model", "language")}))
+    pl.add(Stage("tts", tts, inputs=[tjson], outputs=[mix_wav, A_wav, B_wav, jsonA, jsonB],
+                 params={"voicevox": {k: v for k, v in vv.items() if k != "cache_dir"},
+                         "characters": cfg.get("characters"), "dialogue": cfg.get("dialogue"),
+                         "pause_ms": pcfg["pause_between_sentences_ms"]}))
+    pl.add(Stage("render", render, inputs=[mix_wav, jsonA, jsonB, Path(args.charA), Path(args.charB)],
+                 outputs=[Path(args.out)]))
+    return pl
+
+def dry_run(args, cfg: dict) -> bool:
+    """音声・キャラ素材・設定キーだけを検証する（VOICEVOX / Whisper には触らない）"""
+    from .validate import ValidationReport, check_audio, check_backend, check_binary, check_char_dir
+    rep = ValidationReport()
+    check_audio(rep, Path(args.input))
+    check_char_dir(rep, Path(args.charA))
+    check_char_dir(rep, Path(args.charB))
+    required = {"voicevox": ("engine_url", "speed_scale", "pitch_scale", "intonation_scale"),
+                "pipeline": ("model", "language", "pause_between_sentences_ms")}
+    for section, keys in required.items():
+        missing = [k for k in keys if k not in (cfg.get(section) or {})]
+        if missing:
+            rep.error(f"{args.config}: missing keys: {', '.join(f'{section}.{k}' for k in missing)}")
+    check_backend(rep, (cfg.get("pipeline") or {}).get("backend", "whisper-cli"))
+    check_binary(rep, "ffmpeg")
+    rep.print()
+    return rep.ok
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--input", required=True, help="NotebookLM音声ファイル（m4a/mp3/wav）")
@@ -16,35 +115,22 @@ def main():
     ap.add_argument("--charA", default="assets/characters/charA")
     ap.add_argument("--charB", default="assets/characters/charB")
     ap.add_argument("--out", default="output.mp4")
+    ap.add_argument("--force", action="store_true", help="最新でも全ステージを再実行")
+    ap.add_argument("--run-log", help="外部ツールの実行記録 JSONL（出力は同じ場所の logs/ に保存）")
+    ap.add_argument("--dry-run", action="store_true", help="入力と設定を検証するだけで実行しない")
     args = ap.parse_args()
 
     cfg = load_config(Path(args.config))
-    whisper_out = transcribe_with_whisper_cli(Path(args.input), Path("data/transcripts"), model=cfg["pipeline"]["model"], language=cfg["pipeline"]["language"])
-
-    data = json.loads(Path(whisper_out["json"]).read_text(encoding="utf-8"))
-    full_text = "".join(seg["text"] for seg in data.get("segments", []))
-
-    wav = voicevox_tts(
-        full_text,
-        speaker_id=int(cfg["voicevox"]["narrator_speaker_id"]),
-        engine_url=cfg["voicevox"]["engine_url"],
-        speed_scale=float(cfg["voicevox"]["speed_scale"]),
-        pitch_scale=float(cfg["voicevox"]["pitch_scale"]),
-        intonation_scale=float(cfg["voicevox"]["intonation_scale"]),
-        pause_between_sentences_ms=int(cfg["pipeline"]["pause_between_sentences_ms"]),
-        out_wav=Path("data/tts/narration.wav")
-    )
-    vis = rhubarb_visemes(wav, Path("data/visemes/narration.json"))
-    timeline = visemes_to_openclose(vis)
-
-    out = render_two_chars(
-        audio_wav=wav,
-        viseme_timeline=timeline,
-        charA_dir=Path(args.charA),
-        charB_dir=Path(args.charB),
-        out_path=Path(args.out),
-    )
-    print("DONE:", out)
+    if args.dry_run:
+        raise SystemExit(0 if dry_run(args, cfg) else 1)
+    if args.run_log:
+        configure_run(log=Path(args.run_log), log_dir=Path(args.run_log).parent / "logs")
+    try:
+        build_pipeline(args, cfg).run(force=args.force)
+    finally:
+        if args.run_log and Path(args.run_log).exists():
+            print_run_summary(Path(args.run_log))
+    print("DONE:", args.out)
 
 if __name__ == "__main__":
     main()
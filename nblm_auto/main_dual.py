@@ -1,20 +1,51 @@
 # nblm_auto/main_dual.py
 from __future__ import annotations
 import argparse
+import sys
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 from .lipsync_rhubarb import visemes_to_openclose
-from .render import render_two_chars_dual
+from .pipeline import Pipeline, Stage
+from .subtitles import apply_subtitles, clean_video_path
+from .utils import configure_run, normalize_notta_srt, print_run_summary, run
+
+TOOLS_DIR = Path(__file__).resolve().parents[1] / "tools"
+LIPSYNC_DIR = Path("data/lipsync")
+SLIDES_INDEX = Path("data/slides/index.json")
 
 def parse_args():
     p = argparse.ArgumentParser()
     p.add_argument("--input", required=True, help="NotebookLM出力の音声（mix.wav 等）")
-    p.add_argument("--config", default="config.yml")  # 未使用だが互換のため残す
-    p.add_argument("--charA", required=True, help="assets/characters/charA")
-    p.add_argument("--charB", required=True, help="assets/characters/charB")
+    p.add_argument("--config", default="config.yml",
+                   help="--charA/--charB が無いとき、characters.<charX>.dir からキャラ（3人以上も可）を読む")
+    p.add_argument("--charA", help="assets/characters/charA（--charB と組で従来の2人構図）")
+    p.add_argument("--charB", help="assets/characters/charB")
     p.add_argument("--out", required=True, help="出力mp4")
-    p.add_argument("--stage", choices=["render"], default="render")
-    p.add_argument("--transcript", help="NottaのSRT（final_std.srt 推奨）")
+    p.add_argument("--stage", choices=["render", "all", "subs"], default="render",
+                   help="render: 既存の lipsync JSON で合成のみ / all: Notta SRT から lipsync・字幕・合成までをパイプライン実行"
+                        " / subs: 合成済みの字幕なし映像（<out>.clean.mp4）に字幕だけ付け直す")
+    p.add_argument("--subs", choices=["burn", "soft", "ass-burn"], default="burn",
+                   help="burn: MoviePy で焼き込み（従来） / soft: 字幕ストリームとして mux（再エンコードなし）"
+                        " / ass-burn: 字幕なしで合成してから ffmpeg の ass フィルタで焼き込み")
+    p.add_argument("--progressive", choices=["hls", "fmp4"],
+                   help="書きながら見られる形で出す: hls（<out>_hls/index.m3u8 を随時更新、最後に out へまとめる）/ fmp4（out をフラグメントMP4で）")
+    p.add_argument("--transcript", help="NottaのSRT（final_std.srt 推奨。--stage all では「話者 N」付きの生SRT）")
+    p.add_argument("--map", default="1=A,2=B", help="話者番号→キャラの対応（--stage all / --emphasis）")
+    p.add_argument("--lipsync", choices=["rhubarb", "rms"], default="rhubarb",
+                   help="--stage all: rhubarb（話者区間ごとに外部バイナリ）/ rms（音量包絡の開閉。外部バイナリ不要で高速）")
+    p.add_argument("--align", metavar="WHISPER_JSON",
+                   help="--stage all: Notta SRT の時刻を Whisper JSON（transcription.py の出力）に合わせ直してから使う")
+    p.add_argument("--force", action="store_true", help="--stage all: 最新でも全ステージを再実行")
+    p.add_argument("--slides", action="store_true", help="字幕から数字を拾ってスライドを時間指定で重ねる")
+    p.add_argument("--emphasis", choices=["none", "dim", "scale"], default="none",
+                   help="話していない側のキャラを暗く（dim）/ 小さく（scale）する。話者区間は Notta SRT から取る")
+    p.add_argument("--speakers", help="--emphasis 用の「話者 N」付き Notta SRT（--stage all では --transcript を使う）")
+    p.add_argument("--bgm", help="BGM 音声。回の長さまでループし、発話中は下げてナレーションに混ぜる（<out>_bgm.wav）")
+    p.add_argument("--bgm-db", type=float, default=-20.0, help="BGM の基本レベル（dB）")
+    p.add_argument("--duck-db", type=float, default=-12.0, help="発話中に BGM をさらに下げる量（dB）")
+    p.add_argument("--run-log", help="外部ツール（ffmpeg / rhubarb / whisper）の実行記録 JSONL。出力は同じ場所の logs/ に保存")
+    p.add_argument("--max-procs", type=int, help="同時に走らせる外部コマンドの上限")
+    p.add_argument("--dry-run", action="store_true", help="入力（音声・素材・lipsync JSON・SRT）を検証するだけで合成しない")
     return p.parse_args()
 
 def find_viseme_json(default_path: Path) -> Path:
@@ -29,41 +60,276 @@ def find_viseme_json(default_path: Path) -> Path:
         return alt
     raise FileNotFoundError(f"Viseme JSON not found: {default_path} or {alt}")
 
-def main():
-    args = parse_args()
-    assert args.stage == "render"
-
-    audio = Path(args.input)
-    charA_dir = Path(args.charA)
-    charB_dir = Path(args.charB)
-    out_path = Path(args.out)
-    srt_path: Optional[Path] = Path(args.transcript) if args.transcript else None
-
-    # ここでWhisperなどは呼ばない
-    jsonA = find_viseme_json(Path("data/lipsync/charA.json"))
-    jsonB = find_viseme_json(Path("data/lipsync/charB.json"))
+def load_cast(args) -> List[Tuple[str, Path, Optional[Tuple[int, int]]]]:
+    """
+    画面に左から並べるキャラ [(ラベル, 素材ディレクトリ, 口の位置)]。
+    --charA / --charB があれば従来の2人。無ければ config の characters.<charX>（dir を持つもの）を書かれた順に使う:
+      characters:
+        charC:
+          dir: assets/characters/charC
+          mouth_offset: [410, 380]   # 任意。base.png 上の口PNGの左上
+    ラベルは charX の X で、lipsync の charX.json・--map の割り当て先と対応する。
+    """
+    if args.charA or args.charB:
+        if not (args.charA and args.charB):
+            raise SystemExit("--charA と --charB は両方指定してください")
+        return [("A", Path(args.charA), None), ("B", Path(args.charB), None)]
+    import yaml
+    cfg_path = Path(args.config)
+    cfg = yaml.safe_load(cfg_path.read_text(encoding="utf-8")) if cfg_path.exists() else None
+    cast = []
+    for key, c in ((cfg or {}).get("characters") or {}).items():
+        if isinstance(c, dict) and c.get("dir"):
+            label = (key[4:] if key.startswith("char") else key).upper()
+            off = c.get("mouth_offset")
+            cast.append((label, Path(c["dir"]), tuple(off) if off else None))
+    if not cast:
+        raise SystemExit(f"キャラ素材がありません: --charA/--charB か {cfg_path} の characters.<charX>.dir を指定してください")
+    return cast
 
-    visA = visemes_to_openclose(jsonA, min_dur=0.05)
-    visB = visemes_to_openclose(jsonB, min_dur=0.05)
+def lipsync_paths(cast) -> Dict[str, Path]:
+    return {label: LIPSYNC_DIR / f"char{label}.json" for label, _, _ in cast}
 
+def load_timelines(cast) -> List[Tuple[str, Path, List[tuple]]]:
+    """キャラごとの lipsync JSON（charX.json）を開閉タイムラインにして [(ラベル, 素材, タイムライン)] を返す"""
     # デバッグ出力
     def _summ(tl):
         opens = sum(1 for *_, st in tl if st)
         closes = len(tl) - opens
         return f"{len(tl)} segs (open={opens}, close={closes})"
-    print(f"[LIPSYNC] A: {jsonA} -> { _summ(visA) }")
-    print(f"[LIPSYNC] B: {jsonB} -> { _summ(visB) }")
 
-    render_two_chars_dual(
+    entries = []
+    for label, char_dir, _ in cast:
+        js = find_viseme_json(LIPSYNC_DIR / f"char{label}.json")
+        tl = visemes_to_openclose(js, min_dur=0.05)
+        print(f"[LIPSYNC] {label}: {js} -> { _summ(tl) }")
+        entries.append((label, char_dir, tl))
+    return entries
+
+def render_stage(audio: Path, cast, out_path: Path, srt_path: Optional[Path],
+                 slides_index: Optional[Path] = None, speakers_srt: Optional[Path] = None,
+                 speaker_map: str = "1=A,2=B", emphasis: str = "none", progressive: Optional[str] = None):
+    from .render import cast_layout, render_cast
+    from .slides import load_slide_overlays
+    from .speaker_segments import SpeakerIndex
+
+    entries = load_timelines(cast)
+    offsets = {label: off for label, _, off in cast if off}
+
+    labels = [label for label, _, _ in cast]
+    speakers = None
+    if emphasis != "none" and speakers_srt:
+        speakers = SpeakerIndex.from_notta(speakers_srt, speaker_map, labels)
+        print(f"[EMPHASIS] {emphasis}: {len(speakers)} speaker segments from {speakers_srt}")
+
+    render_cast(
         audio_path=audio,
-        charA_dir=charA_dir,
-        charB_dir=charB_dir,
-        viseme_timeline_A=visA,
-        viseme_timeline_B=visB,
+        cast=cast_layout(entries, offsets or None),
         out_path=out_path,
         srt_path=srt_path,
+        overlays=load_slide_overlays(slides_index) if slides_index else None,
+        speakers=speakers,
+        emphasis=emphasis,
+        writer=progressive or "threaded",
     )
+
+def bgm_mix_path(out_path: Path) -> Path:
+    return Path(out_path).with_name(Path(out_path).stem + "_bgm.wav")
+
+def bgm_stage(audio: Path, bgm: Path, mixed: Path, speakers_srt: Optional[Path],
+              speaker_map: str, labels: List[str], bgm_db: float, duck_db: float) -> Path:
+    """ナレーションに BGM を混ぜた WAV を作る。話者区間が無ければナレーションの RMS で duck する"""
+    from .bgm import mix_bgm
+    from .speaker_segments import SpeakerIndex
+
+    speakers = SpeakerIndex.from_notta(speakers_srt, speaker_map, labels) if speakers_srt else None
+    return mix_bgm(audio, bgm, mixed, speakers, bgm_db=bgm_db, duck_db=duck_db)
+
+def build_pipeline(args) -> Pipeline:
+    """
+    Notta SRT 起点のパイプライン:
+      normalize_srt（話者前置きを削った標準SRT）と lipsync（話者ごとの Rhubarb）は独立なので並行実行し、
+      両方が揃ったら render。
+    """
+    audio = Path(args.input)
+    notta_srt = Path(args.transcript)
+    std_srt = notta_srt.with_name(notta_srt.stem + "_std.srt")
+    cast = load_cast(args)
+    labels = [label for label, _, _ in cast]
+    jsons = list(lipsync_paths(cast).values())
+    tool = TOOLS_DIR / "notta_srt_to_lipsync_with_nhubarb.py"
+
+    pl = Pipeline()
+    if args.align:
+        # Whisper の時刻に合わせ直した Notta SRT を、以降の字幕・口パク・話者強調の入力にする
+        from .align import align_notta
+        whisper_json, raw_srt = Path(args.align), notta_srt
+        notta_srt = raw_srt.with_name(raw_srt.stem + "_aligned.srt")
+        pl.add(Stage(
+            "align", lambda: align_notta(raw_srt, whisper_json, notta_srt),
+            inputs=[raw_srt, whisper_json], outputs=[notta_srt],
+        ))
+    pl.add(Stage(
+        "normalize_srt", lambda: normalize_notta_srt(notta_srt, std_srt),
+        inputs=[notta_srt], outputs=[std_srt],
+    ))
+    if args.lipsync == "rms":
+        from .lipsync_rms import write_rms_lipsync
+        pl.add(Stage(
+            "lipsync", lambda: write_rms_lipsync(audio, notta_srt, LIPSYNC_DIR, args.map, speakers=labels),
+            inputs=[audio, notta_srt], outputs=jsons, params={"map": args.map, "engine": "rms"},
+        ))
+    else:
+        pl.add(Stage(
+            "lipsync", lambda: run(
+                [sys.executable, str(tool), "--audio", str(audio), "--srt", str(notta_srt),
+                 "--outdir", str(LIPSYNC_DIR), "--map", args.map, "--labels", ",".join(labels), "--vad"],
+                label="lipsync-tool", wrapper=True),
+            inputs=[audio, notta_srt, tool], outputs=jsons, params={"map": args.map, "vad": True},
+        ))
+    out_path = Path(args.out)
+    burn = args.subs == "burn"
+    # soft / ass-burn では字幕は合成に入れず、字幕なし映像に後から付ける（字幕の修正で再合成しない）
+    video_path = out_path if burn else clean_video_path(out_path)
+    render_audio = audio
+    if args.bgm:
+        # 口パク・字幕はナレーションだけから作り、合成にはBGM入りの1本を渡す
+        bgm, render_audio = Path(args.bgm), bgm_mix_path(out_path)
+        pl.add(Stage(
+            "bgm", lambda: bgm_stage(audio, bgm, render_audio, notta_srt, args.map, labels,
+                                     args.bgm_db, args.duck_db),
+            inputs=[audio, bgm, notta_srt], outputs=[render_audio],
+            params={"map": args.map, "bgm_db": args.bgm_db, "duck_db": args.duck_db},
+        ))
+    render_inputs = [render_audio] + jsons + [d for _, d, _ in cast] + ([std_srt] if burn else [])
+    slides_index = None
+    if args.slides:
+        from .slides import build_slides
+        slides_index = SLIDES_INDEX
+        pl.add(Stage(
+            "slides", lambda: build_slides(std_srt, SLIDES_INDEX),
+            inputs=[std_srt], outputs=[SLIDES_INDEX],
+        ))
+        render_inputs.append(SLIDES_INDEX)
+    if args.emphasis != "none":
+        render_inputs.append(notta_srt)
+    pl.add(Stage(
+        "render", lambda: render_stage(render_audio, cast, video_path, std_srt if burn else None, slides_index,
+                                       notta_srt, args.map, args.emphasis, args.progressive),
+        inputs=render_inputs, outputs=[video_path],
+        params={"emphasis": args.emphasis, "progressive": args.progressive, "cast": [[label, list(off) if off else None] for label, _, off in cast]},
+    ))
+    if not burn:
+        pl.add(Stage(
+            "subtitles", lambda: apply_subtitles(args.subs, video_path, std_srt, out_path),
+            inputs=[video_path, std_srt], outputs=[out_path], params={"mode": args.subs},
+        ))
+    return pl
+
+def dry_run(args) -> bool:
+    """合成に入る前に入力を検証する。MoviePy は読み込まない"""
+    from .validate import (ValidationReport, check_audio, check_binary, check_char_dir,
+                           check_lipsync, check_srt)
+    rep = ValidationReport()
+    dur = check_audio(rep, Path(args.input))
+    try:
+        cast = load_cast(args)
+    except SystemExit as e:
+        rep.error(str(e))
+        cast = []
+    for _, char_dir, _ in cast:
+        check_char_dir(rep, char_dir)
+    if args.stage == "all":
+        if not args.transcript:
+            rep.error("--stage all には --transcript（Notta SRT）が必要です")
+        else:
+            check_srt(rep, Path(args.transcript), dur)
+        if args.align and not Path(args.align).exists():
+            rep.error(f"Whisper JSON がありません: {args.align}")
+        if args.lipsync == "rhubarb":
+            check_binary(rep, "nhubarb", "rhubarb")
+    else:
+        for path in lipsync_paths(cast).values():
+            try:
+                check_lipsync(rep, find_viseme_json(path), dur)
+            except FileNotFoundError as e:
+                rep.error(str(e))
+        if args.transcript:
+            check_srt(rep, Path(args.transcript), dur)
+        if args.emphasis != "none":
+            if not args.speakers:
+                rep.error("--emphasis には --speakers（Notta SRT）が必要です")
+            else:
+                check_srt(rep, Path(args.speakers), dur)
+    if args.bgm:
+        check_audio(rep, Path(args.bgm))
+    check_binary(rep, "ffmpeg")
+    rep.print()
+    return rep.ok
+
+def run_stages(args):
+    if args.stage == "subs":
+        if not args.transcript:
+            raise SystemExit("--stage subs には --transcript（標準SRT）が必要です")
+        clean = clean_video_path(Path(args.out))
+        if not clean.exists():
+            raise SystemExit(f"字幕なし映像がありません: {clean}（先に --subs soft / ass-burn で合成してください）")
+        apply_subtitles("ass-burn" if args.subs == "ass-burn" else "soft", clean, Path(args.transcript), Path(args.out))
+        print(f"[DONE] {args.out}")
+        return
+
+    if args.stage == "all":
+        if not args.transcript:
+            raise SystemExit("--stage all には --transcript（Notta SRT）が必要です")
+        build_pipeline(args).run(force=args.force)
+        print(f"[DONE] {args.out}")
+        return
+
+    audio = Path(args.input)
+    cast = load_cast(args)
+    out_path = Path(args.out)
+    srt_path: Optional[Path] = Path(args.transcript) if args.transcript else None
+
+    # ここでWhisperなどは呼ばない（lipsync JSON は render_stage で charX.json を探す）
+
+    slides_index = None
+    if args.slides:
+        if not srt_path:
+            raise SystemExit("--slides には --transcript（標準SRT）が必要です")
+        from .slides import build_slides
+        slides_index = build_slides(srt_path, SLIDES_INDEX)
+
+    speakers_srt = Path(args.speakers) if args.speakers else None
+    if args.emphasis != "none" and not speakers_srt:
+        raise SystemExit("--emphasis には --speakers（「話者 N」付きの Notta SRT）が必要です")
+    if args.bgm:
+        audio = bgm_stage(audio, Path(args.bgm), bgm_mix_path(out_path), speakers_srt, args.map,
+                          [label for label, _, _ in cast], args.bgm_db, args.duck_db)
+    emph = dict(speakers_srt=speakers_srt, speaker_map=args.map, emphasis=args.emphasis,
+                progressive=args.progressive)
+
+    if srt_path and args.subs != "burn":
+        clean = clean_video_path(out_path)
+        render_stage(audio, cast, clean, None, slides_index, **emph)
+        apply_subtitles(args.subs, clean, srt_path, out_path)
+    else:
+        render_stage(audio, cast, out_path, srt_path, slides_index, **emph)
     print(f"[DONE] {out_path}")
 
+def main():
+    args = parse_args()
+
+    if args.dry_run:
+        raise SystemExit(0 if dry_run(args) else 1)
+    if args.run_log or args.max_procs:
+        configure_run(log=Path(args.run_log) if args.run_log else None,
+                      log_dir=Path(args.run_log).parent / "logs" if args.run_log else None,
+                      max_procs=args.max_procs)
+    try:
+        run_stages(args)
+    finally:
+        if args.run_log and Path(args.run_log).exists():
+            print_run_summary(Path(args.run_log))
+
 if __name__ == "__main__":
     main()
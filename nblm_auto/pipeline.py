@@ -0,0 +1,206 @@
+# nblm_auto/pipeline.py
+"""
+宣言的な DAG パイプライン。
+- 各 Stage は inputs / outputs（ファイル）と params を宣言する
+- 依存関係は「ある Stage の input が別 Stage の output」から自動で引く（after で明示追加も可）
+- 入力ファイルのハッシュ＋params を状態ファイルに記録し、一致して出力も揃っていれば実行をスキップ
+- 依存の無い Stage はスレッドプールで並行実行
+ハッシュはファイルの (size, mtime_ns) をキーにメモ化するので、変更の無い再実行は stat だけで終わる。
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set
+
+
+@dataclass
+class Stage:
+    name: str
+    func: Callable[[], Any]
+    inputs: List[Path] = field(default_factory=list)
+    outputs: List[Path] = field(default_factory=list)
+    params: Dict[str, Any] = field(default_factory=dict)
+    after: List[str] = field(default_factory=list)
+
+
+class PipelineError(RuntimeError):
+    pass
+
+
+class Pipeline:
+    def __init__(self, state_path: Path = Path("data/.pipeline_state.json"), max_workers: int = 4):
+        self.state_path = Path(state_path)
+        self.max_workers = max_workers
+        self.stages: Dict[str, Stage] = {}
+        self._lock = threading.Lock()
+        self._state = self._load_state()
+
+    # ---- 状態ファイル ----
+    def _load_state(self) -> dict:
+        try:
+            state = json.loads(self.state_path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            state = {}
+        state.setdefault("stages", {})
+        state.setdefault("files", {})
+        return state
+
+    def _save_state(self) -> None:
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self._state, ensure_ascii=False, indent=1), encoding="utf-8")
+        os.replace(tmp, self.state_path)
+
+    def _file_digest(self, p: Path) -> str:
+        """内容の sha256。(size, mtime_ns) が前回と同じならメモを返す"""
+        st = p.stat()
+        stamp = [st.st_size, st.st_mtime_ns]
+        key = str(p.resolve())
+        with self._lock:
+            memo = self._state["files"].get(key)
+        if memo and memo[:2] == stamp:
+            return memo[2]
+        h = hashlib.sha256()
+        with open(p, "rb") as f:
+            for buf in iter(lambda: f.read(1 << 20), b""):
+                h.update(buf)
+        digest = h.hexdigest()
+        with self._lock:
+            self._state["files"][key] = stamp + [digest]
+        return digest
+
+    def _path_digest(self, p: Path) -> str:
+        p = Path(p)
+        if p.is_dir():
+            # アセットディレクトリは直下のファイルをまとめてハッシュ
+            parts = [f"{c.name}:{self._file_digest(c)}" for c in sorted(p.iterdir()) if c.is_file()]
+            return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+        return self._file_digest(p)
+
+    def _signature(self, st: Stage) -> str:
+        missing = [str(p) for p in st.inputs if not Path(p).exists()]
+        if missing:
+            raise PipelineError(f"[{st.name}] missing inputs: {', '.join(missing)}")
+        payload = {
+            "params": st.params,
+            "inputs": {str(p): self._path_digest(p) for p in st.inputs},
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def _outputs_stamp(self, st: Stage) -> Optional[List]:
+        stamp = []
+        for p in st.outputs:
+            try:
+                s = Path(p).stat()
+            except FileNotFoundError:
+                return None
+            stamp.append([str(p), s.st_size, s.st_mtime_ns])
+        return stamp
+
+    # ---- グラフ ----
+    def add(self, stage: Stage) -> Stage:
+        if stage.name in self.stages:
+            raise PipelineError(f"duplicate stage: {stage.name}")
+        self.stages[stage.name] = stage
+        return stage
+
+    def deps(self) -> Dict[str, Set[str]]:
+        producer: Dict[str, str] = {}
+        for st in self.stages.values():
+            for p in st.outputs:
+                producer[str(Path(p).resolve())] = st.name
+        out: Dict[str, Set[str]] = {}
+        for st in self.stages.values():
+            d = set(st.after)
+            for p in st.inputs:
+                src = producer.get(str(Path(p).resolve()))
+                if src and src != st.name:
+                    d.add(src)
+            unknown = d - set(self.stages)
+            if unknown:
+                raise PipelineError(f"[{st.name}] unknown dependencies: {', '.join(sorted(unknown))}")
+            out[st.name] = d
+        return out
+
+    def _closure(self, targets: Optional[List[str]], deps: Dict[str, Set[str]]) -> Set[str]:
+        if not targets:
+            return set(self.stages)
+        need: Set[str] = set()
+        todo = list(targets)
+        while todo:
+            n = todo.pop()
+            if n not in self.stages:
+                raise PipelineError(f"unknown stage: {n}")
+            if n not in need:
+                need.add(n)
+                todo.extend(deps[n])
+        return need
+
+    # ---- 実行 ----
+    def _run_stage(self, st: Stage, force: bool) -> str:
+        sig = self._signature(st)
+        with self._lock:
+            prev = self._state["stages"].get(st.name)
+        if not force and prev and prev.get("sig") == sig and prev.get("outputs") == self._outputs_stamp(st):
+            return "skipped"
+        for p in st.outputs:
+            Path(p).parent.mkdir(parents=True, exist_ok=True)
+        t0 = time.perf_counter()
+        st.func()
+        elapsed = time.perf_counter() - t0
+        stamp = self._outputs_stamp(st)
+        if stamp is None:
+            raise PipelineError(f"[{st.name}] did not produce all outputs: {[str(p) for p in st.outputs]}")
+        with self._lock:
+            self._state["stages"][st.name] = {"sig": sig, "outputs": stamp, "elapsed": round(elapsed, 3)}
+            self._save_state()
+        return f"ran ({elapsed:.2f}s)"
+
+    def run(self, targets: Optional[List[str]] = None, force: bool = False) -> Dict[str, str]:
+        """
+        targets（省略時は全 Stage）とその上流を依存順に実行し、{stage: "skipped" | "ran (..s)"} を返す。
+        失敗した Stage の下流は実行せず、最後に PipelineError を送出する。
+        """
+        deps = self.deps()
+        todo = self._closure(targets, deps)
+        done: Dict[str, str] = {}
+        failed: Dict[str, BaseException] = {}
+        running: Dict[Future, str] = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="stage") as pool:
+            while todo or running:
+                # 失敗した Stage の下流を（推移的に）打ち切る
+                skipped = True
+                while skipped:
+                    skipped = False
+                    for n in list(todo):
+                        if deps[n] & set(failed):
+                            todo.discard(n)
+                            failed[n] = PipelineError(f"upstream of {n} failed")
+                            skipped = True
+                ready = [n for n in todo if deps[n] <= set(done)]
+                for n in sorted(ready):
+                    todo.discard(n)
+                    running[pool.submit(self._run_stage, self.stages[n], force)] = n
+                if not running:
+                    if todo:
+                        raise PipelineError(f"dependency cycle among: {', '.join(sorted(todo))}")
+                    break
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    n = running.pop(fut)
+                    try:
+                        done[n] = fut.result()
+                        print(f"[PIPELINE] {n}: {done[n]}")
+                    except BaseException as e:  # noqa: BLE001 - 下流を止めて最後にまとめて報告
+                        failed[n] = e
+                        print(f"[PIPELINE] {n}: FAILED ({e})")
+        if failed:
+            first = next(iter(failed.values()))
+            raise PipelineError(f"failed stages: {', '.join(failed)}") from first
+        return done
@@ -0,0 +1,198 @@
+# nblm_auto/preview.py
+"""
+エンコードせずに、選んだ時刻のフレームだけを合成して確認用の PNG を作る。
+1フレームの絵は「各キャラの本体・口の状態」と「表示中のスライド・字幕」だけで決まるので、
+時刻ごとにこの状態を引き、同じ状態になる時刻は1回だけ合成して使い回す。
+  - 時刻: 字幕の開始（--at subs）/ 話者の切り替わり（--at speakers）/ N 秒ごと（--at every）
+  - 出力: タイルに時刻・話者・字幕のキャプションを付けたコンタクトシート、最初のスライドが出ている時刻のサムネイル
+全編をレンダーしてスクラブする代わりに、数秒で回の見当がつく。
+
+  python -m nblm_auto.preview --input data/tts/mix.wav --transcript data/transcripts/final_std.srt \\
+      --at subs --out data/preview/sheet.png --thumbnail data/preview/thumb.png
+"""
+from __future__ import annotations
+import argparse
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from .slides import FONT_SMALL, _font, load_segments
+
+# 状態の切り替わり直後は口が閉じたままのことが多いので、少し後ろの絵を取る
+LEAD_IN = 0.1
+TILE_W = 480
+CAPTION_H = 56
+SHEET_BG = (24, 24, 32)
+
+
+def times_every(duration: float, every: float) -> List[float]:
+    return [float(t) for t in np.arange(0.0, duration, every)]
+
+
+def times_subs(segments: Sequence[dict], lead_in: float = LEAD_IN) -> List[float]:
+    return [float(s["start"]) + lead_in for s in segments]
+
+
+def times_speakers(speakers, lead_in: float = LEAD_IN) -> List[float]:
+    """話者が前の区間と変わった区間の開始時刻"""
+    if not len(speakers):
+        return []
+    change = np.flatnonzero(np.diff(speakers.codes.astype(np.int16))) + 1
+    starts = speakers.starts[np.concatenate(([0], change))]
+    return [float(t) + lead_in for t in starts]
+
+
+def thin(times: List[float], max_n: Optional[int]) -> List[float]:
+    """多すぎるときは等間隔に間引く"""
+    times = sorted(set(round(t, 3) for t in times))
+    if max_n and len(times) > max_n:
+        idx = np.linspace(0, len(times) - 1, num=max_n).round().astype(int)
+        times = [times[i] for i in idx]
+    return times
+
+
+def frame_state(clip, t: float) -> tuple:
+    """
+    時刻 t の絵を決める状態: キャラのレイヤーは状態キー（render._state_layer の state_at）、
+    それ以外（スライド・字幕）は表示中かどうか。
+    """
+    layers = tuple(c.state_at(t) for c in clip.clips if hasattr(c, "state_at"))
+    others = tuple(i for i, c in enumerate(clip.clips) if not hasattr(c, "state_at") and c.is_playing(t))
+    return layers, others
+
+
+def render_frames(clip, times: Sequence[float]) -> Tuple[List[np.ndarray], int]:
+    """times のフレームを返す。同じ状態の時刻は最初の1回だけ合成する。戻り値の2つ目は合成した枚数"""
+    memo: Dict[tuple, np.ndarray] = {}
+    frames = []
+    for t in times:
+        key = frame_state(clip, t)
+        if key not in memo:
+            memo[key] = clip.get_frame(t)
+        frames.append(memo[key])
+    return frames, len(memo)
+
+
+def _fmt_time(t: float) -> str:
+    m, s = divmod(t, 60)
+    return f"{int(m):02d}:{s:04.1f}"
+
+
+def cue_at(segments: Sequence[dict], starts: np.ndarray, t: float) -> str:
+    k = int(np.searchsorted(starts, t, side="right")) - 1
+    if k >= 0 and t < float(segments[k]["end"]):
+        return str(segments[k]["text"]).replace("\n", " ")
+    return ""
+
+
+def contact_sheet(frames: Sequence[np.ndarray], captions: Sequence[str], out_path: Path,
+                  cols: int = 4, tile_w: int = TILE_W) -> Path:
+    """フレームを縮小して cols 列に並べ、各タイルの下にキャプションを入れる"""
+    h0, w0 = frames[0].shape[:2]
+    tile_h = int(round(h0 * tile_w / w0))
+    rows = (len(frames) + cols - 1) // cols
+    sheet = Image.new("RGB", (cols * tile_w, rows * (tile_h + CAPTION_H)), SHEET_BG)
+    draw = ImageDraw.Draw(sheet)
+    font = _font(FONT_SMALL[0], 18)
+    for i, (frame, cap) in enumerate(zip(frames, captions)):
+        x, y = (i % cols) * tile_w, (i // cols) * (tile_h + CAPTION_H)
+        sheet.paste(Image.fromarray(frame).resize((tile_w, tile_h), Image.BILINEAR), (x, y))
+        # 1行目は時刻と話者、2行目は字幕（長ければ切る）
+        head, _, body = cap.partition("\n")
+        draw.text((x + 8, y + tile_h + 6), head, fill=(220, 220, 220), font=font)
+        draw.text((x + 8, y + tile_h + 30), body[:28], fill=(170, 170, 170), font=font)
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    sheet.save(out_path)
+    return out_path
+
+
+def thumbnail_time(overlays: Optional[List[Tuple[float, float, Path]]], segments: Sequence[dict]) -> float:
+    """最初のスライドが出ている時刻。スライドが無ければ最初の字幕、それも無ければ 0"""
+    if overlays:
+        t0, t1, _ = min(overlays, key=lambda o: o[0])
+        return t0 + min(0.5, (t1 - t0) / 2)
+    if segments:
+        return float(segments[0]["start"]) + LEAD_IN
+    return 0.0
+
+
+def save_thumbnail(clip, t: float, out_path: Path, size: Tuple[int, int] = (1280, 720)) -> Path:
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    Image.fromarray(clip.get_frame(t)).resize(size, Image.LANCZOS).save(out_path)
+    return out_path
+
+
+def main(argv: Optional[List[str]] = None):
+    from .main_dual import SLIDES_INDEX, load_cast, load_timelines
+    from .render import EMPHASIS_MODES, build_cast_clip, cast_layout
+    from .slides import load_slide_overlays
+    from .speaker_segments import SpeakerIndex
+
+    ap = argparse.ArgumentParser(description="Composite frames at chosen timestamps into a contact sheet / thumbnail (no encode)")
+    ap.add_argument("--input", required=True, help="合成に使う音声（長さの基準）")
+    ap.add_argument("--config", default="config.yml")
+    ap.add_argument("--charA")
+    ap.add_argument("--charB")
+    ap.add_argument("--transcript", help="標準SRT（--at subs の時刻とキャプション）")
+    ap.add_argument("--speakers", help="「話者 N」付き Notta SRT（--at speakers と --emphasis）")
+    ap.add_argument("--map", default="1=A,2=B")
+    ap.add_argument("--emphasis", choices=EMPHASIS_MODES, default="none")
+    ap.add_argument("--slides-index", default=str(SLIDES_INDEX), help="スライドの index.json（あれば重ねる）")
+    ap.add_argument("--at", choices=["subs", "speakers", "every"], default="every")
+    ap.add_argument("--every", type=float, default=30.0, help="--at every の間隔（秒）")
+    ap.add_argument("--max", type=int, default=48, help="タイルの上限（超えたら等間隔に間引く）")
+    ap.add_argument("--cols", type=int, default=4)
+    ap.add_argument("--out", default="data/preview/sheet.png")
+    ap.add_argument("--thumbnail", help="最初のスライドが出ている時刻のサムネイル PNG")
+    args = ap.parse_args(argv)
+
+    t_start = time.perf_counter()
+    cast = load_cast(args)
+    labels = [label for label, _, _ in cast]
+    segments = load_segments(Path(args.transcript)) if args.transcript else []
+    speakers = SpeakerIndex.from_notta(args.speakers, args.map, labels) if args.speakers else None
+    if args.at == "subs" and not segments:
+        raise SystemExit("--at subs には --transcript が必要です")
+    if args.at == "speakers" and speakers is None:
+        raise SystemExit("--at speakers には --speakers（Notta SRT）が必要です")
+    overlays = load_slide_overlays(Path(args.slides_index)) if Path(args.slides_index).exists() else None
+
+    clip = build_cast_clip(Path(args.input), cast_layout(load_timelines(cast),
+                                                         {lab: off for lab, _, off in cast if off} or None),
+                           overlays=overlays, speakers=speakers if args.emphasis != "none" else None,
+                           emphasis=args.emphasis)
+    try:
+        if args.at == "subs":
+            times = times_subs(segments)
+        elif args.at == "speakers":
+            times = times_speakers(speakers)
+        else:
+            times = times_every(clip.duration, args.every)
+        times = [t for t in thin(times, args.max) if t < clip.duration]
+        if not times:
+            raise SystemExit("プレビューする時刻がありません")
+
+        frames, unique = render_frames(clip, times)
+        starts = np.array([float(s["start"]) for s in segments])
+        captions = []
+        for t in times:
+            who = speakers.at(t) if speakers is not None else None
+            captions.append(f"{_fmt_time(t)}" + (f"  [{who}]" if who else "") + "\n" + cue_at(segments, starts, t))
+        contact_sheet(frames, captions, Path(args.out), cols=args.cols)
+        print(f"[PREVIEW] {args.out}: {len(times)} tiles ({unique} composited) "
+              f"in {time.perf_counter() - t_start:.2f}s")
+        if args.thumbnail:
+            t = thumbnail_time(overlays, segments)
+            save_thumbnail(clip, t, Path(args.thumbnail))
+            print(f"[PREVIEW] {args.thumbnail} @ {_fmt_time(t)}")
+    finally:
+        clip.close()
+
+
+if __name__ == "__main__":
+    main()
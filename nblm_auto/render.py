@@ -2,22 +2,39 @@
 
 from __future__ import annotations
 
-# Pillow>=10 で削除された Image.ANTIALIAS を MoviePy 用に補う
-try:
-    from PIL import Image as _PILImage
-    if not hasattr(_PILImage, "ANTIALIAS"):
-        # Pillow 10+ では Resampling.LANCZOS が相当
-        from PIL import Image
-        _PILImage.ANTIALIAS = getattr(Image, "LANCZOS", Image.Resampling.LANCZOS)
-except Exception:
-    pass
-
+from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Tuple, Optional
-from moviepy.editor import (
-    AudioFileClip, ImageClip, ColorClip, CompositeVideoClip, TextClip
-)
-import srt
+from typing import TYPE_CHECKING, Callable, Dict, Hashable, Iterable, List, Tuple, Optional
+
+if TYPE_CHECKING:
+    import numpy as np
+    from moviepy.video.VideoClip import ImageClip, TextClip
+    from .speaker_segments import SpeakerIndex
+
+# MoviePy / srt / NumPy は import だけで数百 ms かかるので、合成する関数の中で読み込む。
+# `--help` や `--dry-run` ではこのモジュールを import しても（subtitles 経由でも）これらは読まれない。
+# moviepy.editor は IPython 連携まで引き込むため、必要なサブモジュールだけを直接読む。
+
+@lru_cache(maxsize=None)
+def _mp():
+    """MoviePy の必要なクラスを遅延 import して返す（初回のみ Pillow 互換対策を当てる）"""
+    # Pillow>=10 で削除された Image.ANTIALIAS を MoviePy 用に補う
+    try:
+        from PIL import Image as _PILImage
+        if not hasattr(_PILImage, "ANTIALIAS"):
+            # Pillow 10+ では Resampling.LANCZOS が相当
+            _PILImage.ANTIALIAS = getattr(_PILImage, "LANCZOS", _PILImage.Resampling.LANCZOS)
+    except Exception:
+        pass
+    from types import SimpleNamespace
+    from moviepy.audio.AudioClip import AudioClip
+    from moviepy.video.VideoClip import ColorClip, ImageClip, TextClip, VideoClip
+    from moviepy.video.compositing.CompositeVideoClip import CompositeVideoClip
+    from moviepy.video.fx.resize import resize
+    return SimpleNamespace(AudioClip=AudioClip, ColorClip=ColorClip, ImageClip=ImageClip,
+                           TextClip=TextClip, VideoClip=VideoClip, CompositeVideoClip=CompositeVideoClip,
+                           resize=resize)
 
 W, H = 1920, 1080
 MARGIN = 40
@@ -29,12 +46,58 @@ MOUTH_H = 120   # 仮
 MOUTH_A_OFF = (520, 580)  # baseA の左上から (x, y)
 MOUTH_B_OFF = (520, 580)  # baseB の左上から (x, y)
 
-def _img(path: Path, pos: tuple[int, int], height: Optional[int] = None) -> ImageClip:
-    clip = ImageClip(str(path)).set_position(pos)
+# 話者強調: 話していない側のキャラを暗くする（dim）か、足元を基準に少し縮める（scale）
+EMPHASIS_MODES = ("none", "dim", "scale")
+EMPHASIS_DIM = 0.55
+EMPHASIS_SCALE = 0.92
+
+SUBTITLE_STYLE = dict(fontsize=38, color="white", stroke_color="black", stroke_width=2, method="label")
+# 常駐ワーカーで先にラスタライズしておく字幕（頻出の相槌。フォントの読み込みもここで済む）
+WARM_SUBTITLES = ("うん", "ええ", "はい", "そうですね", "なるほど")
+
+# デコード・リサイズ済みの ImageClip / TextClip をプロセス内で使い回す。
+# set_position / set_start などはコピーを返すので、キャッシュ本体は書き換わらない。
+@lru_cache(maxsize=64)
+def _image_clip(path: str, height: Optional[int] = None) -> ImageClip:
+    mp = _mp()
+    clip = mp.ImageClip(path)
     if height:
-        clip = clip.resize(height=height)
+        clip = clip.fx(mp.resize, height=height)
     return clip
 
+@lru_cache(maxsize=64)
+def _variant_clip(path: str, height: Optional[int], mode: str) -> ImageClip:
+    """
+    非話者用の派生画像。ImageClip の fl_image / resize は生成時に1回だけ画素を変換するので、
+    合成時は通常の静止画と同じコストで済む（毎フレームの色変換にしない）。
+    """
+    clip = _image_clip(path, height)
+    if mode == "dim":
+        return clip.fl_image(lambda im: (im * EMPHASIS_DIM).astype("uint8"))
+    if mode == "scale":
+        return clip.fx(_mp().resize, EMPHASIS_SCALE)
+    raise ValueError(f"unknown emphasis mode: {mode}")
+
+@lru_cache(maxsize=4096)
+def _text_clip(content: str) -> TextClip:
+    # 「うん」「ええ」などの相槌は何度も出るので、同じ文字列のラスタライズは1回で済ませる
+    return _mp().TextClip(content, **SUBTITLE_STYLE)
+
+def warm_assets(char_dirs: Iterable[Path], subtitles: Iterable[str] = ()) -> None:
+    """バッチ／常駐ワーカー用: MoviePy を読み込み、キャラ画像と字幕を先にデコード／ラスタライズしてキャッシュに載せる"""
+    _mp()
+    for d in char_dirs:
+        d = Path(d)
+        _image_clip(str(d / "base.png"), CHAR_H)
+        for name in ("mouth_open.png", "mouth_closed.png"):
+            if (d / name).exists():
+                _image_clip(str(d / name), None)
+    for content in subtitles:
+        _text_clip(content)
+
+def _img(path: Path, pos: tuple[int, int], height: Optional[int] = None) -> ImageClip:
+    return _image_clip(str(path), height).set_position(pos)
+
 def mouth_clips_fast(char_dir: Path, timeline: List[tuple], pos_xy=(0,0), mouth_h: Optional[int] = None) -> List[ImageClip]:
     """
     timeline: [(t0,t1,is_open)] or [(t, is_open)] 両対応
@@ -61,9 +124,152 @@ def mouth_clips_fast(char_dir: Path, timeline: List[tuple], pos_xy=(0,0), mouth_
             clips.append(clip)
     return clips
 
+def _split_by_runs(timeline: List[tuple], runs: List[Tuple[float, float, bool]]) -> List[Tuple[float, float, bool, bool]]:
+    """口の [(t0, t1, is_open)] を話者強調の区切りで切り、[(t0, t1, is_open, active)] にする（両方ソート済み前提）"""
+    out: List[Tuple[float, float, bool, bool]] = []
+    k = 0
+    for seg in timeline:
+        t0, t1, st = seg if len(seg) == 3 else (seg[0], seg[0] + 0.06, seg[1])
+        while k < len(runs) and runs[k][1] <= t0:
+            k += 1
+        j, a = k, t0
+        while a < t1:
+            if j >= len(runs):
+                out.append((a, t1, st, True))
+                break
+            b = min(t1, runs[j][1])
+            if b > a:
+                out.append((a, b, st, runs[j][2]))
+            a = b
+            j += 1
+    return out
+
+@dataclass
+class CastMember:
+    """画面に立つキャラ1人分（ラベル・素材・口タイムライン・配置）"""
+    name: str                  # 話者ラベル（lipsync の charX.json / --map の X）
+    char_dir: Path
+    timeline: List[tuple]      # [(t0, t1, is_open)]
+    base_xy: Tuple[int, int]
+    mouth_xy: Tuple[int, int]
+    char_h: int = CHAR_H
+    mouth_h: Optional[int] = None
+
+def _still(clip: ImageClip) -> Tuple[np.ndarray, np.ndarray]:
+    """ImageClip → (RGB, マスク)。マスクの無い画像は不透明（1）で埋める"""
+    import numpy as np
+    img = clip.get_frame(0)
+    mask = clip.mask.get_frame(0) if clip.mask is not None else np.ones(img.shape[:2])
+    return img, mask
+
+@lru_cache(maxsize=1)
+def _empty():
+    """どの状態でもない時刻に出す 1x1 の透明画像"""
+    import numpy as np
+    return np.zeros((1, 1, 3), dtype=np.uint8), np.zeros((1, 1)), (0, 0)
+
+def _state_layer(runs: List[Tuple[float, float, Hashable]],
+                 stills: Dict[Hashable, Tuple[np.ndarray, np.ndarray, Tuple[int, int]]], duration: float):
+    """
+    [(t0, t1, key)] の区間ごとに stills[key]（画像・マスク・位置）を出す1本のレイヤー。
+    区間ごとに ImageClip を並べると、CompositeVideoClip が毎フレーム全クリップの再生判定を回す（区間数に比例）。
+    ここではキャラ1人の本体・口をそれぞれ1クリップにまとめ、時刻→状態は二分探索で引く。
+    """
+    import numpy as np
+    mp = _mp()
+    empty = _empty()
+    starts = np.array([r[0] for r in runs], dtype=np.float64)
+    ends = np.array([r[1] for r in runs], dtype=np.float64)
+    keys = [r[2] for r in runs]
+
+    def state_at(t):
+        k = int(np.searchsorted(starts, t, side="right")) - 1
+        return keys[k] if k >= 0 and t < ends[k] else None
+
+    def pick(t):
+        key = state_at(t)
+        return empty if key is None else stills[key]
+
+    layer = mp.VideoClip(lambda t: pick(t)[0], duration=duration)
+    layer.mask = mp.VideoClip(lambda t: pick(t)[1], ismask=True, duration=duration)
+    layer = layer.set_position(lambda t: pick(t)[2])
+    layer.state_at = state_at   # プレビューが「同じ絵になる時刻」をまとめるのに使う
+    return layer
+
+def _member_layers(m: CastMember, runs: Optional[List[Tuple[float, float, bool]]], mode: str, duration: float):
+    """
+    キャラ1人の (本体レイヤー, 口レイヤー)。runs（話者強調）の inactive 区間だけ派生画像に差し替える。
+    scale では本体の足元中央を基準に縮めるので、口の位置も同じ基準で寄せる。
+    """
+    base_png = str(m.char_dir / "base.png")
+    open_png, close_png = m.char_dir / "mouth_open.png", m.char_dir / "mouth_closed.png"
+    if not open_png.exists() or not close_png.exists():
+        raise FileNotFoundError(f"mouth PNGs not found under {m.char_dir}")
+    if runs is None or mode == "none":
+        runs = [(0.0, duration, True)]
+
+    full = _image_clip(base_png, m.char_h)
+    ax, ay = m.base_xy[0] + full.w / 2, m.base_xy[1] + full.h
+    s = EMPHASIS_SCALE if mode == "scale" else 1.0
+
+    def _off(xy):
+        return (int(round(ax + (xy[0] - ax) * s)), int(round(ay + (xy[1] - ay) * s)))
+
+    # 画素はキャラごとに1回だけ取り出し、合成中は参照を返すだけ
+    stills: Dict[Hashable, Tuple[np.ndarray, np.ndarray, Tuple[int, int]]] = {}
+    for kind, png, height, xy in (("base", base_png, m.char_h, m.base_xy),
+                                  ("open", str(open_png), m.mouth_h, m.mouth_xy),
+                                  ("close", str(close_png), m.mouth_h, m.mouth_xy)):
+        stills[kind, True] = (*_still(_image_clip(png, height)), xy)
+        if mode != "none":
+            stills[kind, False] = (*_still(_variant_clip(png, height, mode)), _off(xy))
+
+    base = _state_layer([(t0, t1, ("base", act)) for t0, t1, act in runs], stills, duration)
+    mouth = _state_layer([(t0, t1, ("open" if st else "close", act))
+                          for t0, t1, st, act in _split_by_runs(m.timeline, runs)], stills, duration)
+    return base, mouth
+
+def dual_cast(charA_dir: Path, charB_dir: Path, viseme_timeline_A: List[tuple],
+              viseme_timeline_B: List[tuple]) -> List[CastMember]:
+    """従来の2キャラ構図（左 A・右 B）"""
+    # 口パーツがキャラと同サイズなら mouth_h は None（個別PNGを口部分だけにしておく推奨）
+    posA_mouth = (60, 60)              # 左
+    posB_mouth = (W - 60 - 500, 60)    # 右（500px幅想定の画像でバランス）
+    wB = _image_clip(str(charB_dir / "base.png"), CHAR_H).w
+    return [CastMember("A", charA_dir, viseme_timeline_A, (MARGIN, (H - CHAR_H) // 2), posA_mouth),
+            CastMember("B", charB_dir, viseme_timeline_B, (W - wB - MARGIN, (H - CHAR_H) // 2), posB_mouth)]
+
+def cast_layout(entries: List[Tuple[str, Path, List[tuple]]],
+                mouth_offsets: Optional[Dict[str, Tuple[int, int]]] = None) -> List[CastMember]:
+    """
+    [(ラベル, 素材ディレクトリ, 口タイムライン)] を左から順に横一列に並べる。
+    全員が画面幅に収まるよう高さを揃えて縮め（収まるなら CHAR_H のまま）、各自の列の中央・足元揃えに置く。
+    口PNGは base.png と同じ倍率で縮め、mouth_offsets（base.png 上の px。未指定は (0, 0) = 本体と同じキャンバスの口PNG）
+    も同じ倍率で置く。2人で mouth_offsets が無ければ従来の構図（dual_cast）と同じになる。
+    """
+    if len(entries) == 2 and not mouth_offsets:
+        (_, dA, tA), (_, dB, tB) = entries
+        cast = dual_cast(dA, dB, tA, tB)
+        cast[0].name, cast[1].name = entries[0][0], entries[1][0]
+        return cast
+    n = len(entries)
+    widths = [_image_clip(str(d / "base.png"), CHAR_H).w for _, d, _ in entries]
+    char_h = int(CHAR_H * min(1.0, (W - (n + 1) * MARGIN) / max(1, sum(widths))))
+    foot = (H - CHAR_H) // 2 + CHAR_H
+    cast: List[CastMember] = []
+    for i, (name, d, tl) in enumerate(entries):
+        base = _image_clip(str(d / "base.png"), char_h)
+        k = char_h / _image_clip(str(d / "base.png"), None).h   # base.png → 画面の倍率
+        xy = (int(W * (i + 0.5) / n - base.w / 2), foot - char_h)
+        ox, oy = (mouth_offsets or {}).get(name, (0, 0))
+        mouth_h = max(1, int(round(_image_clip(str(d / "mouth_open.png"), None).h * k)))
+        cast.append(CastMember(name, d, tl, xy, (xy[0] + int(ox * k), xy[1] + int(oy * k)), char_h, mouth_h))
+    return cast
+
 def _subtitle_clips(srt_path: Optional[Path], video_w=W) -> List[TextClip]:
     if not srt_path:
         return []
+    import srt
     txt = srt_path.read_text(encoding="utf-8")
     subs = list(srt.parse(txt))
 
@@ -73,70 +279,180 @@ def _subtitle_clips(srt_path: Optional[Path], video_w=W) -> List[TextClip]:
         if not content:
             continue
         # 2行程度で折り返し
-        tclip = (TextClip(content, fontsize=38, color="white", stroke_color="black",
-                          stroke_width=2, method="label")
+        tclip = (_text_clip(content)
                  .set_start(it.start.total_seconds())
                  .set_duration((it.end - it.start).total_seconds())
                  .set_position(("center", H - 100)))
         clips.append(tclip)
     return clips
 
-def render_two_chars_dual(
+def _overlay_clips(overlays: Optional[List[Tuple[float, float, Path]]]) -> List[ImageClip]:
+    """[(t0, t1, png)] を画面上部中央に時間指定で重ねる。同じ PNG のデコードは1回だけ"""
+    clips: List[ImageClip] = []
+    for t0, t1, png in overlays or []:
+        base = _image_clip(str(png), None)
+        clips.append(base.set_position(((W - base.w) // 2, MARGIN))
+                     .set_start(t0).set_duration(max(0.001, t1 - t0)))
+    return clips
+
+def _audio_clip(audio_path: Path):
+    """
+    audio_cache の元レート PCM（memmap）を引くだけの AudioClip。AudioFileClip のように ffmpeg のリーダーを起動しない。
+    AudioFileClip と同じく2チャンネルで返す（モノラルは複製）。threaded 書き出しでは音声はファイルから直接 mux する。
+    """
+    import numpy as np
+    from .audio_cache import decoded
+    dec = decoded(audio_path, sr=None, mono=False)
+    pcm, sr, n = dec.pcm, dec.sr, len(dec.pcm)
+
+    def make_frame(t):
+        idx = np.clip((np.asarray(t) * sr).astype(np.int64), 0, n - 1)
+        f = pcm[idx].astype(np.float32) / 32768.0
+        if f.ndim == np.ndim(t):
+            f = np.stack([f, f], axis=-1)
+        return f
+
+    return _mp().AudioClip(make_frame, duration=n / sr, fps=sr)
+
+def _progress_logger(progress_cb: Optional[Callable[[int, int], None]]):
+    """
+    write_videofile の進捗（フレームバー 't'）を progress_cb(frames_done, frames_total) に流す proglog ロガー。
+    progress_cb が例外を投げると書き出しが中断される（常駐デーモンのキャンセルに使う）。
+    """
+    if progress_cb is None:
+        return None
+    from proglog import ProgressBarLogger
+
+    class _FrameLogger(ProgressBarLogger):
+        def bars_callback(self, bar, attr, value, old_value=None):
+            if bar == "t" and attr == "index":
+                progress_cb(int(value) + 1, int(self.bars[bar].get("total") or 0))
+
+    return _FrameLogger()
+
+def build_cast_clip(
     audio_path: Path,
-    charA_dir: Path,
-    charB_dir: Path,
-    viseme_timeline_A: List[tuple],
-    viseme_timeline_B: List[tuple],
-    out_path: Path,
+    cast: List[CastMember],
     srt_path: Optional[Path] = None,
     bg_color=(16, 16, 24),
-) -> Path:
-    # 構図（必要に応じて調整）
-    char_h = 640   # キャラ全体の高さ
-    mouth_h = None # 口パーツがキャラと同サイズなら None（個別PNGを口部分だけにしておく推奨）
-    posA_base = (60, 60)         # 左
-    posB_base = (W - 60 - 500, 60)  # 右（500px幅想定の画像でバランス）
-
-    audio = AudioFileClip(str(audio_path))
+    overlays: Optional[List[Tuple[float, float, Path]]] = None,
+    speakers: Optional[SpeakerIndex] = None,
+    emphasis: str = "none",
+):
+    """
+    N キャラ構図の CompositeVideoClip（音声付き）を組み立てる。書き出しはしない。
+    各キャラは本体・口の2レイヤーだけなので、1フレームの合成コストは人数に比例する（口の区間数には依らない）。
+    speakers と emphasis（dim / scale）を渡すと、他の人が話している間だけキャラを派生画像に差し替える。
+    """
+    if emphasis not in EMPHASIS_MODES:
+        raise ValueError(f"unknown emphasis mode: {emphasis}")
+    mp = _mp()
+    audio = _audio_clip(audio_path)
     duration = audio.duration
 
     # 背景
-    bg = ColorClip(size=(W, H), color=bg_color).set_duration(duration)
-
-    # キャラ本体
-    baseA = (ImageClip(str(charA_dir / "base.png"))
-        .resize(height=CHAR_H)
-        .set_duration(duration)
-        .set_position((MARGIN, (H - CHAR_H) // 2)))
+    bg = mp.ColorClip(size=(W, H), color=bg_color).set_duration(duration)
 
-    baseB = (ImageClip(str(charB_dir / "base.png"))
-        .resize(height=CHAR_H)
-        .set_duration(duration)
-        .set_position(lambda t: (W - baseB.w - MARGIN, (H - CHAR_H) // 2)))
-
-    # 口パク（すでに mouthA, mouthB は「ImageClip のリスト」）
-    mouthA = mouth_clips_fast(charA_dir, viseme_timeline_A, posA_base, mouth_h)
-    mouthB = mouth_clips_fast(charB_dir, viseme_timeline_B, posB_base, mouth_h)
+    bases, mouths = [], []
+    for m in cast:
+        runs = speakers.emphasis_runs(m.name, FPS, duration) if speakers is not None else None
+        base, mouth = _member_layers(m, runs, emphasis, duration)
+        bases.append(base)
+        mouths.append(mouth)
 
     # 字幕（リスト）
     subs = _subtitle_clips(srt_path)
 
-    # ここ重要：フラットな配列にする
-    clips = [bg, baseA, baseB] + mouthA + mouthB + subs
+    # 数字スライドなどの時間指定オーバーレイ（字幕の下）
+    over = _overlay_clips(overlays)
+
+    # 本体をすべて敷いてから口を重ねる（隣のキャラの本体が口を覆わないように）
+    clips = [bg] + bases + mouths + over + subs
+
+    return mp.CompositeVideoClip(clips, size=(W, H)).set_audio(audio)
 
-    final = CompositeVideoClip(clips, size=(W, H)).set_audio(audio)
+def build_dual_clip(
+    audio_path: Path,
+    charA_dir: Path,
+    charB_dir: Path,
+    viseme_timeline_A: List[tuple],
+    viseme_timeline_B: List[tuple],
+    srt_path: Optional[Path] = None,
+    bg_color=(16, 16, 24),
+    overlays: Optional[List[Tuple[float, float, Path]]] = None,
+    speakers: Optional[SpeakerIndex] = None,
+    emphasis: str = "none",
+):
+    """
+    2キャラ構図の CompositeVideoClip。render_two_chars_dual と、別バックエンドとの一致確認（render_check）で共有する。
+    """
+    return build_cast_clip(audio_path, dual_cast(charA_dir, charB_dir, viseme_timeline_A, viseme_timeline_B),
+                           srt_path=srt_path, bg_color=bg_color, overlays=overlays,
+                           speakers=speakers, emphasis=emphasis)
 
+def write_clip(final, out_path: Path, audio_path: Path,
+               progress_cb: Optional[Callable[[int, int], None]] = None, writer: str = "threaded") -> Path:
+    """
+    writer: threaded（合成とパイプ書き込みを別スレッドで重ねる。encode.py）/ moviepy（write_videofile）/
+            hls・fmp4（threaded で、書きながら再生できる形で出す。encode.progressive_args）
+    書き終えたら（失敗しても）final を閉じる。
+    """
     out_path.parent.mkdir(parents=True, exist_ok=True)
-    final.write_videofile(
-        str(out_path),
-        fps=FPS,
-        codec="libx264",
-        audio_codec="aac",
-        preset="faster",
-        threads=4,
-        verbose=False,
-        logger=None,
-    )
-    audio.close()
-    final.close()
+    try:
+        if writer in ("threaded", "hls", "fmp4"):
+            from .encode import write_clip_threaded
+            write_clip_threaded(final, out_path, FPS, audio_path=audio_path, progress_cb=progress_cb,
+                                progressive=None if writer == "threaded" else writer,
+                                preset="faster", threads=4)
+        elif writer == "moviepy":
+            final.write_videofile(
+                str(out_path),
+                fps=FPS,
+                codec="libx264",
+                audio_codec="aac",
+                preset="faster",
+                threads=4,
+                verbose=False,
+                logger=_progress_logger(progress_cb),
+            )
+        else:
+            raise ValueError(f"unknown writer: {writer}")
+    finally:
+        final.audio.close()
+        final.close()
     return out_path
+
+def render_cast(
+    audio_path: Path,
+    cast: List[CastMember],
+    out_path: Path,
+    srt_path: Optional[Path] = None,
+    bg_color=(16, 16, 24),
+    progress_cb: Optional[Callable[[int, int], None]] = None,
+    overlays: Optional[List[Tuple[float, float, Path]]] = None,
+    writer: str = "threaded",
+    speakers: Optional[SpeakerIndex] = None,
+    emphasis: str = "none",
+) -> Path:
+    final = build_cast_clip(audio_path, cast, srt_path=srt_path, bg_color=bg_color, overlays=overlays,
+                            speakers=speakers, emphasis=emphasis)
+    return write_clip(final, out_path, audio_path, progress_cb, writer)
+
+def render_two_chars_dual(
+    audio_path: Path,
+    charA_dir: Path,
+    charB_dir: Path,
+    viseme_timeline_A: List[tuple],
+    viseme_timeline_B: List[tuple],
+    out_path: Path,
+    srt_path: Optional[Path] = None,
+    bg_color=(16, 16, 24),
+    progress_cb: Optional[Callable[[int, int], None]] = None,
+    overlays: Optional[List[Tuple[float, float, Path]]] = None,
+    writer: str = "threaded",
+    speakers: Optional[SpeakerIndex] = None,
+    emphasis: str = "none",
+) -> Path:
+    return render_cast(audio_path, dual_cast(charA_dir, charB_dir, viseme_timeline_A, viseme_timeline_B),
+                       out_path, srt_path=srt_path, bg_color=bg_color, progress_cb=progress_cb,
+                       overlays=overlays, writer=writer, speakers=speakers, emphasis=emphasis)
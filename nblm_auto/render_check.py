@@ -0,0 +1,393 @@
+# nblm_auto/render_check.py
+"""
+レンダリング・バックエンドの絵の一致確認（回帰テスト用ハーネス）。
+- 短い合成シーン（正弦波の音声・交互に開閉する口・任意で字幕）を作る
+- 基準はリファクタ前の合成経路を固定したもの: 背景・本体・口の区間ごとの ImageClip を平たく並べた
+  CompositeVideoClip（_layered_clip）の生フレーム。今の build_dual_clip もバックエンドの1つとして基準と比べる
+- --golden で基準フレームの SHA-256 を保存／照合できる（素材や MoviePy / Pillow の更新で基準自体がずれていないか）
+- 各バックエンドで同じシーンを描き、サンプリングしたフレームを基準と比較
+    lossless バックエンド（生フレームを返す）… 完全一致（最大差 0）を要求
+    encoded バックエンド（MP4 を書く）     … ffmpeg でデコードして PSNR / SSIM の閾値で判定
+- 不一致フレームは 基準 | 結果 | 差分×8 の PNG を保存し、スループット（fps）と一緒に report.json に残す
+
+  python -m nblm_auto.render_check --backends moviepy-frames,moviepy --seconds 2
+  python -m nblm_auto.render_check --golden data/render_check/golden.json --save-golden   # 基準を固定
+"""
+from __future__ import annotations
+import argparse
+import hashlib
+import json
+import math
+import time
+import wave
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .render import (CHAR_H, FPS, H, MARGIN, W, _image_clip, _mp, _overlay_clips, _subtitle_clips,
+                     build_dual_clip, mouth_clips_fast, render_two_chars_dual)
+from .utils import run
+
+ASSETS = Path(__file__).resolve().parents[1] / "assets" / "characters"
+
+
+@dataclass
+class Scene:
+    audio: Path
+    charA: Path
+    charB: Path
+    timeline_A: List[Tuple[float, float, bool]]
+    timeline_B: List[Tuple[float, float, bool]]
+    seconds: float
+    srt: Optional[Path] = None
+    overlays: Optional[List[Tuple[float, float, Path]]] = None
+
+    @property
+    def n_frames(self) -> int:
+        return int(round(self.seconds * FPS))
+
+
+@dataclass
+class Backend:
+    name: str
+    lossless: bool
+    # lossless: (scene, frame_indices) -> [HxWx3 uint8] / encoded: (scene, out_path) -> out_path
+    fn: Callable
+
+
+BACKENDS: Dict[str, Backend] = {}
+
+
+def register_backend(name: str, lossless: bool):
+    """別の描画経路（パイプ書き出しなど）をこのハーネスに登録するデコレータ"""
+    def deco(fn):
+        BACKENDS[name] = Backend(name, lossless, fn)
+        return fn
+    return deco
+
+
+# ---------------------------------------------------------------------------
+# シーン
+# ---------------------------------------------------------------------------
+
+def _alternating(seconds: float, period: float, phase: float) -> List[Tuple[float, float, bool]]:
+    tl, t, st = [], 0.0, False
+    if phase > 0:
+        tl.append((0.0, phase, False))
+        t = phase
+    while t < seconds:
+        t1 = min(seconds, t + period)
+        st = not st
+        tl.append((round(t, 4), round(t1, 4), st))
+        t = t1
+    return tl
+
+
+def _srt_time(sec: float) -> str:
+    ms = int(round(sec * 1000))
+    return f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d},{ms % 1000:03d}"
+
+
+def make_scene(workdir: Path, seconds: float = 2.0, charA: Path = ASSETS / "charA",
+               charB: Path = ASSETS / "charB", subs: bool = False) -> Scene:
+    workdir = Path(workdir)
+    workdir.mkdir(parents=True, exist_ok=True)
+    sr = 44100
+    t = np.arange(int(sr * seconds)) / sr
+    pcm = (np.sin(2 * np.pi * 220 * t) * 6000).astype(np.int16)
+    audio = workdir / "scene.wav"
+    with wave.open(str(audio), "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sr)
+        wf.writeframes(pcm.tobytes())
+    srt_path = None
+    if subs:
+        srt_path = workdir / "scene.srt"
+        half = seconds / 2
+        srt_path.write_text(f"1\n{_srt_time(0)} --> {_srt_time(half)}\nテスト字幕\n\n"
+                            f"2\n{_srt_time(half)} --> {_srt_time(seconds)}\n2行目\n", encoding="utf-8")
+    # 口の切り替えがフレーム境界と境界の間に来るよう、周期をフレーム長の非整数倍にする
+    return Scene(audio=audio, charA=Path(charA), charB=Path(charB),
+                 timeline_A=_alternating(seconds, 0.23, 0.0), timeline_B=_alternating(seconds, 0.31, 0.11),
+                 seconds=seconds, srt=srt_path)
+
+
+def sample_indices(scene: Scene, n: int = 12) -> List[int]:
+    """等間隔のフレーム＋口が切り替わる直前・直後のフレーム（タイミングずれはここに出る）"""
+    total = scene.n_frames
+    idx = set(np.linspace(0, total - 1, num=min(n, total)).round().astype(int).tolist())
+    for tl in (scene.timeline_A, scene.timeline_B):
+        for t0, _, _ in tl[1:4]:
+            k = int(math.floor(t0 * FPS))
+            idx.update(i for i in (k, k + 1) if 0 <= i < total)
+    return sorted(idx)
+
+
+# ---------------------------------------------------------------------------
+# バックエンド
+# ---------------------------------------------------------------------------
+
+def _layered_clip(scene: Scene, bg_color=(16, 16, 24)):
+    """
+    基準: リファクタ前の build_dual_clip と同じ構図・同じ重ね順の CompositeVideoClip（音声なし）。
+    render 側の合成を変えても動かないよう、配置の数値もここに固定しておく。
+    """
+    mp = _mp()
+    duration = scene.seconds
+    bg = mp.ColorClip(size=(W, H), color=bg_color).set_duration(duration)
+    baseA = (_image_clip(str(scene.charA / "base.png"), CHAR_H)
+             .set_duration(duration).set_position((MARGIN, (H - CHAR_H) // 2)))
+    baseB = _image_clip(str(scene.charB / "base.png"), CHAR_H)
+    baseB = baseB.set_duration(duration).set_position((W - baseB.w - MARGIN, (H - CHAR_H) // 2))
+    mouthA = mouth_clips_fast(scene.charA, scene.timeline_A, (60, 60), None)
+    mouthB = mouth_clips_fast(scene.charB, scene.timeline_B, (W - 60 - 500, 60), None)
+    clips = [bg, baseA, baseB] + mouthA + mouthB + _overlay_clips(scene.overlays) + _subtitle_clips(scene.srt)
+    return mp.CompositeVideoClip(clips, size=(W, H)).set_duration(duration)
+
+
+def reference_frames(scene: Scene, indices: List[int]) -> List[np.ndarray]:
+    clip = _layered_clip(scene)
+    try:
+        return [clip.get_frame(k / FPS).astype(np.uint8) for k in indices]
+    finally:
+        clip.close()
+
+
+def frame_hashes(frames: List[np.ndarray]) -> List[str]:
+    return [hashlib.sha256(np.ascontiguousarray(f).tobytes()).hexdigest() for f in frames]
+
+
+def check_golden(path: Path, scene: Scene, indices: List[int], ref: List[np.ndarray], save: bool = False) -> dict:
+    """
+    基準フレームのハッシュを golden JSON と照合する（save なら書き出す）。
+    シーンの条件（長さ・字幕・フレーム番号）が違う golden とは比べない。
+    """
+    key = {"seconds": scene.seconds, "subs": scene.srt is not None, "frames": indices}
+    hashes = frame_hashes(ref)
+    if save:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(dict(key, sha256=hashes), indent=1), encoding="utf-8")
+        return {"path": str(path), "saved": True, "ok": True}
+    golden = json.loads(path.read_text(encoding="utf-8"))
+    if {k: golden.get(k) for k in key} != key:
+        return {"path": str(path), "ok": False, "error": "scene differs from golden (seconds / subs / frames)"}
+    bad = [k for k, a, b in zip(indices, hashes, golden["sha256"]) if a != b]
+    return {"path": str(path), "ok": not bad, "mismatched_frames": bad}
+
+
+@register_backend("moviepy-frames", lossless=True)
+def _moviepy_frames(scene: Scene, indices: List[int]) -> List[np.ndarray]:
+    # 今の合成経路（キャラごとの状態レイヤー）の生フレーム。基準とは完全一致を要求する
+    clip = build_dual_clip(scene.audio, scene.charA, scene.charB, scene.timeline_A, scene.timeline_B,
+                           srt_path=scene.srt, overlays=scene.overlays)
+    try:
+        return [clip.get_frame(k / FPS).astype(np.uint8) for k in indices]
+    finally:
+        clip.close()
+
+
+@register_backend("moviepy", lossless=False)
+def _moviepy_encode(scene: Scene, out_path: Path) -> Path:
+    return render_two_chars_dual(scene.audio, scene.charA, scene.charB, scene.timeline_A, scene.timeline_B,
+                                 Path(out_path), srt_path=scene.srt, overlays=scene.overlays, writer="moviepy")
+
+
+@register_backend("threaded", lossless=False)
+def _threaded_encode(scene: Scene, out_path: Path) -> Path:
+    return render_two_chars_dual(scene.audio, scene.charA, scene.charB, scene.timeline_A, scene.timeline_B,
+                                 Path(out_path), srt_path=scene.srt, overlays=scene.overlays, writer="threaded")
+
+
+def decode_frames(video: Path, indices: List[int]) -> List[np.ndarray]:
+    """select フィルタで指定フレームだけを rgb24 で取り出す（ffmpeg 1回）"""
+    expr = "+".join(f"eq(n\\,{k})" for k in indices)
+    res = run(["ffmpeg", "-v", "error", "-i", str(video), "-vf", f"select='{expr}'", "-vsync", "0",
+               "-f", "rawvideo", "-pix_fmt", "rgb24", "-"], label="ffmpeg-decode", capture=True, echo=False)
+    buf = np.frombuffer(res.stdout, dtype=np.uint8)
+    n = len(buf) // (W * H * 3)
+    frames = buf[: n * W * H * 3].reshape(n, H, W, 3)
+    return [frames[i] for i in range(n)]
+
+
+# ---------------------------------------------------------------------------
+# 比較
+# ---------------------------------------------------------------------------
+
+def psnr(a: np.ndarray, b: np.ndarray) -> float:
+    mse = float(np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2))
+    return float("inf") if mse == 0 else 10.0 * math.log10(255.0 ** 2 / mse)
+
+
+def _box_mean(x: np.ndarray, k: int) -> np.ndarray:
+    """k×k の移動平均（積分画像、valid 領域のみ）"""
+    c = np.cumsum(np.cumsum(np.pad(x, ((1, 0), (1, 0))), axis=0), axis=1)
+    return (c[k:, k:] - c[:-k, k:] - c[k:, :-k] + c[:-k, :-k]) / (k * k)
+
+
+def ssim(a: np.ndarray, b: np.ndarray, k: int = 8) -> float:
+    """輝度の SSIM（k×k の一様窓）"""
+    coef = np.array([0.299, 0.587, 0.114])
+    x = a.astype(np.float64) @ coef
+    y = b.astype(np.float64) @ coef
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    mx, my = _box_mean(x, k), _box_mean(y, k)
+    sxx = _box_mean(x * x, k) - mx * mx
+    syy = _box_mean(y * y, k) - my * my
+    sxy = _box_mean(x * y, k) - mx * my
+    s = ((2 * mx * my + c1) * (2 * sxy + c2)) / ((mx * mx + my * my + c1) * (sxx + syy + c2))
+    return float(s.mean())
+
+
+def save_diff(ref: np.ndarray, got: np.ndarray, path: Path) -> Path:
+    from PIL import Image
+    diff = np.clip(np.abs(ref.astype(np.int16) - got.astype(np.int16)) * 8, 0, 255).astype(np.uint8)
+    strip = np.concatenate([ref, got, diff], axis=1)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.fromarray(strip).resize((strip.shape[1] // 2, strip.shape[0] // 2)).save(path)
+    return path
+
+
+@dataclass
+class Thresholds:
+    min_psnr: float = 35.0
+    min_ssim: float = 0.97
+
+
+@dataclass
+class BackendResult:
+    backend: str
+    lossless: bool
+    seconds: float
+    fps: float
+    frames_checked: int
+    mismatches: List[dict] = field(default_factory=list)
+    min_psnr: Optional[float] = None
+    min_ssim: Optional[float] = None
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and not self.mismatches
+
+
+def check_backend(backend: Backend, scene: Scene, indices: List[int], ref: List[np.ndarray],
+                  out_dir: Path, th: Thresholds) -> BackendResult:
+    t0 = time.perf_counter()
+    try:
+        if backend.lossless:
+            got = backend.fn(scene, indices)
+            n_rendered = len(indices)
+        else:
+            video = backend.fn(scene, out_dir / f"{backend.name}.mp4")
+            n_rendered = scene.n_frames
+        sec = time.perf_counter() - t0
+        if not backend.lossless:
+            got = decode_frames(video, indices)
+    except Exception as e:  # noqa: BLE001 - 1つのバックエンドの失敗でレポート全体を止めない
+        return BackendResult(backend.name, backend.lossless, round(time.perf_counter() - t0, 3), 0.0, 0,
+                             error=f"{type(e).__name__}: {e}")
+    res = BackendResult(backend.name, backend.lossless, round(sec, 3), round(n_rendered / sec, 2) if sec else 0.0,
+                        len(got))
+    if len(got) != len(ref):
+        res.error = f"decoded {len(got)} frames, expected {len(ref)}"
+        return res
+    psnrs, ssims = [], []
+    for k, a, b in zip(indices, ref, got):
+        if a.shape != b.shape:
+            res.mismatches.append({"frame": k, "reason": f"shape {b.shape} != {a.shape}"})
+            continue
+        maxabs = int(np.abs(a.astype(np.int16) - b.astype(np.int16)).max())
+        p = psnr(a, b)
+        psnrs.append(p)
+        if backend.lossless:
+            bad = maxabs != 0
+            s = 1.0 if not bad else ssim(a, b)
+        else:
+            s = ssim(a, b)
+            bad = p < th.min_psnr or s < th.min_ssim
+        ssims.append(s)
+        if bad:
+            png = save_diff(a, b, out_dir / "diff" / f"{backend.name}_{k:05d}.png")
+            res.mismatches.append({"frame": k, "t": round(k / FPS, 4), "max_abs": maxabs,
+                                   "psnr": round(p, 2), "ssim": round(s, 4), "diff_png": str(png)})
+    res.min_psnr = round(min(psnrs), 2) if psnrs else None
+    res.min_ssim = round(min(ssims), 4) if ssims else None
+    return res
+
+
+def run_check(backends: List[str], out_dir: Path, seconds: float = 2.0, samples: int = 12,
+              subs: bool = False, th: Thresholds = Thresholds(), golden: Optional[Path] = None,
+              save_golden: bool = False) -> dict:
+    out_dir = Path(out_dir)
+    unknown = [b for b in backends if b not in BACKENDS]
+    if unknown:
+        raise ValueError(f"unknown backends: {', '.join(unknown)} (choices: {', '.join(BACKENDS)})")
+    scene = make_scene(out_dir / "scene", seconds=seconds, subs=subs)
+    indices = sample_indices(scene, samples)
+    t0 = time.perf_counter()
+    ref = reference_frames(scene, indices)
+    ref_sec = time.perf_counter() - t0
+    results = [check_backend(BACKENDS[b], scene, indices, ref, out_dir, th) for b in backends]
+    report = {
+        "scene": {"seconds": seconds, "fps": FPS, "size": [W, H], "subs": subs, "frames": indices},
+        "thresholds": {"min_psnr": th.min_psnr, "min_ssim": th.min_ssim},
+        "reference": {"backend": "layered", "seconds": round(ref_sec, 3),
+                      "fps": round(len(indices) / ref_sec, 2) if ref_sec else 0.0,
+                      "golden": check_golden(Path(golden), scene, indices, ref, save_golden) if golden else None},
+        "results": [dict(r.__dict__, ok=r.ok) for r in results],
+    }
+    (out_dir / "report.json").write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    return report
+
+
+def print_report(report: dict) -> None:
+    print(f"\n=== render check ({report['scene']['seconds']}s @ {report['scene']['fps']}fps, "
+          f"{len(report['scene']['frames'])} frames sampled) ===")
+    g = report["reference"].get("golden")
+    if g:
+        state = "saved" if g.get("saved") else ("OK" if g["ok"] else
+                                                 "MISMATCH " + (g.get("error") or str(g["mismatched_frames"])))
+        print(f"  reference (layered) vs golden {g['path']}: {state}")
+    print(f"  {'backend':<18}{'mode':<10}{'sec':>8}{'fps':>8}{'minPSNR':>9}{'minSSIM':>9}{'bad':>5}  result")
+    for r in report["results"]:
+        mode = "lossless" if r["lossless"] else "encoded"
+        mp = "-" if r["min_psnr"] is None else ("inf" if r["min_psnr"] == float("inf") else f"{r['min_psnr']:.1f}")
+        ms = "-" if r["min_ssim"] is None else f"{r['min_ssim']:.4f}"
+        status = "OK" if r["ok"] else ("ERROR " + r["error"] if r["error"] else "MISMATCH")
+        print(f"  {r['backend']:<18}{mode:<10}{r['seconds']:>8.2f}{r['fps']:>8.1f}{mp:>9}{ms:>9}"
+              f"{len(r['mismatches']):>5}  {status}")
+        for m in r["mismatches"][:5]:
+            print(f"      frame {m['frame']}: {m.get('reason') or m['diff_png']}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Compare render backends frame-by-frame against the layered MoviePy reference")
+    ap.add_argument("--backends", default=",".join(BACKENDS), help=f"カンマ区切り（{', '.join(BACKENDS)}）")
+    ap.add_argument("--out", default="data/render_check")
+    ap.add_argument("--seconds", type=float, default=2.0)
+    ap.add_argument("--samples", type=int, default=12)
+    ap.add_argument("--subs", action="store_true", help="字幕も描く（ImageMagick が必要）")
+    ap.add_argument("--min-psnr", type=float, default=Thresholds.min_psnr)
+    ap.add_argument("--min-ssim", type=float, default=Thresholds.min_ssim)
+    ap.add_argument("--golden", help="基準フレームのハッシュ JSON（照合。--save-golden なら書き出し）")
+    ap.add_argument("--save-golden", action="store_true")
+    args = ap.parse_args()
+    if args.save_golden and not args.golden:
+        ap.error("--save-golden needs --golden PATH")
+
+    report = run_check([b.strip() for b in args.backends.split(",") if b.strip()], Path(args.out),
+                       seconds=args.seconds, samples=args.samples, subs=args.subs,
+                       th=Thresholds(args.min_psnr, args.min_ssim), golden=args.golden,
+                       save_golden=args.save_golden)
+    print_report(report)
+    print(f"[REPORT] {Path(args.out) / 'report.json'}")
+    g = report["reference"]["golden"]
+    if not all(r["ok"] for r in report["results"]) or (g and not g["ok"]):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
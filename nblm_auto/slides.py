@@ -1,26 +1,146 @@
 from __future__ import annotations
+import hashlib
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
 from PIL import Image, ImageDraw, ImageFont
-import re
+
+NUMBER_RE = re.compile(r"[0-9][0-9,\.]*\s*[万億]?[人件個回％%年度]?")
+
+FONT_BIG = ("NotoSansJP-Bold.otf", 220)
+FONT_SMALL = ("NotoSansJP-Regular.otf", 64)
+SUBTITLE = "（NotebookLM要約から自動抽出）"
+# 見た目を変えたらここを上げる（ディスクキャッシュのキーに入る）
+SLIDE_STYLE_VERSION = 1
 
 def extract_big_numbers(text: str) -> list[str]:
-    cand = re.findall(r"[0-9][0-9,\.]*\s*[万億]?[人件個回％%年度]?", text)
+    cand = NUMBER_RE.findall(text)
     return list(dict.fromkeys([c.strip() for c in cand]))
 
+@lru_cache(maxsize=16)
+def _font(name: str, size: int):
+    # truetype の読み込みはスライド1枚の描画より重いので、プロセス内で1回だけ
+    try:
+        return ImageFont.truetype(name, size)
+    except OSError:
+        return ImageFont.load_default()
+
 def make_number_slide(number_text: str, out_path: Path, size=(1920,1080)):
     W,H = size
+    # 既定の 1920x1080 を基準に文字サイズをスケール
+    scale = H / 1080
     img = Image.new("RGB", size, (20,20,28))
     draw = ImageDraw.Draw(img)
-    try:
-        font_big = ImageFont.truetype("NotoSansJP-Bold.otf", 220)
-        font_small = ImageFont.truetype("NotoSansJP-Regular.otf", 64)
-    except:
-        font_big = ImageFont.load_default()
-        font_small = ImageFont.load_default()
+    font_big = _font(FONT_BIG[0], max(1, int(FONT_BIG[1] * scale)))
+    font_small = _font(FONT_SMALL[0], max(1, int(FONT_SMALL[1] * scale)))
     w,h = draw.textbbox((0,0), number_text, font=font_big)[2:4]
-    draw.text(((W-w)//2, (H-h)//2 - 60), number_text, font=font_big, fill=(240,240,255))
-    sub = "（NotebookLM要約から自動抽出）"
-    w2,h2 = draw.textbbox((0,0), sub, font=font_small)[2:4]
-    draw.text(((W-w2)//2, (H-h2)//2 + 180), sub, font=font_small, fill=(180,180,200))
-    img.save(out_path)
+    draw.text(((W-w)//2, (H-h)//2 - int(60 * scale)), number_text, font=font_big, fill=(240,240,255))
+    w2,h2 = draw.textbbox((0,0), SUBTITLE, font=font_small)[2:4]
+    draw.text(((W-w2)//2, (H-h2)//2 + int(180 * scale)), SUBTITLE, font=font_small, fill=(180,180,200))
+    # 並列描画中に半端な PNG を読まれないよう、一時ファイルに書いてから置き換える
+    out_path = Path(out_path)
+    tmp = out_path.with_name(f".{out_path.name}.{os.getpid()}.tmp")
+    img.save(tmp, format="PNG")
+    os.replace(tmp, out_path)
+    return out_path
+
+# ---------------------------------------------------------------------------
+# 書き起こし → 数字スライドのタイムライン
+# ---------------------------------------------------------------------------
+
+@dataclass
+class SlideCue:
+    start: float
+    end: float
+    text: str
+    path: Optional[Path] = None
+
+def load_segments(path: Path) -> List[dict]:
+    """書き起こし JSON（{"segments": [...]}）または標準 SRT を [{"start","end","text"}] にする"""
+    path = Path(path)
+    if path.suffix.lower() == ".json":
+        data = json.loads(path.read_text(encoding="utf-8"))
+        return [{"start": float(s["start"]), "end": float(s["end"]), "text": s["text"]}
+                for s in data.get("segments", [])]
+    import srt
+    return [{"start": it.start.total_seconds(), "end": it.end.total_seconds(), "text": it.content}
+            for it in srt.parse(path.read_text(encoding="utf-8"))]
+
+def index_numbers(segments: Iterable[dict], hold: float = 3.0, min_len: int = 2) -> List[SlideCue]:
+    """
+    セグメントを1回だけ走査し、抽出した数字ごとに表示区間を決める。
+    - 表示開始はセグメント内の文字位置から線形に見積もる
+    - 直前に出した同じ数字の表示中に再登場したものは出さない
+    - 区間は次のスライドの開始で打ち切る（重ならない）
+    """
+    cues: List[SlideCue] = []
+    for seg in segments:
+        text = seg["text"]
+        t0, t1 = float(seg["start"]), float(seg["end"])
+        n = max(1, len(text))
+        for m in NUMBER_RE.finditer(text):
+            num = m.group().strip()
+            if len(num) < min_len:
+                continue
+            at = t0 + (t1 - t0) * m.start() / n
+            if cues and cues[-1].text == num and at < cues[-1].end:
+                continue
+            cues.append(SlideCue(at, at + hold, num))
+    cues.sort(key=lambda c: c.start)
+    for a, b in zip(cues, cues[1:]):
+        a.end = min(a.end, b.start)
+    return [c for c in cues if c.end > c.start]
+
+def slide_key(number_text: str, size: Tuple[int, int]) -> str:
+    payload = json.dumps([SLIDE_STYLE_VERSION, number_text, list(size), FONT_BIG, FONT_SMALL, SUBTITLE],
+                         ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:24]
+
+def _render_one(args: Tuple[str, str, Tuple[int, int]]) -> str:
+    number_text, out_path, size = args
+    make_number_slide(number_text, Path(out_path), size)
     return out_path
+
+def render_slides(cues: List[SlideCue], cache_dir: Path, size=(960, 540), workers: int = 4) -> List[SlideCue]:
+    """
+    同じ文字列のスライドは1枚だけ、内容ハッシュ名でキャッシュに描画する（既にあれば描かない）。
+    描画はプロセスプールで並列に行い、各ワーカーはフォントを1回だけ読む。
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    paths: Dict[str, Path] = {c.text: cache_dir / f"{slide_key(c.text, size)}.png" for c in cues}
+    todo = [(text, str(p), tuple(size)) for text, p in paths.items() if not p.exists()]
+    if len(todo) > 1 and workers > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(todo))) as pool:
+            list(pool.map(_render_one, todo))
+    else:
+        for job in todo:
+            _render_one(job)
+    for c in cues:
+        c.path = paths[c.text]
+    return cues
+
+def write_slide_index(cues: List[SlideCue], out_json: Path) -> Path:
+    out_json = Path(out_json)
+    out_json.parent.mkdir(parents=True, exist_ok=True)
+    out_json.write_text(json.dumps(
+        [{"start": round(c.start, 3), "end": round(c.end, 3), "text": c.text, "path": str(c.path)} for c in cues],
+        ensure_ascii=False, indent=1), encoding="utf-8")
+    return out_json
+
+def load_slide_overlays(index_json: Path) -> List[Tuple[float, float, Path]]:
+    """render_two_chars_dual(overlays=...) に渡す [(t0, t1, png)]"""
+    data = json.loads(Path(index_json).read_text(encoding="utf-8"))
+    return [(float(d["start"]), float(d["end"]), Path(d["path"])) for d in data]
+
+def build_slides(transcript: Path, out_json: Path, cache_dir: Path = Path("data/cache/slides"),
+                 size=(960, 540), hold: float = 3.0, workers: int = 4) -> Path:
+    cues = index_numbers(load_segments(transcript), hold=hold)
+    render_slides(cues, cache_dir, size=size, workers=workers)
+    print(f"[SLIDES] {len(cues)} cues, {len({c.text for c in cues})} unique -> {out_json}")
+    return write_slide_index(cues, out_json)
@@ -1,14 +1,171 @@
 # nblm_auto/speaker_segments.py
 from __future__ import annotations
+import heapq
+import re
 from dataclasses import dataclass
-from typing import List, Tuple
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
 
 @dataclass
 class Segment:
     start: float
     end: float
-    speaker: str  # "A" / "B"
+    speaker: str  # キャラのラベル（"A" / "B" / ...）
 
 def dummy_single_speaker(total_dur: float) -> List[Segment]:
     # 使わない想定（NotebookLMの単一音声を前提）
     return [Segment(0.0, total_dur, "A")]
+
+NOTTA_LINE = re.compile(
+    r"^\s*話者\s*(\d+)\s+(\d{2}:\d{2}:\d{2},\d{3})\s*-->\s*(\d{2}:\d{2}:\d{2},\d{3})\s*$"
+)
+
+def to_ms(t):
+    h, m, s_ms = t.split(":")
+    s, ms = s_ms.split(",")
+    return (int(h)*3600 + int(m)*60 + int(s))*1000 + int(ms)
+
+def parse_notta_srt(path):
+    """Notta の「話者 N 00:00:00,000 --> ...」形式 SRT を [{speaker, start_ms, end_ms, text}] にする"""
+    txt = Path(path).read_text(encoding="utf-8")
+    lines = txt.splitlines()
+    i, n = 0, len(lines)
+    segs = []
+    while i < n:
+        # 数字だけのインデックス行をスキップ
+        if re.match(r"^\s*\d+\s*$", lines[i]):
+            i += 1
+            if i >= n: break
+        m = NOTTA_LINE.match(lines[i])
+        if not m:
+            i += 1
+            continue
+        spk, start, end = m.group(1), m.group(2), m.group(3)
+        i += 1
+        buf = []
+        while i < n and lines[i].strip() != "":
+            buf.append(lines[i].strip())
+            i += 1
+        # 空行スキップ
+        while i < n and lines[i].strip() == "":
+            i += 1
+        text = " ".join(buf).strip()
+        if text:
+            segs.append({
+                "speaker": spk,
+                "start_ms": to_ms(start),
+                "end_ms": to_ms(end),
+                "text": text
+            })
+    return segs
+
+def parse_speaker_map(spec: str, labels: Iterable[str] = ("A", "B")) -> Dict[str, str]:
+    """'1=A,2=B' → {"1": "A", "2": "B"}。labels は割り当て先のキャラ（config の charX の X）"""
+    labels = tuple(labels)
+    m = {}
+    for kv in spec.split(","):
+        k, v = kv.split("=")
+        m[k.strip()] = v.strip().upper()
+    if not all(v in labels for v in m.values()):
+        raise ValueError(f"--map は {'/'.join(labels)} に割り当ててください（例: 1=A,2=B）")
+    return m
+
+def notta_segments(path, speaker_map: str = "1=A,2=B", labels: Iterable[str] = ("A", "B")) -> List[Segment]:
+    """Notta SRT → キャラ付き Segment。対応表に無い話者は先頭のキャラ扱い（ツールと同じ）"""
+    labels = tuple(labels)
+    m = parse_speaker_map(speaker_map, labels)
+    return [Segment(e["start_ms"] / 1000.0, e["end_ms"] / 1000.0, m.get(e["speaker"], labels[0]))
+            for e in parse_notta_srt(path) if e["end_ms"] > e["start_ms"]]
+
+def spans_by_speaker(segments: List[Segment]) -> Dict[str, List[Tuple[float, float]]]:
+    out: Dict[str, List[Tuple[float, float]]] = {}
+    for s in segments:
+        out.setdefault(s.speaker, []).append((s.start, s.end))
+    return out
+
+class SpeakerIndex:
+    """
+    話者区間のソート済みインデックス。開始・終了は float64 配列、話者は int8 コードで持つ。
+    at(t) は二分探索で O(log n)、frame_speakers() は全フレームをまとめて searchsorted する。
+    区間が重なったときは後から始まった方を優先する（短い区間が長い区間の中にあれば、終わった後は長い方に戻る）。
+    構築時に重なりをこの規則で平らにし、互いに重ならない区間列として持つので、検索は直前の1区間を見るだけで済む。
+    """
+
+    def __init__(self, segments: List[Segment]):
+        segs = sorted((s for s in segments if s.end > s.start), key=lambda s: (s.start, s.end))
+        self.labels: List[str] = sorted({s.speaker for s in segs})
+        code = {lab: i for i, lab in enumerate(self.labels)}
+        flat: List[list] = []
+        active: List[Tuple[int, float, int]] = []   # (-開始順, 終了, 話者コード)。先頭が最後に始まった区間
+        bounds = sorted({s.start for s in segs} | {s.end for s in segs})
+        j = 0
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            while j < len(segs) and segs[j].start <= a:
+                heapq.heappush(active, (-j, segs[j].end, code[segs[j].speaker]))
+                j += 1
+            while active and active[0][1] <= a:
+                heapq.heappop(active)   # 終わった区間は先頭に来たときだけ捨てれば足りる
+            if not active:
+                continue
+            c = active[0][2]
+            if flat and flat[-1][1] == a and flat[-1][2] == c:
+                flat[-1][1] = b
+            else:
+                flat.append([a, b, c])
+        self.starts = np.array([f[0] for f in flat], dtype=np.float64)
+        self.ends = np.array([f[1] for f in flat], dtype=np.float64)
+        self.codes = np.array([f[2] for f in flat], dtype=np.int8)
+
+    @classmethod
+    def from_notta(cls, path, speaker_map: str = "1=A,2=B",
+                   labels: Iterable[str] = ("A", "B")) -> "SpeakerIndex":
+        return cls(notta_segments(path, speaker_map, labels))
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def code_of(self, who: str) -> int:
+        return self.labels.index(who) if who in self.labels else -1
+
+    def at(self, t: float) -> Optional[str]:
+        """時刻 t に話している話者（いなければ None）"""
+        k = int(np.searchsorted(self.starts, t, side="right")) - 1
+        if k >= 0 and t < self.ends[k]:
+            return self.labels[self.codes[k]]
+        return None
+
+    def frame_speakers(self, fps: float, n_frames: int, hold: float = 0.0) -> np.ndarray:
+        """
+        各フレーム時刻（k / fps）の話者コード（無音は -1）。
+        hold 秒未満の無音は直前の話者で埋める（話者交代の合間に強調が戻ってチラつくのを防ぐ）。
+        """
+        if not len(self):
+            return np.full(n_frames, -1, dtype=np.int8)
+        t = np.arange(n_frames, dtype=np.float64) / fps
+        k = np.searchsorted(self.starts, t, side="right") - 1
+        kc = np.maximum(k, 0)
+        spk = np.where((k >= 0) & (t < self.ends[kc]), self.codes[kc], -1).astype(np.int8)
+        if hold > 0 and n_frames:
+            silent = np.concatenate(([0], (spk < 0).astype(np.int8), [0]))
+            edges = np.diff(silent)
+            for a, b in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)):
+                if a > 0 and b < n_frames and (b - a) < hold * fps:
+                    spk[a:b] = spk[a - 1]
+        return spk
+
+    def emphasis_runs(self, who: str, fps: float, duration: float,
+                      hold: float = 0.6) -> List[Tuple[float, float, bool]]:
+        """
+        キャラ who の [(t0, t1, active)]。他の話者が話している間だけ inactive、
+        無音（誰も話していない）のあいだは active のまま。
+        """
+        n = int(np.ceil(duration * fps))
+        if n <= 0:
+            return []
+        spk = self.frame_speakers(fps, n, hold)
+        active = (spk == self.code_of(who)) | (spk < 0)
+        change = np.flatnonzero(np.diff(active.astype(np.int8))) + 1
+        bounds = np.concatenate(([0], change, [n]))
+        return [(a / fps, min(b / fps, duration), bool(active[a])) for a, b in zip(bounds[:-1], bounds[1:])]
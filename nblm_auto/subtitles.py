@@ -0,0 +1,125 @@
+# nblm_auto/subtitles.py
+"""
+字幕を映像レイヤーとして焼かず、別ストリームとして扱う。
+- SRT → スタイル付き ASS（render.SUBTITLE_STYLE と同じ見た目: 白文字・黒縁・下中央）
+- 字幕なしで合成した映像に、映像を再エンコードせず mux（MP4/MOV は mov_text、MKV は ASS のまま）
+- 配信先が焼き込み必須のときは ffmpeg の ass フィルタで焼く（MoviePy の TextClip より桁違いに速い）
+字幕だけ直したときは mux をやり直すだけで済む（数秒）。
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Optional
+
+from .render import H, SUBTITLE_STYLE, W
+from .utils import run
+
+ASS_HEADER = """[Script Info]
+ScriptType: v4.00+
+PlayResX: {w}
+PlayResY: {h}
+WrapStyle: 0
+ScaledBorderAndShadow: yes
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+Style: Default,{font},{size},{primary},&H000000FF,{outline_colour},&H00000000,0,0,0,0,100,100,0,0,1,{outline},0,2,60,60,{margin_v},1
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+"""
+
+# MoviePy 版の字幕は上端を H-100 に置いているので、下端からの余白はおよそこの値
+MARGIN_V = 55
+SOFT_CODECS = {".mp4": "mov_text", ".m4v": "mov_text", ".mov": "mov_text", ".mkv": "ass"}
+
+_NAMED_COLOURS = {"white": (255, 255, 255), "black": (0, 0, 0), "yellow": (255, 255, 0)}
+
+
+def _ass_colour(name: str) -> str:
+    # ASS は &HAABBGGRR
+    r, g, b = _NAMED_COLOURS.get(name, (255, 255, 255))
+    return f"&H00{b:02X}{g:02X}{r:02X}"
+
+
+def _ass_time(sec: float) -> str:
+    cs = max(0, int(round(sec * 100)))
+    h, cs = divmod(cs, 360000)
+    m, cs = divmod(cs, 6000)
+    s, cs = divmod(cs, 100)
+    return f"{h}:{m:02d}:{s:02d}.{cs:02d}"
+
+
+def _ass_text(text: str) -> str:
+    # 波括弧はオーバーライドタグの開始になるので全角に逃がす
+    text = text.strip().replace("{", "｛").replace("}", "｝")
+    return "\\N".join(line.strip() for line in text.splitlines() if line.strip())
+
+
+def srt_to_ass(srt_path: Path, ass_path: Path, font: str = "Noto Sans JP") -> Path:
+    import srt
+    subs = list(srt.parse(Path(srt_path).read_text(encoding="utf-8")))
+    lines = [ASS_HEADER.format(
+        w=W, h=H, font=font, size=SUBTITLE_STYLE["fontsize"],
+        primary=_ass_colour(SUBTITLE_STYLE["color"]),
+        outline_colour=_ass_colour(SUBTITLE_STYLE["stroke_color"]),
+        outline=SUBTITLE_STYLE["stroke_width"], margin_v=MARGIN_V,
+    )]
+    for it in subs:
+        text = _ass_text(it.content)
+        if not text:
+            continue
+        lines.append(f"Dialogue: 0,{_ass_time(it.start.total_seconds())},{_ass_time(it.end.total_seconds())},"
+                     f"Default,,0,0,0,,{text}\n")
+    ass_path = Path(ass_path)
+    ass_path.parent.mkdir(parents=True, exist_ok=True)
+    ass_path.write_text("".join(lines), encoding="utf-8")
+    return ass_path
+
+
+def mux_subtitles(video: Path, subs: Path, out_path: Path, codec: Optional[str] = None,
+                  language: str = "jpn") -> Path:
+    """映像・音声はコピーのまま字幕ストリームを足す（既存の字幕ストリームは捨てる）"""
+    out_path = Path(out_path)
+    codec = codec or SOFT_CODECS.get(out_path.suffix.lower())
+    if codec is None:
+        raise ValueError(f"soft subtitles need .mp4/.mov/.mkv output: {out_path}")
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    run(["ffmpeg", "-v", "error", "-y", "-i", str(video), "-i", str(subs),
+         "-map", "0:v", "-map", "0:a?", "-map", "1:0",
+         "-c", "copy", "-c:s", codec, "-metadata:s:s:0", f"language={language}",
+         "-disposition:s:0", "default", str(out_path)], label="ffmpeg-mux")
+    return out_path
+
+
+def _filter_path(p: Path) -> str:
+    # フィルタ引数内では \ : ' がメタ文字
+    s = str(Path(p).resolve()).replace("\\", "/")
+    return s.replace(":", "\\:").replace("'", "\\'")
+
+
+def burn_subtitles(video: Path, ass_path: Path, out_path: Path, preset: str = "faster", crf: int = 20) -> Path:
+    """ASS を libass で焼き込む。音声はコピー"""
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    run(["ffmpeg", "-v", "error", "-y", "-i", str(video),
+         "-vf", f"ass='{_filter_path(ass_path)}'",
+         "-c:v", "libx264", "-preset", preset, "-crf", str(crf), "-c:a", "copy", str(out_path)],
+        label="ffmpeg-burn")
+    return out_path
+
+
+def clean_video_path(out_path: Path) -> Path:
+    """字幕なし合成の中間ファイル（字幕だけ直したときはこれを使い回す）"""
+    out_path = Path(out_path)
+    return out_path.with_name(out_path.stem + ".clean.mp4")
+
+
+def apply_subtitles(mode: str, clean_video: Path, srt_path: Path, out_path: Path) -> Path:
+    """mode: soft（mux）/ ass-burn（ffmpeg で焼き込み）"""
+    ass_path = Path(srt_path).with_suffix(".ass")
+    srt_to_ass(srt_path, ass_path)
+    if mode == "soft":
+        return mux_subtitles(clean_video, ass_path, out_path)
+    if mode == "ass-burn":
+        return burn_subtitles(clean_video, ass_path, out_path)
+    raise ValueError(f"unknown subtitle mode: {mode}")
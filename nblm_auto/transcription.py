@@ -1,7 +1,23 @@
 from __future__ import annotations
-import json, subprocess, srt, datetime
+import argparse, hashlib, json, os, subprocess, srt, datetime, tempfile, wave
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from .utils import run, ensure_dir
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+from . import vad
+from .utils import run, ensure_dir, timed_block
+
+def _segments_to_srt(segments: Iterable[dict]) -> str:
+    subs = []
+    for i, seg in enumerate(segments, start=1):
+        start = datetime.timedelta(seconds=seg["start"])
+        end = datetime.timedelta(seconds=seg["end"])
+        text = seg["text"].strip()
+        subs.append(srt.Subtitle(index=i, start=start, end=end, content=text))
+    return srt.compose(subs)
 
 def transcribe_with_whisper_cli(audio_path: Path, out_dir: Path, model: str="small", language: str="ja") -> dict:
     ensure_dir(out_dir)
@@ -13,7 +29,7 @@ def transcribe_with_whisper_cli(audio_path: Path, out_dir: Path, model: str="sma
         "--output_format", "json",
         "-o", str(out_dir)
     ]
-    run(cmd)
+    run(cmd, label="whisper")
     base = audio_path.name + ".json"
     json_path = out_dir / base
     if not json_path.exists():
@@ -24,12 +40,227 @@ def transcribe_with_whisper_cli(audio_path: Path, out_dir: Path, model: str="sma
             raise FileNotFoundError(f"Whisper JSON not found: {json_path} / {alt}")
     data = json.loads(json_path.read_text(encoding="utf-8"))
     srt_path = out_dir / (audio_path.stem + ".srt")
-    subs = []
-    for i, seg in enumerate(data.get("segments", []), start=1):
-        start = datetime.timedelta(seconds=seg["start"])
-        end = datetime.timedelta(seconds=seg["end"])
-        text = seg["text"].strip()
-        subs.append(srt.Subtitle(index=i, start=start, end=end, content=text))
-    srt_str = srt.compose(subs)
-    srt_path.write_text(srt_str, encoding="utf-8")
+    srt_path.write_text(_segments_to_srt(data.get("segments", [])), encoding="utf-8")
     return {"json": str(json_path), "srt": str(srt_path)}
+
+# ---------------------------------------------------------------------------
+# 常駐型の書き起こしサービス
+#   backend.load() でモデルを1回だけ読み込み、以降は同じインスタンスで何ファイルでも処理する。
+#   結果は (音声の内容ハッシュ, backend, model, language) をキーにキャッシュし、再実行はゼロコスト。
+# ---------------------------------------------------------------------------
+
+class TranscriptionBackend(ABC):
+    """
+    書き起こしバックエンドの共通インタフェース。
+    transcribe() は Whisper の JSON と同じ形 {"text", "language", "segments": [{"start","end","text"}, ...]} を返す。
+    """
+    name = "base"
+
+    def __init__(self, model: str = "small"):
+        self.model = model
+
+    def load(self) -> None:
+        """モデル読み込みなどの重い初期化（ワーカー起動時に1回だけ呼ばれる）"""
+
+    @abstractmethod
+    def transcribe(self, audio_path: Path, language: str) -> dict:
+        """audio_path を書き起こして Whisper 形式の dict を返す"""
+
+class WhisperCLIBackend(TranscriptionBackend):
+    """従来どおり whisper CLI を呼ぶ（毎回モデルを読み直すので互換用）"""
+    name = "whisper-cli"
+
+    def transcribe(self, audio_path: Path, language: str) -> dict:
+        with tempfile.TemporaryDirectory() as td:
+            res = transcribe_with_whisper_cli(Path(audio_path), Path(td), model=self.model, language=language)
+            return json.loads(Path(res["json"]).read_text(encoding="utf-8"))
+
+class WhisperPythonBackend(TranscriptionBackend):
+    """openai-whisper をプロセス内で使う。モデルは load() で1回だけ読み込む"""
+    name = "whisper"
+
+    def load(self) -> None:
+        import whisper  # 重いので使うときだけ読み込む
+        self._model = whisper.load_model(self.model)
+
+    def transcribe(self, audio_path: Path, language: str) -> dict:
+        # whisper.load_audio と同じ 16kHz モノラル float32 を渡す（デコードは audio_cache の1回で済ませる）
+        pcm = vad.load_pcm(audio_path, 16000).astype(np.float32) / 32768.0
+        with timed_block("whisper"):
+            res = self._model.transcribe(pcm, language=language, task="transcribe")
+        return {
+            "text": res.get("text", ""),
+            "language": res.get("language", language),
+            "segments": [{"start": float(s["start"]), "end": float(s["end"]), "text": s["text"]}
+                         for s in res.get("segments", [])],
+        }
+
+class StubBackend(TranscriptionBackend):
+    """
+    テスト用の決定的バックエンド。音声の内容ハッシュと長さだけから固定のセグメントを作る。
+    WAV なら実際の長さ、それ以外はファイルサイズから 16kB/秒 とみなした長さを使う。
+    """
+    name = "stub"
+    segment_sec = 5.0
+
+    def transcribe(self, audio_path: Path, language: str) -> dict:
+        audio_path = Path(audio_path)
+        try:
+            with wave.open(str(audio_path), "rb") as wf:
+                duration = wf.getnframes() / float(wf.getframerate())
+        except (wave.Error, EOFError):
+            duration = audio_path.stat().st_size / 16000.0
+        tag = file_sha256(audio_path)[:8]
+        segments = []
+        t, i = 0.0, 0
+        while t < duration:
+            end = min(duration, t + self.segment_sec)
+            segments.append({"start": round(t, 3), "end": round(end, 3), "text": f"stub {tag} {i}"})
+            t, i = end, i + 1
+        return {"text": " ".join(s["text"] for s in segments), "language": language, "segments": segments}
+
+BACKENDS = {b.name: b for b in (WhisperPythonBackend, WhisperCLIBackend, StubBackend)}
+
+def file_sha256(path: Path, block: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for buf in iter(lambda: f.read(block), b""):
+            h.update(buf)
+    return h.hexdigest()
+
+class TranscriptionCache:
+    """書き起こし結果(JSON)を <cache_dir>/<key>.json に保存する"""
+
+    def __init__(self, cache_dir: Path):
+        self.cache_dir = Path(cache_dir)
+        ensure_dir(self.cache_dir)
+
+    @staticmethod
+    def key(audio_hash: str, backend: str, model: str, language: str) -> str:
+        return hashlib.sha256(f"{audio_hash}|{backend}|{model}|{language}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        p = self.cache_dir / f"{key}.json"
+        if not p.exists():
+            return None
+        return json.loads(p.read_text(encoding="utf-8"))
+
+    def put(self, key: str, data: dict) -> None:
+        p = self.cache_dir / f"{key}.json"
+        # 同じキーを複数ワーカーが同時に書いても混ざらないよう、一時ファイルはプロセスごとに別名
+        fd, tmp = tempfile.mkstemp(dir=p.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(json.dumps(data, ensure_ascii=False))
+            os.replace(tmp, p)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+class TranscriptionWorker:
+    """
+    バックエンドを1回だけロードして使い回す常駐ワーカー。
+    submit() は単一スレッドのキューに積むので、モデルは1インスタンスのまま順番に処理される。
+    vad=True なら無音区間を削った音声だけをバックエンドに渡し、タイムスタンプを元の時刻に戻す。
+    """
+
+    def __init__(self, backend: TranscriptionBackend, language: str = "ja",
+                 cache_dir: Optional[Path] = None, vad: bool = False):
+        self.backend = backend
+        self.language = language
+        self.vad = vad
+        self.cache = TranscriptionCache(cache_dir) if cache_dir else None
+        self._loaded = False
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="transcribe")
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.backend.load()
+            self._loaded = True
+
+    def transcribe(self, audio_path: Path, out_dir: Path) -> dict:
+        """1ファイルを書き起こして out_dir に <stem>.json / <stem>.srt を書き、パスを返す"""
+        audio_path = Path(audio_path)
+        ensure_dir(out_dir)
+        key = None
+        data = None
+        if self.cache is not None:
+            backend_id = self.backend.name + ("+vad" if self.vad else "")
+            key = TranscriptionCache.key(file_sha256(audio_path), backend_id,
+                                         self.backend.model, self.language)
+            data = self.cache.get(key)
+        if data is None:
+            self._ensure_loaded()
+            if self.vad:
+                data = self._transcribe_voiced(audio_path)
+            else:
+                data = self.backend.transcribe(audio_path, self.language)
+            data["srt"] = _segments_to_srt(data.get("segments", []))
+            if self.cache is not None:
+                self.cache.put(key, data)
+        json_path = out_dir / (audio_path.stem + ".json")
+        srt_path = out_dir / (audio_path.stem + ".srt")
+        srt_str = data.pop("srt", None) or _segments_to_srt(data.get("segments", []))
+        json_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        srt_path.write_text(srt_str, encoding="utf-8")
+        return {"json": str(json_path), "srt": str(srt_path)}
+
+    def _transcribe_voiced(self, audio_path: Path) -> dict:
+        """VAD で発話区間だけを連結した一時 WAV を書き起こし、区間オフセットで時刻を元に戻す"""
+        sr = 16000
+        pcm = vad.load_pcm(audio_path, sr)
+        intervals = vad.voiced_intervals(pcm, sr)
+        if not len(intervals):
+            return {"text": "", "language": self.language, "segments": []}
+        voiced, mapping = vad.condense(pcm, sr, intervals)
+        with tempfile.TemporaryDirectory() as td:
+            tmp = Path(td) / (audio_path.stem + ".wav")
+            with wave.open(str(tmp), "wb") as wf:
+                wf.setnchannels(1)
+                wf.setsampwidth(2)
+                wf.setframerate(sr)
+                wf.writeframes(voiced.tobytes())
+            data = self.backend.transcribe(tmp, self.language)
+        for seg in data.get("segments", []):
+            seg["start"], seg["end"] = (float(t) for t in vad.map_times([seg["start"], seg["end"]], mapping))
+        return data
+
+    def submit(self, audio_path: Path, out_dir: Path) -> Future:
+        return self._pool.submit(self.transcribe, audio_path, out_dir)
+
+    def transcribe_many(self, audio_paths: Iterable[Path], out_dir: Path) -> List[dict]:
+        futures = [self.submit(p, out_dir) for p in audio_paths]
+        return [f.result() for f in futures]
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def make_backend(name: str, model: str = "small") -> TranscriptionBackend:
+    if name not in BACKENDS:
+        raise ValueError(f"unknown transcription backend: {name} (choices: {', '.join(BACKENDS)})")
+    return BACKENDS[name](model=model)
+
+def main():
+    ap = argparse.ArgumentParser(description="Batch transcription with a single loaded model and a result cache")
+    ap.add_argument("audio", nargs="+", help="音声ファイル（複数可）")
+    ap.add_argument("--out-dir", default="data/transcripts")
+    ap.add_argument("--backend", choices=sorted(BACKENDS), default="whisper-cli")
+    ap.add_argument("--model", default="small")
+    ap.add_argument("--language", default="ja")
+    ap.add_argument("--cache-dir", default="data/cache/transcripts")
+    ap.add_argument("--vad", action="store_true", help="無音区間を削ってから書き起こす")
+    args = ap.parse_args()
+
+    with TranscriptionWorker(make_backend(args.backend, args.model), args.language,
+                             cache_dir=Path(args.cache_dir), vad=args.vad) as worker:
+        for res in worker.transcribe_many([Path(p) for p in args.audio], Path(args.out_dir)):
+            print(f"[TRANSCRIBE] {res['json']} / {res['srt']}")
+
+if __name__ == "__main__":
+    main()
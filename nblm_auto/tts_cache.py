@@ -0,0 +1,140 @@
+# nblm_auto/tts_cache.py
+from __future__ import annotations
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+
+def cache_key(engine_version: str, speaker: int, text: str,
+              speed_scale: float, pitch_scale: float, intonation_scale: float) -> str:
+    """合成結果を一意に決めるパラメータ一式から sha256 キーを作る"""
+    payload = json.dumps(
+        [engine_version, int(speaker), text,
+         float(speed_scale), float(pitch_scale), float(intonation_scale)],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    """
+    VOICEVOX の合成結果(WAVバイト列)をディスクに保存するキャッシュ。
+    - 1エントリ = WAV 1ファイル（<key[:2]>/<key>.wav）＋任意で AudioQuery の JSON（<key>.json）
+    - 書き込みは一時ファイル→os.replace の原子的置換なので、
+      複数ワーカーが同じディレクトリを共有しても壊れたファイルは見えない
+    - ヒット時に mtime を更新し、max_bytes 超過時は mtime の古い順に削除（LRU）。
+      サイズ（WAV＋JSON）は put ごとに足し込むだけで、ディレクトリを走査するのは上限を超えたときだけ。
+      超えたら EVICT_TO 倍まで減らすので、満杯付近でも put のたびに走査することはない
+    """
+
+    EVICT_TO = 0.9
+
+    def __init__(self, cache_dir: Path, max_bytes: Optional[int] = None):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._size: Optional[int] = None  # 合計サイズの見積もり（最初の put で1回だけ走査）
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.wav"
+
+    def get(self, key: str) -> Optional[bytes]:
+        p = self._path(key)
+        try:
+            data = p.read_bytes()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(p)  # LRU 用に最終利用時刻を更新
+        except OSError:
+            pass  # 別ワーカーが evict 済みでも読めた分は使う
+        return data
+
+    def get_query(self, key: str) -> Optional[dict]:
+        """合成時の AudioQuery（リップシンク用のモーラ長）。保存されていなければ None"""
+        try:
+            return json.loads(self._path(key).with_suffix(".json").read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def last_engine_version(self) -> Optional[str]:
+        """最後にエンジンに問い合わせたバージョン（全チャンクがヒットする回はエンジン無しでこれを使う）"""
+        try:
+            return (self.cache_dir / "engine_version.txt").read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return None
+
+    def set_engine_version(self, version: str) -> None:
+        self._atomic_write(self.cache_dir / "engine_version.txt", version.encode("utf-8"))
+
+    @staticmethod
+    def _atomic_write(p: Path, data: bytes) -> None:
+        fd, tmp = tempfile.mkstemp(dir=p.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, p)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+    @staticmethod
+    def _entry_size(p: Path) -> int:
+        """WAV と横の JSON を合わせたサイズ（無ければ 0）"""
+        size = 0
+        for f in (p, p.with_suffix(".json")):
+            try:
+                size += f.stat().st_size
+            except FileNotFoundError:
+                pass
+        return size
+
+    def _scan(self) -> list:
+        """[(mtime, エントリのサイズ, wav パス)]"""
+        entries = []
+        for p in self.cache_dir.glob("*/*.wav"):
+            try:
+                mtime = p.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            entries.append((mtime, self._entry_size(p), p))
+        return entries
+
+    def put(self, key: str, wav_bytes: bytes, query: Optional[dict] = None) -> None:
+        p = self._path(key)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        if self.max_bytes is not None and self._size is None:
+            self._size = sum(size for _, size, _ in self._scan())
+        replaced = self._entry_size(p) if self.max_bytes is not None else 0
+        data = json.dumps(query, ensure_ascii=False).encode("utf-8") if query is not None else None
+        if data is not None:
+            # WAV より先に書くので、WAV が見えていれば JSON も揃っている
+            self._atomic_write(p.with_suffix(".json"), data)
+        self._atomic_write(p, wav_bytes)
+        if self.max_bytes is not None:
+            self._size += len(wav_bytes) + (len(data) if data is not None else 0) - replaced
+            if self._size > self.max_bytes:
+                self.evict()
+
+    def evict(self) -> None:
+        """
+        合計サイズが max_bytes を超えていたら、EVICT_TO 倍以下になるまで古いエントリから削除する。
+        他のワーカーの書き込みも数えるため、ここでは実際に走査し直して見積もりを合わせる。
+        """
+        if self.max_bytes is None:
+            return
+        entries = self._scan()
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_bytes:
+            target = self.max_bytes * self.EVICT_TO
+            entries.sort()
+            for _, size, p in entries:
+                if total <= target:
+                    break
+                p.unlink(missing_ok=True)
+                p.with_suffix(".json").unlink(missing_ok=True)
+                total -= size
+        self._size = total
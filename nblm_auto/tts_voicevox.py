@@ -2,13 +2,22 @@
 from __future__ import annotations
 import io
 import math
+import re
 import wave
+import zipfile
+from bisect import bisect_right
+from itertools import accumulate
 from pathlib import Path
-from typing import List, Dict, Tuple
+from urllib.parse import quote
+from typing import List, Dict, Tuple, Optional
 
 import numpy as np
 import requests
 
+from .lipsync_mora import write_mora_lipsync
+from .limiter import limit_array_inplace, limit_wav_file
+from .tts_cache import TTSCache, cache_key
+
 
 def _ensure_dir(p: Path):
     p.parent.mkdir(parents=True, exist_ok=True)
@@ -41,43 +50,163 @@ def _write_wav(path: Path, sr: int, data: np.ndarray):
         wf.writeframes(data.tobytes())
 
 
+class _WavStreamWriter:
+    """
+    A/B/mix の3本の WAV を、チャンクが届くたびに追記していく書き出し器。
+    保持するのは書き込み中のチャンク1個分だけなので、エピソード長に依らずメモリ一定。
+    A/B は同時に喋らない（相手側には同長の無音を入れる）ため、
+    ミックスの各チャンクは発話側の PCM そのものになり int16 を超えることはない。
+    """
+
+    def __init__(self, out_mix_wav: Path, out_A_wav: Path, out_B_wav: Path):
+        self.paths = {"mix": out_mix_wav, "A": out_A_wav, "B": out_B_wav}
+        self._wfs: Dict[str, wave.Wave_write] = {}
+        self.pos = 0  # 書き込み済みサンプル数
+
+    def _open(self, sr: int):
+        for name, path in self.paths.items():
+            _ensure_dir(path)
+            wf = wave.open(str(path), "wb")
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(sr)
+            self._wfs[name] = wf
+
+    def append(self, who: str, sr: int, pcm: np.ndarray):
+        if not self._wfs:
+            self._open(sr)
+        data = np.asarray(pcm, dtype=np.int16).tobytes()
+        silence = bytes(len(data))
+        # ヘッダ更新は close 時にまとめて行う（writeframesraw）
+        self._wfs["A"].writeframesraw(data if who == "A" else silence)
+        self._wfs["B"].writeframesraw(silence if who == "A" else data)
+        self._wfs["mix"].writeframesraw(data)
+        self.pos += len(pcm)
+
+    def close(self, sr: int):
+        if not self._wfs:
+            # 何も合成しなかった場合でも空の WAV を残す
+            self._open(sr)
+        for wf in self._wfs.values():
+            wf.close()
+        self._wfs = {}
+
+    def abort(self):
+        """途中で失敗したとき用。開いている WAV だけを閉じ、書けた分までの長さでヘッダを確定させる"""
+        for wf in self._wfs.values():
+            try:
+                wf.close()
+            except OSError:
+                pass
+        self._wfs = {}
+
+
 def _make_silence(sr: int, ms: int) -> np.ndarray:
     length = int(sr * ms / 1000.0)
     return np.zeros(length, dtype=np.int16)
 
 
-def _safe_chunks(text: str, max_len: int = 120) -> List[str]:
+# /audio_query は text を URL のクエリに載せる（本文では受け付けない）ので、1回に送れる長さは
+# URL エンコード後のバイト数で決まる。エンジン（uvicorn / h11）はリクエスト行を含むヘッダを 16KiB で打ち切るため、
+# 間にプロキシが入っても通るよう半分を上限にする（日本語でおよそ 880 文字）。
+QUERY_TEXT_BYTES = 8000
+
+# 文末で切る（区切り記号は前の文に付けたまま。ASCII の . は直後が空白のときだけ: 3.5 などを割らない）
+SENTENCE_SPLIT = re.compile(r"(?<=[。．！？!?])|(?<=\.)(?=\s)")
+# 1文が上限を超えるときだけ読点・区切りで切る（1,000 などを割らないよう ASCII は直後が空白のときだけ）
+CLAUSE_SPLIT = re.compile(r"(?<=[、，；：])|(?<=[,;:])(?=\s)")
+
+
+def _query_bytes(text: str) -> int:
+    return len(quote(text, safe=""))
+
+
+def _fit_units(text: str, max_bytes: int) -> List[str]:
+    """text を上限以下の単位（文 → 節 → 最後の保険として文字）に割る。連結すると元の text に戻る"""
+    out = []
+    for sent in SENTENCE_SPLIT.split(text):
+        if _query_bytes(sent) <= max_bytes:
+            out.append(sent)
+            continue
+        for clause in CLAUSE_SPLIT.split(sent):
+            if _query_bytes(clause) <= max_bytes:
+                out.append(clause)
+                continue
+            cum = list(accumulate(_query_bytes(ch) for ch in clause))
+            a = 0
+            while a < len(clause):
+                b = max(a + 1, bisect_right(cum, (cum[a - 1] if a else 0) + max_bytes))
+                out.append(clause[a:b])
+                a = b
+    return [u for u in out if u]
+
+
+def _safe_chunks(text: str, max_bytes: int = QUERY_TEXT_BYTES) -> List[str]:
     """
-    VOICEVOXの /audio_query は text をクエリに乗せる仕様のため、
-    URLが長くなり過ぎるのを防ぐ目的でテキストを安全長に分割。
-    句点や改行で優先的に分割し、最後の保険としてmax_lenで強制分割。
+    /audio_query 1回分ずつのチャンクに分ける。文（収まらなければ節）を切らずに、
+    URL エンコード後 max_bytes に収まるだけ前から詰める。チャンクが少ないほど往復と継ぎ目が減る。
     """
     t = " ".join(text.replace("\r", "\n").split())  # 改行/連続空白→単一空白
-    if len(t) <= max_len:
-        return [t] if t else []
+    if not t:
+        return []
+    if _query_bytes(t) <= max_bytes:
+        return [t]
 
     out = []
-    buf = ""
-    breakers = set("。．.!？?、,，\n")
-    for ch in t:
-        buf += ch
-        if ch in breakers and len(buf) >= max_len * 0.6:
-            out.append(buf.strip())
-            buf = ""
-        elif len(buf) >= max_len:
+    buf, size = "", 0
+    for unit in _fit_units(t, max_bytes):
+        n = _query_bytes(unit)
+        if buf and size + n > max_bytes:
             out.append(buf.strip())
-            buf = ""
+            buf, size = "", 0
+        buf += unit
+        size += n
     if buf.strip():
         out.append(buf.strip())
-    return out
+    return [c for c in out if c]
 
 
-def _request_audio(engine_url: str, text: str, speaker: int,
-                   speed_scale: float, pitch_scale: float, intonation_scale: float) -> Tuple[int, np.ndarray]:
+def _engine_version(engine_url: str) -> str:
+    """キャッシュキー用にエンジンのバージョン文字列を取得"""
+    r = requests.get(f"{engine_url}/version", timeout=10)
+    r.raise_for_status()
+    return str(r.json())
+
+
+class _EngineVersion:
     """
-    単一チャンクを VOICEVOX で合成して (sr, pcm int16) を返す。
-    audio_query と synthesis の両方に speaker を確実に付ける。
+    キャッシュキーに入れるエンジンのバージョン。キャッシュに前回の値があればまずそれで引き、
+    最初のミスで初めて /version を問い合わせる（全チャンクがヒットする回はエンジンを起動していなくても通る）。
+    問い合わせた値が違えば（エンジンを更新した）、以降はその値で引き直す。
     """
+
+    def __init__(self, engine_url: str, cache: TTSCache):
+        self.engine_url = engine_url
+        self.cache = cache
+        self.value = cache.last_engine_version()
+        self.confirmed = False
+
+    def get(self) -> str:
+        if self.value is None:
+            self.confirm()
+        return self.value
+
+    def confirm(self) -> bool:
+        """エンジンに問い合わせて値を確定する。それまで使っていた値と違えば True"""
+        if self.confirmed:
+            return False
+        self.confirmed = True
+        live = _engine_version(self.engine_url)
+        changed = live != self.value
+        if changed:
+            self.value = live
+            self.cache.set_engine_version(live)
+        return changed
+
+
+def _audio_query(engine_url: str, text: str, speaker: int,
+                 speed_scale: float, pitch_scale: float, intonation_scale: float) -> dict:
+    """/audio_query を叩いて各スケールを反映済みの AudioQuery を返す"""
     # audio_query: POST + params (text, speaker)
     q = requests.post(
         f"{engine_url}/audio_query",
@@ -92,6 +221,29 @@ def _request_audio(engine_url: str, text: str, speaker: int,
     query["speedScale"] = float(speed_scale)
     query["pitchScale"] = float(pitch_scale)
     query["intonationScale"] = float(intonation_scale)
+    return query
+
+
+def _request_audio(engine_url: str, text: str, speaker: int,
+                   speed_scale: float, pitch_scale: float, intonation_scale: float,
+                   cache: Optional[TTSCache] = None,
+                   version: Optional[_EngineVersion] = None) -> Tuple[int, np.ndarray, dict]:
+    """
+    単一チャンクを VOICEVOX で合成して (sr, pcm int16, audio_query) を返す。
+    audio_query と synthesis の両方に speaker を確実に付ける。
+    cache があれば (エンジンのバージョン, speaker, text, 各スケール) で引き、ヒット時はエンジンを呼ばない。
+    """
+    key = None
+    if cache is not None:
+        for _ in range(2):
+            key = cache_key(version.get(), speaker, text, speed_scale, pitch_scale, intonation_scale)
+            hit, hit_query = cache.get(key), cache.get_query(key)
+            if hit is not None and hit_query is not None:
+                return (*_wav_bytes_to_np(hit), hit_query)
+            if not version.confirm():
+                break
+
+    query = _audio_query(engine_url, text, speaker, speed_scale, pitch_scale, intonation_scale)
 
     # synthesis: POST + params (speaker), json=query
     s = requests.post(
@@ -101,7 +253,51 @@ def _request_audio(engine_url: str, text: str, speaker: int,
         timeout=60,
     )
     s.raise_for_status()
-    return _wav_bytes_to_np(s.content)
+    if cache is not None:
+        cache.put(key, s.content, query)
+    return (*_wav_bytes_to_np(s.content), query)
+
+
+def _request_audio_batch(engine_url: str, texts: List[str], speaker: int,
+                         speed_scale: float, pitch_scale: float, intonation_scale: float,
+                         cache: Optional[TTSCache] = None,
+                         version: Optional[_EngineVersion] = None) -> List[Tuple[int, np.ndarray, dict]]:
+    """
+    同一話者の複数チャンクをまとめて合成し、texts と同じ順で (sr, pcm int16, audio_query) のリストを返す。
+    キャッシュに無いチャンクだけ audio_query を取り、/multi_synthesis 1回で合成する
+    （返ってくる zip は 001.wav, 002.wav ... の順）。
+    """
+    results: List[Optional[bytes]] = [None] * len(texts)
+    queries: List[Optional[dict]] = [None] * len(texts)
+    keys: List[Optional[str]] = [None] * len(texts)
+    misses = list(range(len(texts)))
+    if cache is not None:
+        for _ in range(2):
+            for i in misses:
+                keys[i] = cache_key(version.get(), speaker, texts[i], speed_scale, pitch_scale, intonation_scale)
+                results[i], queries[i] = cache.get(keys[i]), cache.get_query(keys[i])
+            misses = [i for i in range(len(texts)) if results[i] is None or queries[i] is None]
+            if not misses or not version.confirm():
+                break
+    if misses:
+        for i in misses:
+            queries[i] = _audio_query(engine_url, texts[i], speaker, speed_scale, pitch_scale, intonation_scale)
+        s = requests.post(
+            f"{engine_url}/multi_synthesis",
+            params={"speaker": int(speaker)},
+            json=[queries[i] for i in misses],
+            timeout=60 * len(misses),
+        )
+        s.raise_for_status()
+        with zipfile.ZipFile(io.BytesIO(s.content)) as zf:
+            names = sorted(n for n in zf.namelist() if n.endswith(".wav"))
+            if len(names) != len(misses):
+                raise RuntimeError(f"multi_synthesis returned {len(names)} wavs for {len(misses)} queries")
+            for i, name in zip(misses, names):
+                results[i] = zf.read(name)
+                if cache is not None:
+                    cache.put(keys[i], results[i], queries[i])
+    return [(*_wav_bytes_to_np(r), q) for r, q in zip(results, queries)]
 
 
 def voicevox_tts_segments(
@@ -114,70 +310,139 @@ def voicevox_tts_segments(
     out_mix_wav: Path = Path("data/tts/narration.wav"),
     out_A_wav: Path = Path("data/tts/charA.wav"),
     out_B_wav: Path = Path("data/tts/charB.wav"),
+    cache_dir: Optional[Path] = None,
+    cache_max_bytes: Optional[int] = None,
+    stream: bool = False,
+    batch_size: int = 1,
+    limiter_ceiling_dbfs: float = 0.0,
+    loudness_target_dbfs: Optional[float] = None,
+    lipsync_dir: Optional[Path] = None,
+    max_query_bytes: int = QUERY_TEXT_BYTES,
 ):
     """
     segments: [{"text": "...", "who": "A" or "B", "speaker_id": 2 など}, ...]
-    - 長文は _safe_chunks で小分けしてから合成
+    - 長文は _safe_chunks で文・節の切れ目に沿って、/audio_query の URL が max_query_bytes に収まる大きさにまとめて合成
     - A/B それぞれの波形には、相手が話している区間の無音を挿入して全体長を揃える
     - 最後に A+B をミックスして narration.wav を作成
+    - cache_dir を渡すと合成結果をディスクキャッシュし、変更のないチャンクはエンジンを呼ばない
+      （cache_max_bytes で容量上限。超過分は LRU で削除。複数ワーカーで共有可）
+    - stream=True なら各チャンクを A/B/mix の WAV へ逐次追記し、トラック全体をメモリに載せない
+      （長尺の総集編向け。メモリ使用量はチャンク1個分で頭打ち）
+    - batch_size>1 なら同一話者の連続チャンクを /multi_synthesis でまとめて合成し、
+      合成の往復回数を減らす（保持するのは最大 batch_size チャンク分）
+    - ミックスにはブロック単位のルックアヘッド・リミッタ（上限 limiter_ceiling_dbfs）を掛ける。
+      loudness_target_dbfs を指定すると無音ゲート付き RMS でエピソード間の音量を揃える
+    - lipsync_dir を渡すと audio_query のモーラ長と組み立て位置から charA.json / charB.json を直接書き出す
+      （Rhubarb 互換形式。Rhubarb を別途走らせる必要がない）
     戻り値: (out_mix_wav, out_A_wav, out_B_wav, timings)
       timings: [(who, start_sample, end_sample), ...]（簡易ログ）
     """
     timings = []
     sr_ref = None
+    cache = TTSCache(cache_dir, max_bytes=cache_max_bytes) if cache_dir else None
+    version = _EngineVersion(engine_url, cache) if cache is not None else None
     track_A = np.zeros(0, dtype=np.int16)
     track_B = np.zeros(0, dtype=np.int16)
+    writer = _WavStreamWriter(out_mix_wav, out_A_wav, out_B_wav) if stream else None
 
     def _append_tracks(who: str, sr: int, pcm: np.ndarray):
         nonlocal track_A, track_B
-        if who == "A":
+        if writer is not None:
+            writer.append(who, sr, pcm)
+        elif who == "A":
             track_A = np.concatenate([track_A, pcm])
             track_B = np.concatenate([track_B, np.zeros_like(pcm)])
         else:
             track_A = np.concatenate([track_A, np.zeros_like(pcm)])
             track_B = np.concatenate([track_B, pcm])
 
+    def _position() -> int:
+        return writer.pos if writer is not None else len(track_A)
+
+    # 合成計画を先に平坦化: ("chunk", who, speaker_id, text) / ("pause", who)
+    plan: List[Tuple] = []
     for seg in segments:
         text = str(seg.get("text", "")).strip()
-        if not text:
-            # 発話なし → そのままポーズだけ入れて次へ
-            if sr_ref is not None and pause_between_sentences_ms > 0:
-                sil = _make_silence(sr_ref, pause_between_sentences_ms)
-                _append_tracks(seg.get("who", "A"), sr_ref, sil)
-            continue
-
         who = seg.get("who", "A")
-        spk = int(seg.get("speaker_id", 2))  # 既定=2（例：四国めたん）
-        chunks = _safe_chunks(text, max_len=120)
-        for i, chunk in enumerate(chunks):
-            sr, pcm = _request_audio(
-                engine_url=engine_url,
-                text=chunk,
-                speaker=spk,
-                speed_scale=speed_scale,
-                pitch_scale=pitch_scale,
-                intonation_scale=intonation_scale,
-            )
+        if text:
+            spk = int(seg.get("speaker_id", 2))  # 既定=2（例：四国めたん）
+            for chunk in _safe_chunks(text, max_query_bytes):
+                plan.append(("chunk", who, spk, chunk))
+        # 発話なしでもポーズは入れる／セグメント間ポーズ（両トラックに同長の無音を追加）
+        plan.append(("pause", who))
+
+    scales = dict(speed_scale=speed_scale, pitch_scale=pitch_scale, intonation_scale=intonation_scale)
+    pending: Dict[int, Tuple[int, np.ndarray, dict]] = {}
+    mora_entries: List[Tuple[str, int, dict]] = []  # (who, start_sample, audio_query)
+
+    def _fetch(idx: int):
+        """plan[idx] から始まる同一話者チャンク列（間のポーズは跨ぐ）を最大 batch_size 個まとめて合成"""
+        spk = plan[idx][2]
+        if batch_size <= 1:
+            pending[idx] = _request_audio(engine_url=engine_url, text=plan[idx][3], speaker=spk,
+                                          cache=cache, version=version, **scales)
+            return
+        group = []
+        for j in range(idx, len(plan)):
+            if plan[j][0] != "chunk":
+                continue
+            if plan[j][2] != spk or len(group) >= batch_size:
+                break
+            group.append(j)
+        audios = _request_audio_batch(engine_url, [plan[j][3] for j in group], spk,
+                                      cache=cache, version=version, **scales)
+        pending.update(zip(group, audios))
+
+    try:
+        for idx, item in enumerate(plan):
+            if item[0] == "pause":
+                if sr_ref is not None and pause_between_sentences_ms > 0:
+                    sil = _make_silence(sr_ref, pause_between_sentences_ms)
+                    _append_tracks(item[1], sr_ref, sil)
+                continue
+
+            who = item[1]
+            if idx not in pending:
+                _fetch(idx)
+            sr, pcm, query = pending.pop(idx)
             if sr_ref is None:
                 sr_ref = sr
             elif sr != sr_ref:
                 # 念のため（VOICEVOXは基本24000固定）
                 raise RuntimeError(f"sample rate mismatch: {sr} vs {sr_ref}")
 
-            start = len(track_A)  # 現在のサンプル位置
+            start = _position()  # 現在のサンプル位置
             _append_tracks(who, sr, pcm)
-            end = len(track_A)
+            end = _position()
             timings.append((who, start, end))
-
-        # セグメント間ポーズ（両トラックに同長の無音を追加）
-        if sr_ref is not None and pause_between_sentences_ms > 0:
-            sil = _make_silence(sr_ref, pause_between_sentences_ms)
-            _append_tracks(who, sr_ref, sil)
+            if lipsync_dir is not None:
+                mora_entries.append((who, start, query))
+    except BaseException:
+        # エンジンのエラーなどで中断しても、ストリーム書き出しの WAV はヘッダを確定させて閉じる
+        if writer is not None:
+            writer.abort()
+        raise
 
     if sr_ref is None:
         # 何も合成しなかった場合（空テキストなど）
         sr_ref = 24000
 
+    if writer is not None:
+        # リップシンクの書き出しで失敗しても WAV が開いたまま残らないよう、先に閉じる
+        writer.close(sr_ref)
+
+    if lipsync_dir is not None:
+        write_mora_lipsync(
+            [(who, start / sr_ref, query) for who, start, query in mora_entries],
+            total_sec=_position() / sr_ref, out_dir=lipsync_dir, source_audio=out_mix_wav,
+        )
+
+    if writer is not None:
+        if loudness_target_dbfs is not None or limiter_ceiling_dbfs < 0.0:
+            # ストリーミング時はファイルをブロック単位で2パス処理（メモリ一定）
+            limit_wav_file(out_mix_wav, ceiling_dbfs=limiter_ceiling_dbfs, target_dbfs=loudness_target_dbfs)
+        return out_mix_wav, out_A_wav, out_B_wav, timings
+
     # 長さ揃え（保険）
     L = max(len(track_A), len(track_B))
     if len(track_A) < L:
@@ -185,13 +450,12 @@ def voicevox_tts_segments(
     if len(track_B) < L:
         track_B = np.pad(track_B, (0, L - len(track_B)), constant_values=0)
 
-    # ミックス（int16クリップ防止）
-    mix_i32 = track_A.astype(np.int32) + track_B.astype(np.int32)
-    # 簡易リミッタ：最大振幅で正規化（過大ミックス時の歪み軽減）
-    peak = np.max(np.abs(mix_i32)) if mix_i32.size else 1
-    if peak > 32767:
-        mix_i32 = (mix_i32.astype(np.float32) * (32767.0 / peak)).astype(np.int32)
-    mix = np.clip(mix_i32, -32768, 32767).astype(np.int16)
+    # ミックス（int32 で1本だけ確保し、ブロック単位のルックアヘッド・リミッタを in-place で掛ける）
+    mix_i32 = track_A.astype(np.int32)
+    mix_i32 += track_B
+    limit_array_inplace(mix_i32, ceiling_dbfs=limiter_ceiling_dbfs, target_dbfs=loudness_target_dbfs)
+    np.clip(mix_i32, -32768, 32767, out=mix_i32)
+    mix = mix_i32.astype(np.int16)
 
     _write_wav(out_A_wav, sr_ref, track_A)
     _write_wav(out_B_wav, sr_ref, track_B)
@@ -1,10 +1,224 @@
 from __future__ import annotations
-import re, subprocess
+import json, os, re, subprocess, threading, time
+from dataclasses import dataclass
 from pathlib import Path
 
-def run(cmd: list[str], check: bool=True) -> None:
-    print("[RUN]", " ".join(cmd))
-    subprocess.run(cmd, check=check)
+# ---------------------------------------------------------------------------
+# 外部コマンド実行（whisper / ffmpeg / rhubarb 共通）
+#   子プロセスごとに wall / user / sys / max RSS を計測し、JSONL に1行ずつ追記する。
+#   設定は環境変数で渡すので、ツールをサブプロセスで起動してもそのまま引き継がれる:
+#     NBLM_RUN_LOG      … 計測レコードの JSONL パス（未設定なら記録しない）
+#     NBLM_RUN_LOG_DIR  … stdout / stderr の保存先（未設定なら端末にそのまま出す）
+#     NBLM_MAX_PROCS    … このプロセスから同時に走らせる外部コマンドの上限
+# ---------------------------------------------------------------------------
+
+@dataclass
+class RunResult:
+    cmd: list
+    returncode: int
+    wall_sec: float
+    user_sec: float | None = None
+    sys_sec: float | None = None
+    max_rss_mb: float | None = None
+    stdout: bytes | None = None
+    stdout_log: str | None = None
+    stderr_log: str | None = None
+    timed_out: bool = False
+
+_run_lock = threading.Lock()
+_run_slots: threading.BoundedSemaphore | None = None
+_run_seq = 0
+
+def configure_run(log: Path | None = None, log_dir: Path | None = None, max_procs: int | None = None) -> None:
+    """run() の記録先と同時実行数を設定する（子プロセスにも環境変数で伝わる）"""
+    global _run_slots
+    if log is not None:
+        Path(log).parent.mkdir(parents=True, exist_ok=True)
+        os.environ["NBLM_RUN_LOG"] = str(Path(log).resolve())
+    if log_dir is not None:
+        Path(log_dir).mkdir(parents=True, exist_ok=True)
+        os.environ["NBLM_RUN_LOG_DIR"] = str(Path(log_dir).resolve())
+    if max_procs is not None:
+        os.environ["NBLM_MAX_PROCS"] = str(max_procs)
+        _run_slots = None
+
+def _slots() -> threading.BoundedSemaphore:
+    global _run_slots
+    with _run_lock:
+        if _run_slots is None:
+            _run_slots = threading.BoundedSemaphore(max(1, int(os.environ.get("NBLM_MAX_PROCS") or os.cpu_count() or 4)))
+        return _run_slots
+
+def _next_seq() -> int:
+    global _run_seq
+    with _run_lock:
+        _run_seq += 1
+        return _run_seq
+
+def _wait(proc: subprocess.Popen):
+    """子を回収して (returncode, rusage)。wait4 が無い環境では rusage は None"""
+    if not hasattr(os, "wait4"):
+        return proc.wait(), None
+    while True:
+        try:
+            _, status, ru = os.wait4(proc.pid, 0)
+            break
+        except InterruptedError:
+            continue
+        except ChildProcessError:
+            return proc.wait(), None
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return proc.returncode, ru
+
+def _maxrss_mb(ru) -> float:
+    # Linux は KiB、macOS はバイト
+    return round(ru.ru_maxrss / (1024 * 1024 if os.uname().sysname == "Darwin" else 1024), 1)
+
+def run(cmd: list[str], check: bool=True, *, label: str | None = None, timeout: float | None = None,
+        capture: bool = False, cwd: Path | None = None, echo: bool = True, wrapper: bool = False) -> RunResult:
+    """
+    外部コマンドを実行して RunResult を返す。
+    wrapper=True は中で run() する子（ffmpeg / rhubarb など）を別レコードとして残すラッパー（ツールスクリプト）。
+    その wall / CPU は子の分を含むので、集計の割合からは外す。
+    capture=True なら stdout をメモリに取り（デコード結果を受け取る ffmpeg 用）、
+    NBLM_RUN_LOG_DIR があれば残りの出力はログファイルへ、無ければ端末へそのまま流す。
+    timeout を過ぎたら kill して subprocess.TimeoutExpired、check=True で非ゼロ終了なら CalledProcessError。
+    """
+    cmd = [str(c) for c in cmd]
+    label = label or Path(cmd[0]).name
+    seq = _next_seq()
+    if echo:
+        print("[RUN]", " ".join(cmd))
+    log_dir = os.environ.get("NBLM_RUN_LOG_DIR")
+    out_log = err_log = None
+    files = []
+    if log_dir:
+        stem = Path(log_dir) / f"{os.getpid()}-{seq:05d}-{re.sub(r'[^0-9A-Za-z_.-]+', '_', label)}"
+        err_log = f"{stem}.err"
+        files.append(open(err_log, "wb"))
+        if not capture:
+            out_log = f"{stem}.out"
+            files.append(open(out_log, "wb"))
+    stdout = subprocess.PIPE if capture else (files[1] if out_log else None)
+    stderr = files[0] if err_log else None
+
+    chunks: list[bytes] = []
+    timed_out = threading.Event()
+    with _slots():
+        t0 = time.perf_counter()
+        try:
+            proc = subprocess.Popen(cmd, stdout=stdout, stderr=stderr, cwd=cwd)
+            # パイプは別スレッドで読み切る（wait4 中に子が書き込みで詰まらないように）
+            reader = None
+            if capture:
+                reader = threading.Thread(target=lambda: chunks.append(proc.stdout.read()), daemon=True)
+                reader.start()
+
+            def _kill():
+                timed_out.set()
+                proc.kill()
+            timer = threading.Timer(timeout, _kill) if timeout else None
+            if timer:
+                timer.start()
+            try:
+                rc, ru = _wait(proc)
+            finally:
+                if timer:
+                    timer.cancel()
+            if reader:
+                reader.join()
+                proc.stdout.close()
+        finally:
+            for f in files:
+                f.close()
+        wall = time.perf_counter() - t0
+
+    res = RunResult(cmd=cmd, returncode=rc, wall_sec=round(wall, 3),
+                    user_sec=round(ru.ru_utime, 3) if ru else None,
+                    sys_sec=round(ru.ru_stime, 3) if ru else None,
+                    max_rss_mb=_maxrss_mb(ru) if ru else None,
+                    stdout=b"".join(chunks) if capture else None,
+                    stdout_log=out_log, stderr_log=err_log, timed_out=timed_out.is_set())
+    _record(label, res, cwd, wrapper)
+    if res.timed_out:
+        raise subprocess.TimeoutExpired(cmd, timeout, output=res.stdout)
+    if check and rc != 0:
+        raise subprocess.CalledProcessError(rc, cmd, output=res.stdout)
+    return res
+
+class timed_block:
+    """
+    プロセス内で動く重い処理（openai-whisper など）も同じ JSONL に載せるための計測ブロック。
+    CPU 時間は getrusage(RUSAGE_SELF) の差分なので、並行スレッドの分も含む概算。
+    """
+
+    def __init__(self, label: str):
+        self.label = label
+
+    def __enter__(self):
+        import resource
+        self._ru0 = resource.getrusage(resource.RUSAGE_SELF)
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        import resource
+        ru = resource.getrusage(resource.RUSAGE_SELF)
+        res = RunResult(cmd=[f"<in-process:{self.label}>"], returncode=0 if exc is None else 1,
+                        wall_sec=round(time.perf_counter() - self._t0, 3),
+                        user_sec=round(ru.ru_utime - self._ru0.ru_utime, 3),
+                        sys_sec=round(ru.ru_stime - self._ru0.ru_stime, 3),
+                        max_rss_mb=_maxrss_mb(ru))
+        _record(self.label, res, None)
+        return False
+
+def _record(label: str, res: RunResult, cwd: Path | None, wrapper: bool = False) -> None:
+    path = os.environ.get("NBLM_RUN_LOG")
+    if not path:
+        return
+    rec = {"ts": round(time.time(), 3), "pid": os.getpid(), "label": label, "cmd": res.cmd,
+           "cwd": str(cwd) if cwd else None, "returncode": res.returncode, "timed_out": res.timed_out,
+           "wall_sec": res.wall_sec, "user_sec": res.user_sec, "sys_sec": res.sys_sec,
+           "max_rss_mb": res.max_rss_mb, "stdout_log": res.stdout_log, "stderr_log": res.stderr_log}
+    if wrapper:
+        rec["wrapper"] = True
+    # 1行を1回の write で追記する（O_APPEND なので複数プロセスからでも行が混ざらない）
+    line = (json.dumps(rec, ensure_ascii=False) + "\n").encode("utf-8")
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+def summarize_run_log(path: Path) -> list[dict]:
+    """JSONL をラベルごとに集計（wall 合計の降順）。どのツールが支配的かを見る用"""
+    agg: dict[str, dict] = {}
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        if not line.strip():
+            continue
+        r = json.loads(line)
+        a = agg.setdefault(r["label"], {"label": r["label"], "calls": 0, "failed": 0, "wall_sec": 0.0,
+                                        "cpu_sec": 0.0, "max_rss_mb": 0.0, "wrapper": False})
+        a["wrapper"] = a["wrapper"] or bool(r.get("wrapper"))
+        a["calls"] += 1
+        a["failed"] += int(r["returncode"] != 0 or r.get("timed_out", False))
+        a["wall_sec"] += r["wall_sec"]
+        a["cpu_sec"] += (r.get("user_sec") or 0.0) + (r.get("sys_sec") or 0.0)
+        a["max_rss_mb"] = max(a["max_rss_mb"], r.get("max_rss_mb") or 0.0)
+    return sorted(agg.values(), key=lambda a: -a["wall_sec"])
+
+def print_run_summary(path: Path) -> None:
+    rows = summarize_run_log(path)
+    # ラッパーは子のレコードと二重に数えることになるので、割合の分母に入れない
+    total = sum(r["wall_sec"] for r in rows if not r["wrapper"]) or 1.0
+    print(f"\n=== external tools ({path}) ===")
+    print(f"  {'label':<16}{'calls':>7}{'fail':>6}{'wall s':>10}{'share':>8}{'cpu s':>10}{'maxRSS MB':>11}")
+    for r in rows:
+        share = f"{'(incl.)':>8}" if r["wrapper"] else f"{r['wall_sec'] / total:>8.0%}"
+        print(f"  {r['label']:<16}{r['calls']:>7}{r['failed']:>6}{r['wall_sec']:>10.1f}"
+              f"{share}{r['cpu_sec']:>10.1f}{r['max_rss_mb']:>11.1f}")
+    if any(r["wrapper"] for r in rows):
+        print("  (incl.) = wrapper script; its time includes the child tools listed separately")
 
 def which(bin_name: str) -> str | None:
     from shutil import which as _which
@@ -18,3 +232,12 @@ def split_japanese_sentences(text: str) -> list[str]:
 
 def ensure_dir(p: Path) -> None:
     p.mkdir(parents=True, exist_ok=True)
+
+# Notta の「話者 N 00:00:00,000 --> ...」行から話者前置きを削って標準 SRT にする
+NOTTA_SPEAKER_PREFIX = re.compile(
+    r"^話者\s*\d+\s+(?=\d{2}:\d{2}:\d{2},\d{3}\s+-->\s+\d{2}:\d{2}:\d{2},\d{3})", re.M)
+
+def normalize_notta_srt(src: Path, dst: Path) -> Path:
+    text = Path(src).read_text(encoding="utf-8")
+    Path(dst).write_text(NOTTA_SPEAKER_PREFIX.sub("", text), encoding="utf-8")
+    return Path(dst)
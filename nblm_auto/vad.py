@@ -0,0 +1,141 @@
+# nblm_auto/vad.py
+"""
+NumPy だけで動くエネルギーベースの音声区間検出（VAD）。
+- 10ms 程度の非重複フレームで RMS エネルギー(dB)を計算
+- ヒステリシス（on_db 以上で発話開始、off_db 未満で終了）で状態を決める
+- 短い無音の橋渡し・短い発話の除去・前後パディングをして [start, end] 秒の配列を返す
+しきい値は「そのファイルの大きめの発話（95パーセンタイル）」からの相対 dB なので、録音レベル差に強い。
+ただし無音やノイズだけの区間では基準そのものが小さくなるので、絶対値の下限（FLOOR_DB）も設ける。
+Whisper / Rhubarb に渡す前に無音区間を削る用途で使う。
+"""
+from __future__ import annotations
+import wave
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+
+from .audio_cache import decoded
+
+
+# 相対しきい値の下限（dBFS）。これ未満しかない区間は発話とみなさない（デジタル無音・小さなノイズ）
+FLOOR_DB = -55.0
+
+
+def load_pcm(path: Path, sr: int = 16000) -> np.ndarray:
+    """
+    音声ファイルをモノラル int16 / sr Hz にする（同条件の WAV はそのまま読む）。
+    それ以外は audio_cache のデコード済み PCM（読み取り専用の memmap）を返すので、2回目以降は ffmpeg を起動しない。
+    """
+    path = Path(path)
+    if path.suffix.lower() == ".wav":
+        try:
+            with wave.open(str(path), "rb") as wf:
+                if wf.getnchannels() == 1 and wf.getsampwidth() == 2 and wf.getframerate() == sr:
+                    return np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+        except wave.Error:
+            pass
+    return decoded(path, sr).pcm
+
+
+def frame_energy_db(pcm: np.ndarray, sr: int, frame_ms: float = 10.0,
+                    chunk_frames: int = 1 << 16) -> np.ndarray:
+    """非重複フレームごとの RMS を dBFS で返す（float 変換は chunk_frames 単位で行いメモリを抑える）"""
+    hop = max(1, int(sr * frame_ms / 1000.0))
+    n = len(pcm) // hop
+    out = np.empty(n, dtype=np.float32)
+    frames = np.asarray(pcm)[: n * hop].reshape(n, hop)
+    for i in range(0, n, chunk_frames):
+        f = frames[i:i + chunk_frames].astype(np.float32)
+        ms = np.einsum("ij,ij->i", f, f) / hop
+        out[i:i + chunk_frames] = 10.0 * np.log10(ms / (32768.0 ** 2) + 1e-12)
+    return out
+
+
+def hysteresis(energy_db: np.ndarray, on_db: float, off_db: float) -> np.ndarray:
+    """on_db 以上で True、off_db 未満で False、その間は直前の状態を保つブール配列（ループなし）"""
+    state = np.full(len(energy_db), -1, dtype=np.int8)
+    state[energy_db < off_db] = 0
+    state[energy_db >= on_db] = 1
+    idx = np.where(state >= 0, np.arange(len(state)), 0)
+    np.maximum.accumulate(idx, out=idx)
+    filled = state[idx]
+    return filled == 1
+
+
+def mask_to_intervals(mask: np.ndarray, hop_sec: float) -> np.ndarray:
+    """ブール配列の True 区間を [[start, end], ...]（秒）に変換"""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return np.stack([starts, ends], axis=1).astype(np.float64) * hop_sec
+
+
+def merge_close(iv: np.ndarray, min_gap: float) -> np.ndarray:
+    if len(iv) < 2:
+        return iv
+    gaps = iv[1:, 0] - iv[:-1, 1]
+    keep_break = np.concatenate(([True], gaps >= min_gap))
+    group = np.cumsum(keep_break) - 1
+    starts = iv[keep_break, 0]
+    ends = np.zeros(len(starts))
+    np.maximum.at(ends, group, iv[:, 1])
+    return np.stack([starts, ends], axis=1)
+
+
+def voiced_intervals(pcm: np.ndarray, sr: int, on_db: float = -30.0, off_db: float = -40.0,
+                     min_speech: float = 0.08, min_silence: float = 0.3, pad: float = 0.05,
+                     frame_ms: float = 10.0, floor_db: float = FLOOR_DB) -> np.ndarray:
+    """
+    発話区間を shape (n, 2) の秒配列で返す。
+    on_db / off_db は 95 パーセンタイルのフレームエネルギーからの相対値（負の dB）。
+    開始しきい値は floor_db（dBFS）、終了しきい値は floor_db + (off_db - on_db) を下回らない。
+    min_silence 未満の無音は橋渡しし、min_speech 未満の発話は捨て、最後に pad 秒ずつ広げる。
+    """
+    energy = frame_energy_db(pcm, sr, frame_ms)
+    if not energy.size:
+        return np.zeros((0, 2))
+    ref = float(np.percentile(energy, 95))
+    hop_sec = max(1, int(sr * frame_ms / 1000.0)) / sr
+    on = max(ref + on_db, floor_db)
+    off = max(ref + off_db, floor_db + (off_db - on_db))
+    iv = mask_to_intervals(hysteresis(energy, on, off), hop_sec)
+    iv = merge_close(iv, min_silence)
+    iv = iv[(iv[:, 1] - iv[:, 0]) >= min_speech]
+    if not len(iv):
+        return iv
+    total = len(pcm) / sr
+    iv[:, 0] = np.maximum(iv[:, 0] - pad, 0.0)
+    iv[:, 1] = np.minimum(iv[:, 1] + pad, total)
+    return merge_close(iv, 0.0)
+
+
+def condense(pcm: np.ndarray, sr: int, intervals: np.ndarray,
+             gap: float = 0.2) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    発話区間だけを gap 秒の無音を挟んで連結する。
+    戻り値 (pcm2, mapping)。mapping は各区間の [連結後の開始秒, 元の開始秒] で、map_times で時刻を戻せる。
+    """
+    gap_n = int(gap * sr)
+    parts = []
+    mapping = np.zeros((len(intervals), 2))
+    pos = 0
+    for k, (t0, t1) in enumerate(intervals):
+        a, b = int(t0 * sr), int(t1 * sr)
+        if k:
+            parts.append(np.zeros(gap_n, dtype=pcm.dtype))
+            pos += gap_n
+        mapping[k] = (pos / sr, t0)
+        parts.append(pcm[a:b])
+        pos += b - a
+    out = np.concatenate(parts) if parts else np.zeros(0, dtype=pcm.dtype)
+    return out, mapping
+
+
+def map_times(t: np.ndarray, mapping: np.ndarray) -> np.ndarray:
+    """condense 後の時刻を元音声の時刻に戻す（区間ごとのオフセットを searchsorted で引く）"""
+    t = np.asarray(t, dtype=np.float64)
+    if not len(mapping):
+        return t
+    k = np.clip(np.searchsorted(mapping[:, 0], t, side="right") - 1, 0, len(mapping) - 1)
+    return t - mapping[k, 0] + mapping[k, 1]
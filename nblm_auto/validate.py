@@ -0,0 +1,208 @@
+# nblm_auto/validate.py
+"""
+`--dry-run` 用の入力チェック。MoviePy / numpy / srt は読まず、ファイルヘッダと正規表現だけで数 ms で終わる。
+- 音声: 存在と長さ（WAV はヘッダ、それ以外は ffprobe があれば）
+- キャラ素材: base / mouth_open / mouth_closed の PNG が揃っているか
+- lipsync JSON: パースできるか、口開き区間があるか、音声の長さに収まるか
+- SRT: キューの数、時刻の前後関係、音声に対するカバー率
+"""
+from __future__ import annotations
+import re
+import subprocess
+import wave
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from .utils import which
+
+CHAR_FILES = ("base.png", "mouth_open.png", "mouth_closed.png")
+PNG_SIG = b"\x89PNG\r\n\x1a\n"
+SRT_TIME = re.compile(
+    r"(\d{2}):(\d{2}):(\d{2})[,.](\d{3})\s*-->\s*(\d{2}):(\d{2}):(\d{2})[,.](\d{3})")
+# 音声末尾からのはみ出しをどこまで許すか（秒）
+END_TOLERANCE = 1.0
+
+
+class ValidationReport:
+    def __init__(self):
+        self.items: List[Tuple[str, str]] = []
+
+    def error(self, msg: str) -> None:
+        self.items.append(("ERROR", msg))
+
+    def warn(self, msg: str) -> None:
+        self.items.append(("WARN", msg))
+
+    def info(self, msg: str) -> None:
+        self.items.append(("OK", msg))
+
+    @property
+    def ok(self) -> bool:
+        return not any(level == "ERROR" for level, _ in self.items)
+
+    def print(self) -> None:
+        for level, msg in self.items:
+            print(f"[DRY-RUN] {level:<5} {msg}")
+        n_err = sum(1 for level, _ in self.items if level == "ERROR")
+        n_warn = sum(1 for level, _ in self.items if level == "WARN")
+        print(f"[DRY-RUN] {'OK' if self.ok else 'NG'}: {n_err} error(s), {n_warn} warning(s)")
+
+
+def audio_duration(path: Path) -> Optional[float]:
+    """音声の長さ（秒）。WAV はヘッダだけ読む。それ以外は ffprobe、無ければ None"""
+    path = Path(path)
+    if path.suffix.lower() == ".wav":
+        try:
+            with wave.open(str(path), "rb") as wf:
+                return wf.getnframes() / float(wf.getframerate())
+        except (wave.Error, EOFError):
+            pass
+    if not which("ffprobe"):
+        return None
+    proc = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", str(path)],
+        capture_output=True, text=True)
+    try:
+        return float(proc.stdout.strip())
+    except ValueError:
+        return None
+
+
+def check_audio(rep: ValidationReport, path: Path) -> Optional[float]:
+    path = Path(path)
+    if not path.is_file():
+        rep.error(f"audio not found: {path}")
+        return None
+    dur = audio_duration(path)
+    if dur is None:
+        rep.warn(f"audio duration unknown (not a WAV and ffprobe unavailable): {path}")
+    elif dur <= 0:
+        rep.error(f"audio is empty: {path}")
+    else:
+        rep.info(f"audio {path} ({dur:.2f}s)")
+    return dur
+
+
+def _png_size(path: Path) -> Optional[Tuple[int, int]]:
+    with open(path, "rb") as f:
+        head = f.read(24)
+    if len(head) < 24 or not head.startswith(PNG_SIG):
+        return None
+    return int.from_bytes(head[16:20], "big"), int.from_bytes(head[20:24], "big")
+
+
+def check_char_dir(rep: ValidationReport, char_dir: Path) -> None:
+    char_dir = Path(char_dir)
+    if not char_dir.is_dir():
+        rep.error(f"character dir not found: {char_dir}")
+        return
+    sizes = []
+    for name in CHAR_FILES:
+        p = char_dir / name
+        if not p.is_file():
+            rep.error(f"missing {name} in {char_dir}")
+            continue
+        size = _png_size(p)
+        if size is None:
+            rep.error(f"not a PNG: {p}")
+        else:
+            sizes.append(f"{name}={size[0]}x{size[1]}")
+    if len(sizes) == len(CHAR_FILES):
+        rep.info(f"character {char_dir} ({', '.join(sizes)})")
+
+
+def check_lipsync(rep: ValidationReport, path: Path, duration: Optional[float]) -> None:
+    from .lipsync_rhubarb import visemes_to_openclose
+    path = Path(path)
+    if not path.is_file():
+        rep.error(f"lipsync JSON not found: {path}")
+        return
+    try:
+        tl = visemes_to_openclose(path)
+    except (ValueError, KeyError, TypeError) as e:
+        rep.error(f"lipsync JSON does not parse: {path} ({e})")
+        return
+    if not tl:
+        rep.warn(f"lipsync JSON has no mouth cues: {path}")
+        return
+    opens = sum(1 for *_, st in tl if st)
+    end = tl[-1][1]
+    if opens == 0:
+        rep.warn(f"lipsync JSON never opens the mouth: {path}")
+    if duration is not None and end > duration + END_TOLERANCE:
+        rep.error(f"lipsync {path} ends at {end:.2f}s, past the audio end ({duration:.2f}s)")
+        return
+    rep.info(f"lipsync {path} ({len(tl)} segs, open={opens}, end={end:.2f}s)")
+
+
+def parse_srt_times(text: str) -> List[Tuple[float, float]]:
+    """SRT の時刻行だけを拾う（Notta の「話者 N」前置きがあっても一致する）"""
+    out = []
+    for m in SRT_TIME.finditer(text):
+        h0, m0, s0, ms0, h1, m1, s1, ms1 = map(int, m.groups())
+        out.append((h0 * 3600 + m0 * 60 + s0 + ms0 / 1000.0, h1 * 3600 + m1 * 60 + s1 + ms1 / 1000.0))
+    return out
+
+
+def check_srt(rep: ValidationReport, path: Path, duration: Optional[float], min_coverage: float = 0.3) -> None:
+    path = Path(path)
+    if not path.is_file():
+        rep.error(f"SRT not found: {path}")
+        return
+    try:
+        cues = parse_srt_times(path.read_text(encoding="utf-8"))
+    except UnicodeDecodeError as e:
+        rep.error(f"SRT is not UTF-8: {path} ({e})")
+        return
+    if not cues:
+        rep.error(f"SRT has no cues: {path}")
+        return
+    inverted = sum(1 for t0, t1 in cues if t1 < t0)
+    unsorted = sum(1 for (a, _), (b, _) in zip(cues, cues[1:]) if b < a)
+    if inverted:
+        rep.error(f"SRT {path}: {inverted} cue(s) end before they start")
+    if unsorted:
+        rep.warn(f"SRT {path}: {unsorted} cue(s) out of order")
+    end = max(t1 for _, t1 in cues)
+    # 重なりを除いたカバー区間の合計
+    covered, cur0, cur1 = 0.0, None, None
+    for t0, t1 in sorted(cues):
+        if cur1 is None or t0 > cur1:
+            if cur1 is not None:
+                covered += cur1 - cur0
+            cur0, cur1 = t0, t1
+        else:
+            cur1 = max(cur1, t1)
+    covered += cur1 - cur0
+    if duration:
+        if end > duration + END_TOLERANCE:
+            rep.error(f"SRT {path} ends at {end:.2f}s, past the audio end ({duration:.2f}s) — wrong audio?")
+            return
+        cov = covered / duration
+        if cov < min_coverage:
+            rep.warn(f"SRT {path} covers only {cov:.0%} of the audio")
+        rep.info(f"SRT {path} ({len(cues)} cues, end={end:.2f}s, coverage={cov:.0%})")
+    else:
+        rep.info(f"SRT {path} ({len(cues)} cues, end={end:.2f}s)")
+
+
+def check_binary(rep: ValidationReport, *names: str) -> None:
+    found = next((which(n) for n in names if which(n)), None)
+    if found:
+        rep.info(f"{' / '.join(names)}: {found}")
+    else:
+        rep.error(f"{' / '.join(names)} not found on PATH")
+
+
+def check_backend(rep: ValidationReport, name: str) -> None:
+    """文字起こしバックエンドが読み込めるか（whisper はモジュールを import せず find_spec だけ見る）"""
+    from importlib.util import find_spec
+    if name == "whisper":
+        if find_spec("whisper") is None:
+            rep.error("backend whisper: openai-whisper is not installed (pip install openai-whisper, or use whisper-cli)")
+        else:
+            rep.info("backend whisper: openai-whisper importable")
+    elif name == "whisper-cli":
+        check_binary(rep, "whisper")
+    elif name != "stub":
+        rep.error(f"unknown backend: {name} (whisper / whisper-cli / stub)")
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+タグ付きテキスト（[A]/[B]）を同梱の擬似 VOICEVOX エンジンで合成し、
+逐次合成と /multi_synthesis バッチ合成のスループットを比較する。
+
+  python tools/bench_voicevox_batch.py -i data/transcripts/xxx_tagged.txt --latency-ms 40
+"""
+import argparse, re, sys, tempfile, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from nblm_auto.fake_voicevox import serve_in_thread
+from nblm_auto.tts_voicevox import voicevox_tts_segments
+
+TAG_LINE = re.compile(r"^\s*\[(A|B)\]\s*(.+)$")
+
+def load_tagged(path, speakers):
+    segs = []
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        m = TAG_LINE.match(line)
+        if m:
+            segs.append({"who": m.group(1), "text": m.group(2), "speaker_id": speakers[m.group(1)]})
+    return segs
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark sequential vs batched VOICEVOX synthesis on the fake engine")
+    ap.add_argument("--input", "-i", required=True, help="[A]/[B] tagged text")
+    ap.add_argument("--latency-ms", type=float, default=40.0)
+    ap.add_argument("--batch-sizes", default="1,4,8,16")
+    ap.add_argument("--limit", type=int, default=40, help="先頭から何セグメント使うか")
+    args = ap.parse_args()
+
+    segs = load_tagged(args.input, {"A": 2, "B": 13})[: args.limit]
+    httpd, url = serve_in_thread(latency_ms=args.latency_ms)
+    try:
+        with tempfile.TemporaryDirectory() as td:
+            td = Path(td)
+            for bs in [int(x) for x in args.batch_sizes.split(",")]:
+                t0 = time.perf_counter()
+                *_, timings = voicevox_tts_segments(
+                    segs, engine_url=url, batch_size=bs, stream=True,
+                    out_mix_wav=td / "mix.wav", out_A_wav=td / "A.wav", out_B_wav=td / "B.wav",
+                )
+                dt = time.perf_counter() - t0
+                print(f"batch_size={bs:>3}  chunks={len(timings):>4}  {dt:7.2f}s  ({len(timings)/dt:6.1f} chunks/s)")
+    finally:
+        httpd.shutdown()
+
+if __name__ == "__main__":
+    main()
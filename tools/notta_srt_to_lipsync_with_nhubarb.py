@@ -1,71 +1,31 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import argparse, json, os, re, shutil, subprocess, tempfile
+import argparse, json, os, shutil, subprocess, sys, tempfile
 from pathlib import Path
 
-NOTTA_LINE = re.compile(
-    r"^\s*話者\s*(\d+)\s+(\d{2}:\d{2}:\d{2},\d{3})\s*-->\s*(\d{2}:\d{2}:\d{2},\d{3})\s*$"
-)
-
-def to_ms(t):
-    h, m, s_ms = t.split(":")
-    s, ms = s_ms.split(",")
-    return (int(h)*3600 + int(m)*60 + int(s))*1000 + int(ms)
-
-def parse_notta_srt(path):
-    txt = Path(path).read_text(encoding="utf-8")
-    lines = txt.splitlines()
-    i, n = 0, len(lines)
-    segs = []
-    while i < n:
-        # 数字だけのインデックス行をスキップ
-        if re.match(r"^\s*\d+\s*$", lines[i]):
-            i += 1
-            if i >= n: break
-        m = NOTTA_LINE.match(lines[i])
-        if not m:
-            i += 1
-            continue
-        spk, start, end = m.group(1), m.group(2), m.group(3)
-        i += 1
-        buf = []
-        while i < n and lines[i].strip() != "":
-            buf.append(lines[i].strip())
-            i += 1
-        # 空行スキップ
-        while i < n and lines[i].strip() == "":
-            i += 1
-        text = " ".join(buf).strip()
-        if text:
-            segs.append({
-                "speaker": spk,
-                "start_ms": to_ms(start),
-                "end_ms": to_ms(end),
-                "text": text
-            })
-    return segs
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from nblm_auto.audio_cache import decoded, write_wav
+from nblm_auto.speaker_segments import parse_notta_srt, parse_speaker_map
+from nblm_auto.utils import run
+from nblm_auto.vad import voiced_intervals
 
 def which(cmd):
     p = shutil.which(cmd)
     return p if p else None
 
-def run(cmd):
-    subprocess.run(cmd, check=True)
-
-def slice_wav(src_audio, start_ms, end_ms, dst_wav):
-    # ffmpegで区間切り出し（-ss は入力の前に置くと高速）
-    ss = f"{start_ms/1000:.3f}"
-    to = f"{end_ms/1000:.3f}"
-    run([
-        "ffmpeg","-v","error",
-        "-ss", ss, "-to", to, "-i", src_audio,
-        "-ac","1","-ar","16000","-vn","-y", dst_wav
-    ])
+def voiced_view(pcm, sr=16000):
+    # VAD で前後の無音を削ったビューと、削った先頭の秒数を返す（発話が無ければ None）
+    iv = voiced_intervals(pcm, sr)
+    if not len(iv):
+        return None
+    a, b = int(iv[0, 0] * sr), int(iv[-1, 1] * sr)
+    return pcm[a:b], float(iv[0, 0])
 
-def call_rhubarb(wav_path, out_json, bin_name):
+def call_rhubarb(wav_path, out_json, bin_name, timeout=None):
     # 代表的な呼び出し：フォーマットJSON、静音トリミング弱め、出力ファイル指定
     # （nhubarb / rhubarb どちらでも同じ引数で動く想定）
-    run([bin_name, "-f", "json", wav_path, "-o", out_json])
+    run([bin_name, "-f", "json", wav_path, "-o", out_json], label="rhubarb", echo=False,
+        timeout=timeout)
 
 def merge_with_offset(mouth_json_path, offset_ms):
     data = json.loads(Path(mouth_json_path).read_text(encoding="utf-8"))
@@ -84,21 +44,23 @@ def merge_with_offset(mouth_json_path, offset_ms):
 
 def main():
     ap = argparse.ArgumentParser(
-        description="Use original audio + Notta SRT to build lipsync JSON per speaker (A/B) via (n)rhubarb.")
+        description="Use original audio + Notta SRT to build lipsync JSON per speaker (A/B/...) via (n)rhubarb.")
     ap.add_argument("--audio", required=True, help="Original narration audio (wav/m4a/mp3...)")
     ap.add_argument("--srt", required=True, help="Notta SRT with '話者 1/2' lines")
     ap.add_argument("--outdir", default="data/lipsync", help="Output dir for lipsync JSONs")
     ap.add_argument("--map", default="1=A,2=B", help="Mapping like '1=A,2=B' (A=charA, B=charB)")
+    ap.add_argument("--labels", default="A,B", help="Characters to write (charX.json per label), e.g. 'A,B,C'")
     ap.add_argument("--min-dur-ms", type=int, default=220, help="Skip too-short segments (default: 220ms)")
+    ap.add_argument("--vad", action="store_true", help="Trim leading/trailing silence per segment (skip silent ones) before rhubarb")
+    ap.add_argument("--rhubarb-timeout", type=float, default=None, help="Kill rhubarb after N seconds per segment (segment is skipped)")
     args = ap.parse_args()
 
     segs = parse_notta_srt(args.srt)
-    m = {}
-    for kv in args.map.split(","):
-        k, v = kv.split("=")
-        m[k.strip()] = v.strip().upper()
-    if not all(v in {"A","B"} for v in m.values()):
-        raise SystemExit("--map は A/B に割り当ててください（例: 1=A,2=B）")
+    labels = [x.strip().upper() for x in args.labels.split(",") if x.strip()]
+    try:
+        m = parse_speaker_map(args.map, labels)
+    except ValueError as e:
+        raise SystemExit(str(e))
 
     rhubarb_bin = which("nhubarb") or which("rhubarb")
     if not rhubarb_bin:
@@ -107,7 +69,9 @@ def main():
     outdir = Path(args.outdir)
     outdir.mkdir(parents=True, exist_ok=True)
 
-    charA, charB = [], []
+    # 元音声は1回だけ 16kHz モノラルにデコード（キャッシュ済みなら memmap を開くだけ）し、区間はビューで切る
+    audio = decoded(Path(args.audio), 16000)
+    cues_by = {lab: [] for lab in labels}
     with tempfile.TemporaryDirectory() as td:
         td = Path(td)
         for idx, e in enumerate(segs, 1):
@@ -115,20 +79,26 @@ def main():
                 continue
             if (e["end_ms"] - e["start_ms"]) < args.min_dur_ms:
                 continue
-            part = "A" if m.get(e["speaker"],"A") == "A" else "B"
+            part = m.get(e["speaker"], labels[0])
             wav = td / f"seg_{idx:05d}.wav"
             js  = td / f"seg_{idx:05d}.json"
-            slice_wav(args.audio, e["start_ms"], e["end_ms"], str(wav))
+            pcm = audio.slice(e["start_ms"] / 1000, e["end_ms"] / 1000)
+            lead_ms = 0
+            if args.vad:
+                trimmed = voiced_view(pcm)
+                if trimmed is None:
+                    # 区間内に発話が無い → rhubarb を呼ばない
+                    continue
+                pcm, lead = trimmed
+                lead_ms = int(round(lead * 1000))
+            write_wav(wav, pcm, audio.sr)
             try:
-                call_rhubarb(str(wav), str(js), rhubarb_bin)
-            except subprocess.CalledProcessError:
-                # 音が極端に小さい/無音で失敗時はスキップ
+                call_rhubarb(str(wav), str(js), rhubarb_bin, timeout=args.rhubarb_timeout)
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
+                # 音が極端に小さい/無音で失敗・タイムアウト時はスキップ
                 continue
-            cues = merge_with_offset(str(js), e["start_ms"])
-            if part == "A":
-                charA.extend(cues)
-            else:
-                charB.extend(cues)
+            cues = merge_with_offset(str(js), e["start_ms"] + lead_ms)
+            cues_by[part].extend(cues)
 
     def dump(name, cues):
         payload = {
@@ -143,8 +113,8 @@ def main():
         Path(outdir / name).write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
         print(f"Wrote {outdir/name}  (cues: {len(cues)})")
 
-    dump("charA.json", charA)
-    dump("charB.json", charB)
+    for lab in labels:
+        dump(f"char{lab}.json", cues_by[lab])
 
 if __name__ == "__main__":
     main()